@@ -0,0 +1,16 @@
+"""Benchmarks of the time to import the package and to load its namespace and classes, each in a new interpreter."""
+
+
+class ImportSuite:
+    """Import the package in a new Python interpreter."""
+
+    timeout = 120
+
+    def timeraw_import(self):
+        return "import ndx_optogenetics"
+
+    def timeraw_import_and_load(self):
+        return "import ndx_optogenetics; ndx_optogenetics.load()"
+
+    def timeraw_import_class(self):
+        return "from ndx_optogenetics import OptogeneticPulsesTable"
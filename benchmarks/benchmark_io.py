@@ -0,0 +1,112 @@
+"""Benchmarks of the effect of the storage options of `ndx_optogenetics.io` on the size of a file and read times."""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from pynwb import NWBHDF5IO
+
+from ndx_optogenetics.io import configure_io, configure_tick_storage
+
+from .common import make_nwbfile, make_pulses_table
+
+
+def _io_class(backend):
+    if backend == "hdf5":
+        return NWBHDF5IO
+    from hdmf_zarr import NWBZarrIO
+
+    return NWBZarrIO
+
+
+def _size_on_disk(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class ConfigureIOSuite:
+    """Write a pulses table with and without `configure_io` and read the pulses in a 10-s window from it."""
+
+    params = (["hdf5", "zarr"], [False, True], [10**6])
+    param_names = ["backend", "configure_io", "num_pulses"]
+    timeout = 600
+
+    def setup(self, backend, configured, num_pulses):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "pulses.nwb" if backend == "hdf5" else "pulses.nwb.zarr")
+        nwbfile, sites_table = make_nwbfile()
+        pulses_table = make_pulses_table(sites_table, num_pulses)
+        if configured:
+            configure_io(pulses_table, backend=backend)
+        nwbfile.add_time_intervals(pulses_table)
+        with _io_class(backend)(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+    def teardown(self, backend, configured, num_pulses):
+        shutil.rmtree(self.tmpdir)
+
+    def track_file_size(self, backend, configured, num_pulses):
+        return _size_on_disk(self.path)
+
+    track_file_size.unit = "bytes"
+
+    def time_read_time_range(self, backend, configured, num_pulses):
+        with _io_class(backend)(self.path, mode="r") as io:
+            pulses_table = io.read().intervals["optogenetic_pulses"]
+            start_time = pulses_table.start_time.data
+            t0 = start_time[num_pulses // 2]
+            # find the rows in [t0, t0 + 10 s] by bisecting the sorted start times without reading them all
+            lo, hi = num_pulses // 2, num_pulses
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if start_time[mid] <= t0 + 10.0:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            rows = slice(num_pulses // 2, lo)
+            for column in ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm"):
+                np.asarray(getattr(pulses_table, column).data[rows])
+            np.asarray(pulses_table.optogenetic_sites_index.data[rows])
+
+
+class TimeEncodingSuite:
+    """Write the start and stop times of a pulses table as float64 or as ticks and read them from the file."""
+
+    params = ([None, 1e-6], [10**6])
+    param_names = ["timebase", "num_pulses"]
+    timeout = 600
+
+    def setup(self, timebase, num_pulses):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "pulses.nwb")
+        nwbfile, sites_table = make_nwbfile()
+        pulses_table = make_pulses_table(sites_table, num_pulses)
+        if timebase is not None:
+            configure_tick_storage(pulses_table, timebase=timebase, fallback=False)
+        configure_io(pulses_table)
+        nwbfile.add_time_intervals(pulses_table)
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+    def teardown(self, timebase, num_pulses):
+        shutil.rmtree(self.tmpdir)
+
+    def track_file_size(self, timebase, num_pulses):
+        return _size_on_disk(self.path)
+
+    track_file_size.unit = "bytes"
+
+    def time_read_times(self, timebase, num_pulses):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            pulses_table = io.read().intervals["optogenetic_pulses"]
+            np.asarray(pulses_table.start_time.data[:])
+            np.asarray(pulses_table.stop_time.data[:])
+
+    def time_read_time_range(self, timebase, num_pulses):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            pulses_table = io.read().intervals["optogenetic_pulses"]
+            rows = slice(num_pulses // 2, num_pulses // 2 + 200)
+            np.asarray(pulses_table.start_time.data[rows])
+            np.asarray(pulses_table.stop_time.data[rows])
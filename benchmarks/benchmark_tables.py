@@ -0,0 +1,268 @@
+"""Benchmarks of building, writing, reading, querying, and converting optogenetics tables of increasing size."""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from pynwb import NWBHDF5IO
+
+from ndx_optogenetics import OptogeneticEpochsTable, OptogeneticPulsesTable
+
+from .common import make_nwbfile, make_pulse_arrays, make_pulses_table
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+# methods that process one row at a time take minutes on larger tables, so they are benchmarked on fewer sizes
+ROW_BY_ROW_SIZES = [10**3, 10**4]
+
+
+def _io_class(backend):
+    if backend == "hdf5":
+        return NWBHDF5IO
+    from hdmf_zarr import NWBZarrIO
+
+    return NWBZarrIO
+
+
+def _make_epochs_table(sites_table, num_epochs):
+    """Create an OptogeneticEpochsTable with `num_epochs` 10-s epochs of 10 trains of 20 pulses each."""
+    epochs_table = OptogeneticEpochsTable(
+        name="optogenetic_epochs",
+        description="benchmark epochs",
+        target_tables={"optogenetic_sites": sites_table},
+    )
+    for i in range(num_epochs):
+        epochs_table.add_row(
+            start_time=i * 10.0,
+            stop_time=i * 10.0 + 10.0,
+            stimulation_on=True,
+            pulse_length_in_ms=10.0,
+            period_in_ms=50.0,
+            number_pulses_per_pulse_train=20,
+            number_trains=10,
+            intertrain_interval_in_ms=1000.0,
+            power_in_mW=5.0,
+            wavelength_in_nm=473.0,
+            optogenetic_sites=[i % len(sites_table)],
+        )
+    return epochs_table
+
+
+class BuildPulsesSuite:
+    """Add pulses to an OptogeneticPulsesTable in bulk."""
+
+    params = [SIZES]
+    param_names = ["num_pulses"]
+    timeout = 600
+
+    def setup(self, num_pulses):
+        self.nwbfile, self.sites_table = make_nwbfile()
+
+    def time_add_pulses(self, num_pulses):
+        make_pulses_table(self.sites_table, num_pulses)
+
+    def peakmem_add_pulses(self, num_pulses):
+        make_pulses_table(self.sites_table, num_pulses)
+
+
+class BuildPulsesRowByRowSuite:
+    """Add pulses to an OptogeneticPulsesTable one row at a time, for comparison with BuildPulsesSuite."""
+
+    params = [ROW_BY_ROW_SIZES + [10**5]]
+    param_names = ["num_pulses"]
+    timeout = 600
+
+    def setup(self, num_pulses):
+        self.nwbfile, self.sites_table = make_nwbfile()
+        self.arrays = make_pulse_arrays(num_pulses)
+
+    def time_add_row(self, num_pulses):
+        pulses_table = make_pulses_table(self.sites_table, 0)
+        for i in range(num_pulses):
+            pulses_table.add_row(
+                start_time=self.arrays["start_time"][i],
+                stop_time=self.arrays["stop_time"][i],
+                power_in_mW=self.arrays["power_in_mW"][i],
+                wavelength_in_nm=self.arrays["wavelength_in_nm"][i],
+                optogenetic_sites=[self.arrays["optogenetic_sites"][i]],
+            )
+
+
+class BuildEpochsSuite:
+    """Add epochs to an OptogeneticEpochsTable and expand them into pulses."""
+
+    params = [[10**1, 10**2, 10**3, 10**4]]
+    param_names = ["num_epochs"]
+    timeout = 600
+
+    def setup(self, num_epochs):
+        self.nwbfile, self.sites_table = make_nwbfile()
+        self.epochs_table = _make_epochs_table(self.sites_table, num_epochs)
+
+    def time_add_row(self, num_epochs):
+        _make_epochs_table(self.sites_table, num_epochs)
+
+    def time_to_pulses_table(self, num_epochs):
+        self.epochs_table.to_pulses_table()
+
+    def peakmem_to_pulses_table(self, num_epochs):
+        self.epochs_table.to_pulses_table()
+
+
+class WriteReadSuite:
+    """Write a pulses table to a file and read all of its columns back."""
+
+    params = (["hdf5", "zarr"], SIZES)
+    param_names = ["backend", "num_pulses"]
+    timeout = 600
+    # an NWBFile can be written only once, so setup creates a new one before each call
+    number = 1
+    warmup_time = 0
+
+    def setup(self, backend, num_pulses):
+        self.tmpdir = tempfile.mkdtemp()
+        extension = ".nwb" if backend == "hdf5" else ".nwb.zarr"
+        self.path = os.path.join(self.tmpdir, "write" + extension)
+        self.read_path = os.path.join(self.tmpdir, "read" + extension)
+        self.nwbfile = self._make_nwbfile(num_pulses)
+        with _io_class(backend)(self.read_path, mode="w") as io:
+            io.write(self._make_nwbfile(num_pulses))
+
+    @staticmethod
+    def _make_nwbfile(num_pulses):
+        nwbfile, sites_table = make_nwbfile()
+        nwbfile.add_time_intervals(make_pulses_table(sites_table, num_pulses))
+        return nwbfile
+
+    def teardown(self, backend, num_pulses):
+        shutil.rmtree(self.tmpdir)
+
+    def time_write(self, backend, num_pulses):
+        with _io_class(backend)(self.path, mode="w") as io:
+            io.write(self.nwbfile)
+
+    def peakmem_write(self, backend, num_pulses):
+        with _io_class(backend)(self.path, mode="w") as io:
+            io.write(self.nwbfile)
+
+    def time_read(self, backend, num_pulses):
+        with _io_class(backend)(self.read_path, mode="r") as io:
+            pulses_table = io.read().intervals["optogenetic_pulses"]
+            for column in (pulses_table.id, *pulses_table.columns):
+                np.asarray(column.data[:])
+
+    def peakmem_read(self, backend, num_pulses):
+        self.time_read(backend, num_pulses)
+
+
+class ReadQueryConvertSuite:
+    """Convert and query a pulses table read from an HDF5 file."""
+
+    params = [SIZES]
+    param_names = ["num_pulses"]
+    timeout = 600
+
+    def setup(self, num_pulses):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, "pulses.nwb")
+        nwbfile, sites_table = make_nwbfile()
+        nwbfile.add_time_intervals(make_pulses_table(sites_table, num_pulses))
+        with NWBHDF5IO(path, mode="w") as io:
+            io.write(nwbfile)
+        self.io = NWBHDF5IO(path, mode="r")
+        self.pulses_table = self.io.read().intervals["optogenetic_pulses"]
+        self.times = np.random.default_rng(0).uniform(0, num_pulses * 0.05, 10**6)
+
+    def teardown(self, num_pulses):
+        self.io.close()
+        shutil.rmtree(self.tmpdir)
+
+    def time_to_columnar_dataframe(self, num_pulses):
+        self.pulses_table.to_columnar_dataframe()
+
+    def peakmem_to_columnar_dataframe(self, num_pulses):
+        self.pulses_table.to_columnar_dataframe()
+
+    def time_resolve_site_column(self, num_pulses):
+        self.pulses_table.resolve_site_column("excitation_source")
+
+    def time_query_time(self, num_pulses):
+        for t0 in self.times[:1000]:
+            self.pulses_table.query_time(t0, t0 + 1.0)
+
+    def time_is_stimulating(self, num_pulses):
+        self.pulses_table.is_stimulating(self.times)
+
+
+class ReadConvertRowByRowSuite(ReadQueryConvertSuite):
+    """Convert a pulses table read from an HDF5 file with the generic methods of DynamicTable, for comparison."""
+
+    params = [ROW_BY_ROW_SIZES]
+
+    def time_to_dataframe(self, num_pulses):
+        self.pulses_table.to_dataframe()
+
+    def peakmem_to_dataframe(self, num_pulses):
+        self.pulses_table.to_dataframe()
+
+    def time_resolve_sites_per_row(self, num_pulses):
+        for i in range(num_pulses):
+            self.pulses_table[i, "optogenetic_sites"]
+
+
+class FromPulsesSuite:
+    """Fit the epochs of an OptogeneticEpochsTable to the pulses of a pulses table with timing jitter."""
+
+    params = [SIZES]
+    param_names = ["num_pulses"]
+    timeout = 600
+
+    def setup(self, num_pulses):
+        _, sites_table = make_nwbfile()
+        self.pulses_table = make_pulses_table(sites_table, num_pulses)
+
+    def time_from_pulses(self, num_pulses):
+        OptogeneticEpochsTable.from_pulses(self.pulses_table)
+
+    def peakmem_from_pulses(self, num_pulses):
+        OptogeneticEpochsTable.from_pulses(self.pulses_table)
+
+
+class FromTTLSuite:
+    """Detect the pulses in a memory-mapped 30-kHz TTL signal and fit epochs to them."""
+
+    params = ([10**7, 10**8, 10**9], [1, 4])
+    param_names = ["num_samples", "num_threads"]
+    timeout = 1200
+
+    def setup(self, num_samples, num_threads):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "ttl.bin")
+        # 10-ms pulses at 20 Hz, written in chunks of whole periods of 1500 samples
+        signal = np.memmap(self.path, dtype=np.uint8, mode="w+", shape=(num_samples,))
+        chunk_length = 1500 * 10**4
+        chunk = (np.arange(chunk_length) % 1500 < 300).astype(np.uint8)
+        for start in range(0, num_samples, chunk_length):
+            signal[start : start + chunk_length] = chunk[: num_samples - start]
+        signal.flush()
+        del signal
+        _, self.sites_table = make_nwbfile()
+
+    def teardown(self, num_samples, num_threads):
+        shutil.rmtree(self.tmpdir)
+
+    def time_from_ttl(self, num_samples, num_threads):
+        OptogeneticPulsesTable.from_ttl(
+            signal=np.memmap(self.path, dtype=np.uint8, mode="r"),
+            rate=30000.0,
+            optogenetic_sites_table=self.sites_table,
+            sites=0,
+            power_in_mW=5.0,
+            wavelength_in_nm=473.0,
+            num_threads=num_threads,
+            fit_epochs=True,
+        )
+
+    def peakmem_from_ttl(self, num_samples, num_threads):
+        self.time_from_ttl(num_samples, num_threads)
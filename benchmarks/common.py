@@ -0,0 +1,69 @@
+"""Helpers to build NWB files with optogenetics tables of a given size for the benchmarks."""
+
+from datetime import datetime, timezone
+
+import numpy as np
+from pynwb import NWBFile
+from ndx_ophys_devices import Effector, ExcitationSource, ExcitationSourceModel
+
+from ndx_optogenetics import (
+    OptogeneticEffectors,
+    OptogeneticExperimentMetadata,
+    OptogeneticPulsesTable,
+    OptogeneticSitesTable,
+)
+
+
+def make_nwbfile(num_sites=2):
+    """Create an NWBFile with an OptogeneticSitesTable with `num_sites` rows."""
+    nwbfile = NWBFile(
+        session_description="benchmark",
+        identifier="benchmark",
+        session_start_time=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+    excitation_source_model = ExcitationSourceModel(
+        name="laser model",
+        manufacturer="Omicron",
+        source_type="laser",
+        excitation_mode="one-photon",
+    )
+    excitation_source = ExcitationSource(name="laser", model=excitation_source_model)
+    nwbfile.add_device_model(excitation_source_model)
+    nwbfile.add_device(excitation_source)
+
+    effectors = [Effector(name="effector%d" % i, label="hChR2-EYFP") for i in range(num_sites)]
+    sites_table = OptogeneticSitesTable(description="optogenetic stimulation sites")
+    for effector in effectors:
+        sites_table.add_row(excitation_source=excitation_source, effector=effector)
+    nwbfile.add_lab_meta_data(
+        OptogeneticExperimentMetadata(
+            optogenetic_sites_table=sites_table,
+            optogenetic_effectors=OptogeneticEffectors(effectors=effectors),
+            stimulation_software="benchmark",
+        )
+    )
+    return nwbfile, sites_table
+
+
+def make_pulse_arrays(num_pulses, num_sites=2, seed=0):
+    """Create the arrays of `num_pulses` 10-ms pulses at 20 Hz with jitter, cycling through a few powers and sites."""
+    rng = np.random.default_rng(seed)
+    start_time = np.arange(num_pulses) * 0.05 + rng.uniform(0, 0.001, num_pulses)
+    return dict(
+        start_time=start_time,
+        stop_time=start_time + 0.01,
+        power_in_mW=np.array([5.0, 10.0, 20.0])[np.arange(num_pulses) // 100 % 3],
+        wavelength_in_nm=np.full(num_pulses, 473.0),
+        optogenetic_sites=np.arange(num_pulses) % num_sites,
+    )
+
+
+def make_pulses_table(sites_table, num_pulses):
+    """Create an OptogeneticPulsesTable with `num_pulses` pulses, added in bulk."""
+    pulses_table = OptogeneticPulsesTable(
+        name="optogenetic_pulses",
+        description="benchmark pulses",
+        target_tables={"optogenetic_sites": sites_table},
+    )
+    pulses_table.add_pulses(**make_pulse_arrays(num_pulses, num_sites=len(sites_table)))
+    return pulses_table
@@ -1,32 +1,29 @@
+import threading
 from importlib.resources import files
-from pynwb import load_namespaces, get_class
 
-# Get path to the namespace.yaml file with the expected location when installed not in editable mode
-__location_of_this_file = files(__name__)
-__spec_path = __location_of_this_file / "spec" / "ndx-optogenetics.namespace.yaml"
+# The namespace is loaded and the custom classes are registered on import, so that files read after
+# `import ndx_optogenetics` use the custom classes. The other classes are generated from the spec on first access to
+# any of them, e.g., `from ndx_optogenetics import OpticalFiber` or `ndx_optogenetics.OpticalFiber`, or with `load()`.
 
-# If that path does not exist, we are likely running in editable mode. Use the local path instead
-if not __spec_path.exists():
-    __spec_path = __location_of_this_file.parent.parent.parent / "spec" / "ndx-optogenetics.namespace.yaml"
-
-# Load the namespace
-# ndx-optogenetics depends on ndx-ophys-devices,
-# so importing it here prevents namespace errors when users import this package directly
-import ndx_ophys_devices  # noqa: F401
-
-load_namespaces(str(__spec_path))
-
-ExcitationSourceModel = get_class("ExcitationSourceModel", "ndx-optogenetics")
-ExcitationSource = get_class("ExcitationSource", "ndx-optogenetics")
-OpticalFiberModel = get_class("OpticalFiberModel", "ndx-optogenetics")
-OpticalFiber = get_class("OpticalFiber", "ndx-optogenetics")
-OptogeneticSitesTable = get_class("OptogeneticSitesTable", "ndx-optogenetics")
-OptogeneticViruses = get_class("OptogeneticViruses", "ndx-optogenetics")
-OptogeneticVirusInjections = get_class("OptogeneticVirusInjections", "ndx-optogenetics")
-OptogeneticEffectors = get_class("OptogeneticEffectors", "ndx-optogenetics")
-OptogeneticExperimentMetadata = get_class("OptogeneticExperimentMetadata", "ndx-optogenetics")
+# classes generated from the spec
+_GENERATED_CLASSES = (
+    "ExcitationSourceModel",
+    "ExcitationSource",
+    "OpticalFiberModel",
+    "OpticalFiber",
+    "OptogeneticViruses",
+    "OptogeneticVirusInjections",
+    "OptogeneticEffectors",
+    "OptogeneticExperimentMetadata",
+)
 
-from .optogenetics import OptogeneticEpochsTable, OptogeneticPulsesTable
+# custom classes defined in the `optogenetics` module
+_CUSTOM_CLASSES = (
+    "OptogeneticSitesTable",
+    "OptogeneticEpochsTable",
+    "OptogeneticPulsesTable",
+    "OptogeneticPulsesView",
+)
 
 __all__ = [
     "ExcitationSourceModel",
@@ -40,7 +37,70 @@ __all__ = [
     "OptogeneticExperimentMetadata",
     "OptogeneticEpochsTable",
     "OptogeneticPulsesTable",
+    "OptogeneticPulsesView",
+    "load",
 ]
 
-# Remove these functions/modules from the package
-del load_namespaces, get_class, files, __location_of_this_file, __spec_path
+# loading is reentrant because registering the custom classes loads the namespace
+_lock = threading.RLock()
+_namespace_loaded = False
+_loaded = False
+
+
+def _load_namespace():
+    """Load the ndx-optogenetics namespace once."""
+    global _namespace_loaded
+    with _lock:
+        if _namespace_loaded:
+            return
+        # Get path to the namespace.yaml file with the expected location when installed not in editable mode
+        location_of_this_file = files(__name__)
+        spec_path = location_of_this_file / "spec" / "ndx-optogenetics.namespace.yaml"
+
+        # If that path does not exist, we are likely running in editable mode. Use the local path instead
+        if not spec_path.exists():
+            spec_path = location_of_this_file.parent.parent.parent / "spec" / "ndx-optogenetics.namespace.yaml"
+
+        # Load the namespace
+        # ndx-optogenetics depends on ndx-ophys-devices,
+        # so importing it here prevents namespace errors when users import this package directly
+        import ndx_ophys_devices  # noqa: F401
+        from pynwb import load_namespaces
+
+        load_namespaces(str(spec_path))
+        _namespace_loaded = True
+
+
+def load():
+    """
+    Generate the classes of the ndx-optogenetics namespace that are not custom classes.
+
+    The namespace is loaded and the custom classes are registered on import. The other classes are generated
+    automatically on first access to any of them; this does nothing if it was done before.
+    """
+    global _loaded
+    with _lock:
+        if _loaded:
+            return
+        from pynwb import get_class
+
+        globals().update({name: get_class(name, "ndx-optogenetics") for name in _GENERATED_CLASSES})
+        _loaded = True
+
+
+def __getattr__(name):
+    if name in _GENERATED_CLASSES:
+        load()
+        return globals()[name]
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+# Load the namespace and register the custom classes, which the generated classes, e.g.,
+# OptogeneticExperimentMetadata, use
+from . import optogenetics as _optogenetics  # noqa: E402
+
+globals().update({name: getattr(_optogenetics, name) for name in _CUSTOM_CLASSES})
@@ -0,0 +1,258 @@
+"""Alignment of event times, e.g., spike times or photometry samples, to optogenetic stimulation pulses."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from hdmf.utils import docval, getargs
+
+from .optogenetics import (
+    OptogeneticEpochsTable,
+    OptogeneticPulsesTable,
+    _column_array,
+    _IntervalIndex,
+    _pulses_by_epoch_sites,
+    _take_ragged,
+)
+
+
+class PulseAlignment:
+    """
+    Event times aligned to the onsets of pulses, as a ragged array with one trial per pulse.
+
+    The event times of trial ``i`` relative to the onset of its pulse are
+    ``relative_times[offsets[i - 1]:offsets[i]]`` with ``offsets[-1] = 0``, i.e., ``alignment[i]``, and the indices of
+    these events in the event times that were aligned are ``event_indices[offsets[i - 1]:offsets[i]]``, e.g., to look
+    up the photometry samples at these times. Each trial also has the row of its pulse in the OptogeneticPulsesTable
+    (`pulses`), the onset of the pulse (`onsets`), its optogenetic sites as concatenated rows of the
+    OptogeneticSitesTable (`sites`) with end offsets (`sites_offsets`), and its stimulation conditions (`conditions`,
+    a pandas DataFrame with one row per trial).
+
+    Use `groupby` to split the trials by site or by condition, and `subset` to select trials.
+    """
+
+    def __init__(self, pulses, onsets, relative_times, event_indices, offsets, sites, sites_offsets, conditions):
+        self.pulses = pulses
+        self.onsets = onsets
+        self.relative_times = relative_times
+        self.event_indices = event_indices
+        self.offsets = offsets
+        self.sites = sites
+        self.sites_offsets = sites_offsets
+        self.conditions = conditions
+
+    def __len__(self):
+        return len(self.pulses)
+
+    def __repr__(self):
+        return "%s with %d trials and %d events" % (self.__class__.__name__, len(self), len(self.relative_times))
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("Trial index out of range for %s of length %d" % (self.__class__.__name__, len(self)))
+        i = i % len(self)
+        return self.relative_times[(self.offsets[i - 1] if i else 0) : self.offsets[i]]
+
+    @property
+    def counts(self):
+        """The number of events in each trial."""
+        return np.diff(self.offsets, prepend=0)
+
+    def subset(self, trials):
+        """Return a PulseAlignment with the selected trials, given as an array of trial indices or a boolean mask."""
+        trials = np.arange(len(self))[trials]
+        relative_times, offsets = _take_ragged(self.relative_times, self.offsets, trials)
+        event_indices, _ = _take_ragged(self.event_indices, self.offsets, trials)
+        sites, sites_offsets = _take_ragged(self.sites, self.sites_offsets, trials)
+        return PulseAlignment(
+            self.pulses[trials],
+            self.onsets[trials],
+            relative_times,
+            event_indices,
+            offsets,
+            sites,
+            sites_offsets,
+            self.conditions.iloc[trials].reset_index(drop=True),
+        )
+
+    def groupby(self, by):
+        """
+        Split the trials into groups by site and/or by the columns of `conditions`, e.g., ``["site", "power_in_mW"]``.
+
+        Returns a dict that maps the tuple of the values of `by` of each group to a PulseAlignment with the trials of
+        the group, sorted by key. When grouping by ``"site"``, a pulse that stimulates several sites is a trial of
+        the group of each of its sites.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [key for key in by if key != "site" and key not in self.conditions.columns]
+        if unknown:
+            raise ValueError("cannot group by %s; use 'site' or columns of the conditions" % ", ".join(unknown))
+        if "site" in by:
+            trials = np.repeat(np.arange(len(self)), np.diff(self.sites_offsets, prepend=0))
+            keys = self.conditions.iloc[trials].reset_index(drop=True)
+            keys["site"] = self.sites
+        else:
+            trials = np.arange(len(self))
+            keys = self.conditions
+        groups = keys.groupby(by, sort=True, dropna=False).indices
+        return {key if isinstance(key, tuple) else (key,): self.subset(trials[rows]) for key, rows in groups.items()}
+
+
+def _thread_chunks(n, num_threads):
+    """Split ``range(n)`` into at most `num_threads` contiguous slices."""
+    bounds = np.linspace(0, n, max(1, min(num_threads, n)) + 1).astype(np.int64)
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _align(events, onsets, window, num_threads):
+    """
+    Find the events in ``[onset + window[0], onset + window[1])`` of each onset in the sorted `events`.
+
+    Returns the indices of the events of all onsets, concatenated, their times relative to their onset, and the end
+    offset of the events of each onset. The events of each onset are found with two binary searches, and the
+    concatenated arrays are filled with offset arithmetic, each in `num_threads` threads over contiguous chunks of
+    onsets. NumPy releases the GIL for these operations on large arrays, so the threads run in parallel without
+    copying `events`.
+    """
+    lo = np.empty(len(onsets), dtype=np.int64)
+    hi = np.empty(len(onsets), dtype=np.int64)
+    chunks = _thread_chunks(len(onsets), num_threads)
+
+    def search(chunk):
+        lo[chunk] = np.searchsorted(events, onsets[chunk] + window[0], side="left")
+        hi[chunk] = np.searchsorted(events, onsets[chunk] + window[1], side="left")
+
+    def fill(chunk):
+        start = offsets[chunk.start - 1] if chunk.start else 0
+        stop = offsets[chunk.stop - 1] if chunk.stop else 0
+        chunk_counts = counts[chunk]
+        first = np.repeat(lo[chunk] - (offsets[chunk] - start - chunk_counts), chunk_counts)
+        indices = first + np.arange(stop - start)
+        event_indices[start:stop] = indices
+        relative_times[start:stop] = events[indices] - np.repeat(onsets[chunk], chunk_counts)
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        list(executor.map(search, chunks))
+        counts = hi - lo
+        offsets = np.cumsum(counts)
+        num_events = offsets[-1] if len(offsets) else 0
+        event_indices = np.empty(num_events, dtype=np.int64)
+        relative_times = np.empty(num_events, dtype=np.float64)
+        list(executor.map(fill, chunks))
+    return event_indices, relative_times, offsets
+
+
+def _epoch_conditions(epochs_table, pulses_table, pulses):
+    """
+    Return the row of the epoch with stimulation on that contains the onset of each of the given pulses at one of its
+    sites, or -1, and the stimulation frequency of that epoch.
+
+    The pulses are grouped by their set of sites, and the onsets of each group are looked up with binary searches in the
+    epochs with stimulation on that share a site with the group, so epochs at other sites that overlap a pulse in time
+    are not its epoch.
+    """
+    onsets = _column_array(pulses_table.start_time, dtype=np.float64)
+    start_time = _column_array(epochs_table.start_time, dtype=np.float64)
+    stop_time = _column_array(epochs_table.stop_time, dtype=np.float64)
+    epochs = np.full(len(onsets), -1, dtype=np.int64)
+    for rows, epoch_rows in _pulses_by_epoch_sites(pulses_table, epochs_table, epochs_table._stimulation_rows()):
+        index = _IntervalIndex(start_time, stop_time, rows=epoch_rows)
+        if len(index.rows):
+            position = np.searchsorted(index.start_time, onsets[rows], side="right") - 1
+            clipped = np.maximum(position, 0)
+            valid = (position >= 0) & (onsets[rows] < index.stop_time[clipped])
+            epochs[rows[valid]] = index.rows[clipped[valid]]
+    epochs = epochs[pulses]
+    period_in_ms = _column_array(epochs_table.period_in_ms, dtype=np.float64)
+    frequency = np.full(len(epochs), np.nan)
+    with np.errstate(divide="ignore"):
+        frequency[epochs >= 0] = 1000.0 / period_in_ms[epochs[epochs >= 0]]
+    return epochs, frequency
+
+
+@docval(
+    {"name": "pulses_table", "type": OptogeneticPulsesTable, "doc": "the pulses to align the events to"},
+    {
+        "name": "event_times",
+        "type": "array_data",
+        "doc": "times of the events to align, in seconds, e.g., spike times or the timestamps of photometry samples",
+    },
+    {
+        "name": "window",
+        "type": (tuple, list),
+        "doc": "start and end of the window around each pulse onset, in seconds, relative to the onset",
+        "default": (-0.05, 0.1),
+    },
+    {
+        "name": "sites",
+        "type": (int, "array_data"),
+        "doc": "row(s) of the OptogeneticSitesTable. If given, only pulses that stimulate these sites are aligned.",
+        "default": None,
+    },
+    {
+        "name": "epochs_table",
+        "type": OptogeneticEpochsTable,
+        "doc": "the epochs whose conditions to add to the conditions of the pulses that they contain",
+        "default": None,
+    },
+    {"name": "num_threads", "type": int, "doc": "number of threads to align with", "default": 1},
+    returns="the aligned events",
+    rtype=PulseAlignment,
+    is_method=False,
+)
+def align_to_pulses(**kwargs):
+    """
+    Align event times to the onsets (start times) of the pulses of an OptogeneticPulsesTable.
+
+    The events in ``[onset + window[0], onset + window[1])`` of each pulse are found with batched binary searches on
+    the sorted event times, without a loop over pulses, and returned as a ragged array with one trial per pulse.
+    Event times that are not sorted are sorted first; `PulseAlignment.event_indices` refer to the original order.
+    Use `num_threads` greater than 1 to align millions of pulses to very large event arrays on multiple cores.
+
+    The conditions of each trial are the `power_in_mW` and `wavelength_in_nm` of the pulse and, if `epochs_table`
+    is given, the `epoch` row with stimulation on that contains the onset at one of the sites of the pulse (or -1) and
+    the stimulation `frequency_in_Hz` of that epoch (``1000 / period_in_ms``). Group the trials by these conditions or
+    by site with `PulseAlignment.groupby`.
+    """
+    pulses_table, event_times, window, sites, epochs_table, num_threads = getargs(
+        "pulses_table", "event_times", "window", "sites", "epochs_table", "num_threads", kwargs
+    )
+    if len(window) != 2 or window[1] < window[0]:
+        raise ValueError("window must be a (start, end) pair with start <= end, got %s" % (window,))
+    if num_threads < 1:
+        raise ValueError("num_threads must be a positive integer, got %d" % num_threads)
+
+    event_times = np.asarray(event_times, dtype=np.float64)
+    order = None
+    if np.any(event_times[1:] < event_times[:-1]):
+        order = np.argsort(event_times, kind="stable")
+        event_times = event_times[order]
+
+    onsets = _column_array(pulses_table.start_time, dtype=np.float64)
+    pulse_sites = _column_array(pulses_table.optogenetic_sites, dtype=np.int64)
+    sites_offsets = _column_array(pulses_table.optogenetic_sites_index, dtype=np.int64)
+    pulses = np.arange(len(onsets))
+    if sites is not None:
+        # keep only the selected sites of each pulse and the pulses that stimulate any of them
+        keep = np.isin(pulse_sites, np.atleast_1d(sites))
+        pulse_sites = pulse_sites[keep]
+        sites_offsets = np.concatenate(([0], np.cumsum(keep)))[sites_offsets]
+        pulses = np.flatnonzero(np.diff(sites_offsets, prepend=0) > 0)
+        pulse_sites, sites_offsets = _take_ragged(pulse_sites, sites_offsets, pulses)
+    onsets = onsets[pulses]
+
+    conditions = pd.DataFrame(
+        {
+            "power_in_mW": _column_array(pulses_table.power_in_mW, dtype=np.float64)[pulses],
+            "wavelength_in_nm": _column_array(pulses_table.wavelength_in_nm, dtype=np.float64)[pulses],
+        }
+    )
+    if epochs_table is not None:
+        conditions["epoch"], conditions["frequency_in_Hz"] = _epoch_conditions(epochs_table, pulses_table, pulses)
+
+    event_indices, relative_times, offsets = _align(event_times, onsets, window, num_threads)
+    if order is not None:
+        event_indices = order[event_indices]
+    return PulseAlignment(
+        pulses, onsets, relative_times, event_indices, offsets, pulse_sites, sites_offsets, conditions
+    )
@@ -0,0 +1,495 @@
+"""
+Convert many sessions of optogenetic stimulation to NWB files in parallel.
+
+A batch is described by the definitions of the devices, viral vectors, injections, and effectors that are shared by
+all sessions, and by one session spec per output file. Both are plain dicts of JSON-serializable values so that a batch
+can be stored in a JSON file and converted with the ``ndx-optogenetics-convert`` command:
+
+.. code-block:: json
+
+    {
+        "definitions": {
+            "excitation_source_models": [{"name": "laser model", "manufacturer": "Omicron", ...}],
+            "excitation_sources": [{"name": "laser", "model": "laser model", "power_in_W": 0.077}],
+            "optical_fiber_models": [...],
+            "optical_fibers": [{"name": "fiber", "model": "fiber model", "fiber_insertion": {"depth_in_mm": 2.0}}],
+            "viral_vectors": [...],
+            "viral_vector_injections": [{"name": "injection", "viral_vector": "virus", ...}],
+            "effectors": [{"name": "effector", "label": "hChR2-EYFP", "viral_vector_injection": "injection"}]
+        },
+        "sessions": [
+            {
+                "path": "session1.nwb",
+                "session_description": "...",
+                "identifier": "session1",
+                "session_start_time": "2026-01-01T10:00:00+00:00",
+                "stimulation_software": "FSGUI 2.0",
+                "sites": [{"excitation_source": "laser", "optical_fiber": "fiber", "effector": "effector"}],
+                "epochs": [{"start_time": 0.0, "stop_time": 100.0, "stimulation_on": true, ...}],
+                "pulses": "session1_pulses.npz"
+            }
+        ]
+    }
+
+Objects in the definitions refer to each other, and the sites refer to devices and effectors, by name. Only the
+objects that the sites of a session refer to, directly or indirectly, are added to the file of that session. The rows
+of `epochs` are the keyword arguments of `OptogeneticEpochsTable.add_row`, and `pulses` is either a dict of arrays or
+the path to a ``.npz`` file with the keyword arguments of `OptogeneticPulsesTable.add_pulses`. In both,
+`optogenetic_sites` are indices into the `sites` of the session. All other keys of a session spec are passed to
+`NWBFile`.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import numpy as np
+from hdmf.utils import docval, getargs
+from ndx_ophys_devices import (
+    Effector,
+    ExcitationSource,
+    ExcitationSourceModel,
+    FiberInsertion,
+    OpticalFiber,
+    OpticalFiberModel,
+    ViralVector,
+    ViralVectorInjection,
+)
+from pynwb import NWBFile
+
+from . import (
+    OptogeneticEffectors,
+    OptogeneticEpochsTable,
+    OptogeneticExperimentMetadata,
+    OptogeneticPulsesTable,
+    OptogeneticSitesTable,
+    OptogeneticViruses,
+    OptogeneticVirusInjections,
+)
+from .io import configure_io as _configure_io
+
+# the kinds of shared definitions, their class, and the keys that refer to other definitions by name
+_DEFINITION_KINDS = {
+    "excitation_source_models": (ExcitationSourceModel, {}),
+    "excitation_sources": (ExcitationSource, {"model": "excitation_source_models"}),
+    "optical_fiber_models": (OpticalFiberModel, {}),
+    "optical_fibers": (OpticalFiber, {"model": "optical_fiber_models"}),
+    "viral_vectors": (ViralVector, {}),
+    "viral_vector_injections": (ViralVectorInjection, {"viral_vector": "viral_vectors"}),
+    "effectors": (Effector, {"viral_vector_injection": "viral_vector_injections"}),
+}
+
+# the kinds of definitions that the columns of the OptogeneticSitesTable refer to
+_SITE_COLUMN_KINDS = {
+    "excitation_source": "excitation_sources",
+    "optical_fiber": "optical_fibers",
+    "effector": "effectors",
+}
+
+# the keys of a session spec that are not passed to NWBFile
+_SESSION_KEYS = ("path", "stimulation_software", "sites", "epochs", "pulses")
+
+
+class ConversionResult(namedtuple("ConversionResult", ["path", "time_in_s", "error", "traceback"])):
+    """
+    The outcome of converting one session: the path of the output file, the wall time to build and write it in
+    seconds, and the error message and traceback if the conversion failed, or None if it succeeded.
+    """
+
+    __slots__ = ()
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+@docval(
+    {"name": "definitions", "type": dict, "doc": "the definitions of the shared objects, by kind"},
+    is_method=False,
+)
+def parse_definitions(**kwargs):
+    """
+    Check the shared definitions of a batch and index them by kind and name.
+
+    Raises ValueError if a kind is unknown, if two objects of the same kind have the same name, or if an object refers
+    to an object that is not defined, so that these errors are found before any session is converted.
+    """
+    definitions = getargs("definitions", kwargs)
+    unknown = set(definitions) - set(_DEFINITION_KINDS)
+    if unknown:
+        raise ValueError("unknown kinds of definitions: %s" % ", ".join(sorted(unknown)))
+
+    parsed = {kind: dict() for kind in _DEFINITION_KINDS}
+    for kind, specs in definitions.items():
+        for spec in specs:
+            name = spec.get("name")
+            if name is None:
+                raise ValueError("every object in '%s' must have a name" % kind)
+            if name in parsed[kind]:
+                raise ValueError("'%s' is defined more than once in '%s'" % (name, kind))
+            parsed[kind][name] = dict(spec)
+
+    for kind, specs in parsed.items():
+        for name, spec in specs.items():
+            for key, referenced_kind in _DEFINITION_KINDS[kind][1].items():
+                if key in spec and spec[key] not in parsed[referenced_kind]:
+                    raise ValueError(
+                        "'%s' in '%s' refers to %s '%s', which is not defined in '%s'"
+                        % (name, kind, key, spec[key], referenced_kind)
+                    )
+    return parsed
+
+
+class _SessionObjects:
+    """Build the shared objects that one session refers to, each at most once, and add them to its NWBFile."""
+
+    def __init__(self, nwbfile, definitions):
+        self.__nwbfile = nwbfile
+        self.__definitions = definitions
+        self.__objects = {kind: dict() for kind in _DEFINITION_KINDS}
+
+    def get(self, kind, name):
+        objects = self.__objects[kind]
+        if name not in objects:
+            try:
+                spec = dict(self.__definitions[kind][name])
+            except KeyError:
+                raise ValueError("%s '%s' is not defined" % (kind, name)) from None
+            cls, references = _DEFINITION_KINDS[kind]
+            for key, referenced_kind in references.items():
+                if key in spec:
+                    spec[key] = self.get(referenced_kind, spec[key])
+            if kind == "optical_fibers":
+                spec["fiber_insertion"] = FiberInsertion(**spec.get("fiber_insertion", dict()))
+            obj = cls(**spec)
+            if kind.endswith("_models"):
+                self.__nwbfile.add_device_model(obj)
+            elif kind in ("excitation_sources", "optical_fibers"):
+                self.__nwbfile.add_device(obj)
+            objects[name] = obj
+        return objects[name]
+
+    def values(self, kind):
+        return list(self.__objects[kind].values())
+
+
+def _load_pulses(pulses):
+    if isinstance(pulses, (str, os.PathLike)):
+        with np.load(pulses) as f:
+            return {key: f[key] for key in f.files}
+    return dict(pulses)
+
+
+@docval(
+    {"name": "session", "type": dict, "doc": "the spec of the session"},
+    {"name": "definitions", "type": dict, "doc": "the shared definitions returned by `parse_definitions`"},
+    is_method=False,
+)
+def build_nwbfile(**kwargs):
+    """
+    Build the NWBFile of one session with its OptogeneticExperimentMetadata and, if given, its epochs and pulses.
+    """
+    session, definitions = getargs("session", "definitions", kwargs)
+    nwbfile_kwargs = {key: value for key, value in session.items() if key not in _SESSION_KEYS}
+    if isinstance(nwbfile_kwargs.get("session_start_time"), str):
+        nwbfile_kwargs["session_start_time"] = datetime.fromisoformat(
+            nwbfile_kwargs["session_start_time"].replace("Z", "+00:00")
+        )
+    nwbfile = NWBFile(**nwbfile_kwargs)
+
+    objects = _SessionObjects(nwbfile, definitions)
+    sites_table = OptogeneticSitesTable(description="Information about the optogenetic stimulation sites.")
+    for site in session["sites"]:
+        sites_table.add_row(**{column: objects.get(_SITE_COLUMN_KINDS[column], name) for column, name in site.items()})
+
+    viral_vectors = objects.values("viral_vectors")
+    viral_vector_injections = objects.values("viral_vector_injections")
+    nwbfile.add_lab_meta_data(
+        OptogeneticExperimentMetadata(
+            optogenetic_sites_table=sites_table,
+            optogenetic_viruses=OptogeneticViruses(viral_vectors=viral_vectors) if viral_vectors else None,
+            optogenetic_virus_injections=(
+                OptogeneticVirusInjections(viral_vector_injections=viral_vector_injections)
+                if viral_vector_injections
+                else None
+            ),
+            optogenetic_effectors=OptogeneticEffectors(effectors=objects.values("effectors")),
+            stimulation_software=session["stimulation_software"],
+        )
+    )
+
+    if session.get("epochs"):
+        epochs_table = OptogeneticEpochsTable(
+            name="optogenetic_epochs",
+            description="Metadata about optogenetic stimulation parameters per epoch",
+            target_tables={"optogenetic_sites": sites_table},
+        )
+        for epoch in session["epochs"]:
+            epochs_table.add_row(**epoch)
+        nwbfile.add_time_intervals(epochs_table)
+
+    if session.get("pulses") is not None:
+        pulses_table = OptogeneticPulsesTable(
+            name="optogenetic_pulses",
+            description="Metadata about optogenetic stimulation per pulse",
+            target_tables={"optogenetic_sites": sites_table},
+        )
+        pulses_table.add_pulses(**_load_pulses(session["pulses"]))
+        nwbfile.add_time_intervals(pulses_table)
+
+    return nwbfile
+
+
+def _session_path(session, output_dir):
+    """Return the output path of a session, or raise a ValueError if the session has no path."""
+    path = session.get("path")
+    if not isinstance(path, str) or not path.strip():
+        raise ValueError("the session spec has no 'path'")
+    return os.path.join(output_dir, path)
+
+
+def _duplicate_paths(sessions, output_dir):
+    """
+    Return the ConversionResult of each session whose output path resolves to the same file as that of another
+    session, by index. Sessions without a path are left to fail when they are converted.
+    """
+    indices = dict()
+    for i, session in enumerate(sessions):
+        try:
+            path = _session_path(session, output_dir)
+        except ValueError:
+            continue
+        indices.setdefault(os.path.normcase(os.path.realpath(path)), []).append(i)
+    results = dict()
+    for resolved, duplicates in indices.items():
+        if len(duplicates) > 1:
+            for i in duplicates:
+                others = ", ".join(str(j) for j in duplicates if j != i)
+                error = "ValueError: the output path '%s' is also the output path of sessions %s" % (resolved, others)
+                results[i] = ConversionResult(_session_path(sessions[i], output_dir), 0.0, error, None)
+    return results
+
+
+def _convert_session(session, definitions, output_dir, backend, configure):
+    """
+    Build and write the file of one session. Return a ConversionResult instead of raising any error.
+
+    If writing fails, the file is removed only if it was opened for writing by this call, so an existing file at the
+    path of a session that fails before it is written is kept. A partially written Zarr store, a directory, is not
+    removed.
+    """
+    start = time.perf_counter()
+    path = None
+    written = False
+    try:
+        path = _session_path(session, output_dir)
+        nwbfile = build_nwbfile(session, definitions)
+        if configure:
+            for table in nwbfile.intervals.values():
+                _configure_io(table, backend=backend)
+        if backend == "hdf5":
+            from pynwb import NWBHDF5IO as io_class
+        else:
+            from hdmf_zarr import NWBZarrIO as io_class
+        with io_class(path, mode="w") as io:
+            written = True
+            io.write(nwbfile)
+    except Exception as e:
+        # do not leave a partially written file behind
+        if written and os.path.isfile(path):
+            os.remove(path)
+        return ConversionResult(
+            path, time.perf_counter() - start, "%s: %s" % (type(e).__name__, e), traceback.format_exc()
+        )
+    return ConversionResult(path, time.perf_counter() - start, None, None)
+
+
+# the shared definitions, set once in each worker process when the pool starts
+_worker_definitions = None
+
+
+def _init_worker(definitions):
+    global _worker_definitions
+    _worker_definitions = definitions
+
+
+def _convert_session_in_worker(session, output_dir, backend, configure):
+    return _convert_session(session, _worker_definitions, output_dir, backend, configure)
+
+
+@docval(
+    {"name": "sessions", "type": list, "doc": "the specs of the sessions to convert, one per output file"},
+    {"name": "definitions", "type": dict, "doc": "the definitions of the objects shared by all sessions, by kind"},
+    {
+        "name": "max_workers",
+        "type": int,
+        "doc": (
+            "the number of worker processes. The default is the number of CPUs. Use 0 to convert the sessions one "
+            "after the other in this process"
+        ),
+        "default": None,
+    },
+    {
+        "name": "output_dir",
+        "type": str,
+        "doc": "the directory that relative output paths of the sessions are relative to",
+        "default": ".",
+    },
+    {"name": "backend", "type": str, "doc": "the backend to write the files with, 'hdf5' or 'zarr'", "default": "hdf5"},
+    {
+        "name": "configure_io",
+        "type": bool,
+        "doc": "whether to chunk and compress the epochs and pulses tables with `ndx_optogenetics.io.configure_io`",
+        "default": False,
+    },
+    {
+        "name": "callback",
+        "type": Callable,
+        "doc": "function called with the index of the session and its ConversionResult as soon as each session is done",
+        "default": None,
+    },
+    is_method=False,
+)
+def convert_sessions(**kwargs):
+    """
+    Convert many sessions to NWB files in parallel in a pool of worker processes.
+
+    The shared definitions are checked once with `parse_definitions` and sent to each worker process once, when the
+    pool starts, rather than with every session. Each worker builds the objects that a session refers to from these
+    definitions, because objects that belong to one NWBFile cannot be added to another.
+
+    Errors do not stop the batch: the error of a session that fails is recorded in its ConversionResult and the file
+    that was being written for it is removed. Sessions whose output paths resolve to the same file fail before any
+    session is converted, so that no two worker processes write the same file. If a worker process crashes, e.g.,
+    because it runs out of memory, the pool is broken and the sessions that were not finished are converted again,
+    each in its own worker process, so only the session that crashes fails. The file of a session whose worker process
+    crashed may be left partially written.
+
+    Returns the list of the ConversionResult of each session, in the order of `sessions`.
+    """
+    sessions, definitions, max_workers, output_dir, backend, configure, callback = getargs(
+        "sessions", "definitions", "max_workers", "output_dir", "backend", "configure_io", "callback", kwargs
+    )
+    if backend not in ("hdf5", "zarr"):
+        raise ValueError("backend must be 'hdf5' or 'zarr', got '%s'" % backend)
+    if max_workers is not None and max_workers < 0:
+        raise ValueError("max_workers must not be negative, got %d" % max_workers)
+    definitions = parse_definitions(definitions)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = [None] * len(sessions)
+    # sessions that would write the same file at the same time are not converted
+    for i, result in _duplicate_paths(sessions, output_dir).items():
+        results[i] = result
+        if callback is not None:
+            callback(i, result)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if max_workers == 0:
+        for i in pending:
+            results[i] = _convert_session(sessions[i], definitions, output_dir, backend, configure)
+            if callback is not None:
+                callback(i, results[i])
+        return results
+
+    def record(i, future):
+        try:
+            results[i] = future.result()
+        except Exception as e:
+            # the worker process died, e.g., it ran out of memory, or the session could not be sent to it
+            results[i] = _crashed_result(sessions[i], output_dir, e)
+        if callback is not None:
+            callback(i, results[i])
+
+    args = (output_dir, backend, configure)
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(definitions,)) as executor:
+        futures = {executor.submit(_convert_session_in_worker, sessions[i], *args): i for i in pending}
+        for future in as_completed(futures):
+            if isinstance(future.exception(), BrokenProcessPool):
+                # a worker process died and broke the pool, so this session may not have run; retry it in isolation
+                unfinished.append(futures[future])
+            else:
+                record(futures[future], future)
+
+    # run each unfinished session in its own process, so a crash fails only the session that caused it
+    max_workers = max_workers or os.cpu_count() or 1
+    running = {}
+    unfinished.sort(reverse=True)
+    while unfinished or running:
+        while unfinished and len(running) < max_workers:
+            i = unfinished.pop()
+            executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(definitions,))
+            running[executor.submit(_convert_session_in_worker, sessions[i], *args)] = (i, executor)
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, executor = running.pop(future)
+            executor.shutdown()
+            record(i, future)
+    return results
+
+
+def _crashed_result(session, output_dir, error):
+    """Return the ConversionResult of a session whose worker process died."""
+    try:
+        path = _session_path(session, output_dir)
+    except ValueError:
+        path = None
+    return ConversionResult(path, float("nan"), "%s: %s" % (type(error).__name__, error), None)
+
+
+def main(argv=None):
+    """Convert the sessions of a batch file to NWB files in parallel from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="ndx-optogenetics-convert",
+        description=(
+            "Convert the sessions in a JSON batch file with the keys 'definitions' and 'sessions' to NWB files with "
+            "optogenetics metadata, epochs, and pulses."
+        ),
+    )
+    parser.add_argument("batch", help="path to the JSON batch file")
+    parser.add_argument("-j", "--max-workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory that relative output paths are relative to")
+    parser.add_argument("--backend", choices=("hdf5", "zarr"), default="hdf5", help="backend to write the files with")
+    parser.add_argument("--configure-io", action="store_true", help="chunk and compress the epochs and pulses tables")
+    args = parser.parse_args(argv)
+
+    with open(args.batch) as f:
+        batch = json.load(f)
+    sessions = batch["sessions"]
+
+    def report(i, result):
+        if result.succeeded:
+            print("[%d/%d] wrote %s in %.2f s" % (i + 1, len(sessions), result.path, result.time_in_s))
+        else:
+            print("[%d/%d] FAILED %s: %s" % (i + 1, len(sessions), result.path, result.error), file=sys.stderr)
+
+    start = time.perf_counter()
+    results = convert_sessions(
+        sessions=sessions,
+        definitions=batch.get("definitions", dict()),
+        max_workers=args.max_workers,
+        output_dir=args.output_dir,
+        backend=args.backend,
+        configure_io=args.configure_io,
+        callback=report,
+    )
+    num_failed = sum(not result.succeeded for result in results)
+    print(
+        "converted %d of %d sessions in %.2f s" % (len(results) - num_failed, len(results), time.perf_counter() - start)
+    )
+    for result in results:
+        if not result.succeeded and result.traceback is not None:
+            print("\n%s\n%s" % (result.path, result.traceback), file=sys.stderr)
+    return 1 if num_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
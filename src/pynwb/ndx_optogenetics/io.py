@@ -0,0 +1,1365 @@
+"""Utilities for reading and writing optogenetics tables efficiently with the HDF5 and Zarr backends."""
+
+import os
+from collections import deque
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from hdmf.common import DynamicTable
+from hdmf.data_utils import AbstractDataChunkIterator, DataChunk, DataIO
+from hdmf.utils import docval, get_docval, getargs
+
+DEFAULT_TARGET_CHUNK_BYTES = 512 * 1024
+
+
+def _chunk_length(num_rows, itemsize, target_chunk_bytes):
+    """Return the number of rows per chunk so that a chunk of a 1D dataset is about `target_chunk_bytes` large."""
+    return int(max(1, min(num_rows, target_chunk_bytes // itemsize)))
+
+
+def _table_datasets(table):
+    """Return the id and all columns of a DynamicTable, including the VectorIndex of indexed columns."""
+    return [table.id, *table.columns]
+
+
+def _make_data_io(backend, data, chunk_length, compression_level, fill_value=None, row_shape=()):
+    if backend == "hdf5":
+        from hdmf.backends.hdf5 import H5DataIO
+
+        return H5DataIO(
+            data=data,
+            chunks=(chunk_length, *row_shape),
+            maxshape=(None, *row_shape),
+            compression="gzip",
+            compression_opts=compression_level,
+            shuffle=True,
+            fillvalue=fill_value,
+        )
+    try:
+        from hdmf_zarr.utils import ZarrDataIO
+        from numcodecs import Blosc
+    except ImportError as e:
+        raise ImportError("Writing with the 'zarr' backend requires the hdmf-zarr package.") from e
+    return ZarrDataIO(
+        data=data,
+        chunks=[chunk_length, *row_shape],
+        compressor=Blosc(cname="zstd", clevel=compression_level, shuffle=Blosc.SHUFFLE),
+        fillvalue=fill_value,
+    )
+
+
+@docval(
+    {
+        "name": "table",
+        "type": DynamicTable,
+        "doc": "the table whose columns to configure, e.g., OptogeneticPulsesTable",
+    },
+    {"name": "backend", "type": str, "doc": "the backend that the table will be written with", "default": "hdf5"},
+    {
+        "name": "target_chunk_bytes",
+        "type": int,
+        "doc": "the approximate size of one chunk of each column, in bytes",
+        "default": DEFAULT_TARGET_CHUNK_BYTES,
+    },
+    {
+        "name": "compression_level",
+        "type": int,
+        "doc": "the compression level, from 0 to 9 for 'hdf5' (gzip) and from 0 to 9 for 'zarr' (Blosc zstd)",
+        "default": 4,
+    },
+    is_method=False,
+)
+def configure_io(**kwargs):
+    """
+    Configure chunking and compression of all numeric columns of a table for writing.
+
+    The data of the `id`, each column, and each VectorIndex (e.g., `optogenetic_sites_index`) is wrapped in an
+    `H5DataIO` (for `backend="hdf5"`) or `ZarrDataIO` (for `backend="zarr"`) that stores the dataset in 1D chunks of
+    about `target_chunk_bytes` bytes with a byte-shuffle filter and compression. Because the rows of pulses and epochs
+    tables are ordered in time, contiguous chunks of rows correspond to time ranges, so reading a time range only
+    needs to read and decompress the few chunks that cover it. HDF5 datasets are also made resizable so that rows can
+    be appended after writing.
+
+    Call this after all rows have been added to the table, or after the table was set up to be filled from a stream
+    with `OptogeneticPulsesTable.from_batches`, and before writing the file. Columns that are empty, already wrapped
+    in a DataIO, or not numeric (e.g., `tags` and `timeseries`) are left unchanged.
+    """
+    table, backend, target_chunk_bytes, compression_level = getargs(
+        "table", "backend", "target_chunk_bytes", "compression_level", kwargs
+    )
+    if backend not in ("hdf5", "zarr"):
+        raise ValueError("backend must be 'hdf5' or 'zarr', got '%s'" % backend)
+    if target_chunk_bytes < 1:
+        raise ValueError("target_chunk_bytes must be positive, got %d" % target_chunk_bytes)
+
+    for dataset in _table_datasets(table):
+        data = dataset.data
+        if isinstance(data, DataIO):
+            continue
+        if isinstance(data, AbstractDataChunkIterator):
+            # the number of rows of a stream is not known in advance
+            chunk_length = _chunk_length(np.inf, data.dtype.itemsize, target_chunk_bytes)
+            data_io = _make_data_io(backend, data, chunk_length, compression_level)
+            dataset.transform(lambda _, data_io=data_io: data_io)
+            continue
+        if len(data) == 0:
+            continue
+        data = np.asarray(data)
+        if data.ndim != 1 or data.dtype.kind not in "biuf":
+            continue
+        chunk_length = _chunk_length(len(data), data.dtype.itemsize, target_chunk_bytes)
+        data_io = _make_data_io(backend, data, chunk_length, compression_level)
+        dataset.transform(lambda _, data_io=data_io: data_io)
+
+
+# columns of an OptogeneticPulsesTable that can be stored as runs in `compact_columns`, in the order of their codes
+COMPACT_COLUMNS = (
+    "id",
+    "start_time",
+    "stop_time",
+    "power_in_mW",
+    "wavelength_in_nm",
+    "optogenetic_sites",
+    "optogenetic_sites_index",
+)
+
+# code of the column whose runs encode the difference to the values of the start_time column
+_DURATION_COLUMN = COMPACT_COLUMNS.index("stop_time")
+
+# maximum number of passes of `_encode_runs` that split runs whose values are not reproduced exactly
+_MAX_RUN_REFINEMENTS = 4
+
+
+def _decode_runs(first, step, end, rows, dtype):
+    """Compute the values at `rows` of a column stored as runs of values ``first + k * step``."""
+    run = np.searchsorted(end, rows, side="right")
+    return _run_values(first[run], step[run], rows - np.concatenate(([0], end[:-1]))[run], dtype)
+
+
+def _take(data, rows):
+    """Read the values at `rows` of an array or dataset with a single slice."""
+    if isinstance(data, (np.ndarray, _LazyArray)) or len(rows) == 0:
+        return np.asarray(data[rows])
+    lo = rows.min()
+    return np.asarray(data[lo : rows.max() + 1])[rows - lo]
+
+
+def _run_values(first, step, k, dtype):
+    """Compute the values ``first + k * step`` with the arithmetic used to encode them, in the given dtype."""
+    if np.dtype(dtype).kind in "biu":
+        return (first.astype(np.int64) + k * step.astype(np.int64)).astype(dtype)
+    return (first + k * step).astype(dtype)
+
+
+def _same_values(a, b):
+    """Return whether each pair of values is equal, treating NaN as equal to NaN."""
+    equal = a == b
+    if a.dtype.kind == "f":
+        equal |= np.isnan(a) & np.isnan(b)
+    return equal
+
+
+def _run_starts(values, magnitude):
+    """
+    Return the first row of each run of evenly spaced values, allowing for rounding errors of floating-point values
+    of the given magnitude.
+
+    A run that starts at row ``s`` continues until the difference of consecutive values changes, so of consecutive
+    changes only every other one starts a run, which is found without a loop over rows.
+    """
+    diffs = np.diff(values)
+    if values.dtype.kind == "f":
+        # the differences of evenly spaced floating-point values vary by a few units in the last place
+        with np.errstate(invalid="ignore"):
+            tolerance = 8 * np.spacing(np.maximum(np.abs(magnitude[:-2]), np.abs(magnitude[2:])))
+            changed = ~(np.abs(diffs[1:] - diffs[:-1]) <= tolerance)
+        changed &= ~(np.isnan(diffs[1:]) & np.isnan(diffs[:-1]))
+    else:
+        changed = diffs[1:] != diffs[:-1]
+    change = np.concatenate(([-1], np.flatnonzero(changed) + 1))
+    new_cluster = np.diff(change, prepend=-3) != 1
+    position = np.arange(len(change)) - np.flatnonzero(new_cluster)[np.cumsum(new_cluster) - 1]
+    return change[position % 2 == 0] + 1
+
+
+def _round_significant(x, digits):
+    """Round floating-point values to a number of significant decimal digits, e.g., 0.0010000000000037 to 0.001."""
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        decimals = np.clip(digits - 1 - np.floor(np.log10(np.abs(x))), 0, 22)
+        scale = 10.0 ** np.where(np.isfinite(decimals), decimals, 0)
+        return np.where(x == 0, x, np.rint(x * scale) / scale)
+
+
+def _run_candidates(first, step, floating):
+    """
+    Generate candidate pairs of the first value and step of runs of evenly spaced values, from the most likely.
+
+    The step of a run of floating-point values is estimated from its first and last value, which is off by the
+    rounding errors of the values. The estimate, its roundings to fewer significant digits, with the first value as is
+    and rounded, a step of 0 with the first value rounded, and the nearest floating-point neighbors of the estimate
+    are tried, since evenly spaced values are usually computed as ``first + k * step`` from round numbers, e.g., a
+    period of 0.001 s.
+    """
+    yield first, step
+    if not floating:
+        return
+    rounded_steps = [_round_significant(step, digits) for digits in (15, 12, 9, 6)]
+    for rounded_step in rounded_steps:
+        yield first, rounded_step
+    for digits, rounded_step in zip((15, 12, 9, 6), rounded_steps):
+        rounded_first = _round_significant(first, digits)
+        yield rounded_first, rounded_step
+        # constant values, e.g., durations, whose differences to the base have rounding errors
+        yield rounded_first, np.zeros_like(step)
+    for offset in (-1, 1, -2, 2):
+        yield first, step + offset * np.spacing(step)
+
+
+def _mismatched(values, base, starts, run, k, first, step):
+    """Return whether the value at position `k` of each run `run` differs from ``first + k * step`` of the run."""
+    rows = starts[run] + k
+    decoded = _run_values(first[run], step[run], k, values.dtype)
+    return ~_same_values(decoded if base is None else base[rows] + decoded, values[rows])
+
+
+def _ragged_positions(runs, length):
+    """Return the run and the position within the run of each row of the given runs."""
+    counts = length[runs]
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(runs, counts), k
+
+
+def _encode_runs(values, max_runs, base=None):
+    """
+    Split a 1D array into runs of values ``first + k * step`` that reproduce the array exactly, or, if `base` is
+    given, that reproduce the array when added to `base`.
+
+    The first value and step of each run are chosen from `_run_candidates` as the first that reproduce all values of
+    the run exactly. Each candidate is checked on a few values of each run before it is checked on all values. Runs
+    that no candidate reproduces, e.g., values that are only approximately evenly spaced, are split at their first
+    mismatch and checked again. Returns the `first` value, `step` and `end` offset of each run, or None if more than
+    `max_runs` runs are needed.
+    """
+    n = len(values)
+    floating = values.dtype.kind == "f"
+    offsets = values if base is None else values - base
+    # the differences to `base` have the rounding errors of the values
+    starts = _run_starts(offsets, values)
+    for _ in range(_MAX_RUN_REFINEMENTS):
+        if len(starts) > max_runs:
+            return None
+        end = np.append(starts[1:], n)
+        length = end - starts
+        with np.errstate(invalid="ignore", over="ignore"):
+            first = offsets[starts]
+            if floating:
+                step = np.where(length > 1, (offsets[end - 1] - first) / np.maximum(length - 1, 1), 0.0)
+            else:
+                step = np.where(length > 1, (offsets[end - 1] - first) // np.maximum(length - 1, 1), 0)
+            chosen_first, chosen_step = first.copy(), step.copy()
+            unresolved = np.arange(len(starts))
+            for candidate_first, candidate_step in _run_candidates(first, step, floating):
+                # check a few values of each run, then all values of the runs whose sampled values match
+                lengths = length[unresolved][:, None]
+                k = np.hstack((np.minimum([1, 2, 3], lengths - 1), lengths * np.arange(1, 16) // 16, lengths - 1))
+                run = np.broadcast_to(unresolved[:, None], k.shape)
+                sampled = _mismatched(values, base, starts, run, k, candidate_first, candidate_step).any(axis=1)
+                candidates = unresolved[~sampled]
+                run, k = _ragged_positions(candidates, length)
+                mismatched = _mismatched(values, base, starts, run, k, candidate_first, candidate_step)
+                resolved = np.setdiff1d(candidates, run[mismatched])
+                chosen_first[resolved] = candidate_first[resolved]
+                chosen_step[resolved] = candidate_step[resolved]
+                unresolved = np.setdiff1d(unresolved, resolved)
+                if len(unresolved) == 0:
+                    return chosen_first, chosen_step, end
+            # split the runs that no candidate reproduces at their first mismatch with the estimated step
+            run, k = _ragged_positions(unresolved, length)
+            mismatched = _mismatched(values, base, starts, run, k, first, step)
+            # a run also mismatches at its start if its step is not finite, e.g., 0 * NaN, so it is split after
+            rows = starts[run[mismatched]] + np.maximum(k[mismatched], 1)
+            _, first_of_run = np.unique(run[mismatched], return_index=True)
+        starts = np.union1d(starts, rows[first_of_run])
+    return None
+
+
+class _LazyArray:
+    """
+    Base class of read-only 1D arrays whose values are computed on access.
+
+    Subclasses implement `__len__`, `_decode(rows)` for an array of non-negative row indices, and
+    `_decode_range(start, stop)` for a contiguous range of rows.
+    """
+
+    ndim = 1
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    @property
+    def size(self):
+        return len(self)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 1:
+            key = key[0]
+        n = len(self)
+        if isinstance(key, (int, np.integer)):
+            if not -n <= key < n:
+                raise IndexError("index %d is out of bounds for %s of length %d" % (key, self.__class__.__name__, n))
+            return self._decode(np.array([key % n]))[0]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n)
+            if step < 0:
+                return self._decode(np.arange(start, stop, step))
+            return self._decode_range(start, max(start, stop))[::step]
+        key = np.asarray(key)
+        if key.dtype == bool:
+            if key.shape != (n,):
+                raise IndexError("boolean index of shape %s does not match length %d" % (key.shape, n))
+            return self._decode(np.flatnonzero(key))
+        rows = key.astype(np.int64)
+        if np.any((rows < -n) | (rows >= n)):
+            raise IndexError("index out of bounds for %s of length %d" % (self.__class__.__name__, n))
+        return self._decode(rows % n if n else rows)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class RunArray(_LazyArray):
+    """
+    A read-only 1D array whose values are computed on access from runs of values ``first + k * step``, which are
+    added to the values of `base`, if given.
+
+    The columns of an OptogeneticPulsesTable that were written with `configure_compact_storage` are read as
+    RunArrays, so the full columns are neither read from the file nor held in memory. Indexing with an integer, a
+    slice, or an array of integers or booleans, and ``np.asarray``, return NumPy values.
+    """
+
+    def __init__(self, first, step, end, dtype, base=None):
+        self.first = first
+        self.step = step
+        self.end = end
+        self.dtype = np.dtype(dtype)
+        self.base = base
+
+    def __len__(self):
+        return int(self.end[-1]) if len(self.end) else 0
+
+    def __repr__(self):
+        return "%s of %d values in %d runs" % (self.__class__.__name__, len(self), len(self.end))
+
+    def _decode(self, rows):
+        values = _decode_runs(self.first, self.step, self.end, rows, self.dtype)
+        return values if self.base is None else _take(self.base, rows) + values
+
+    def _decode_range(self, start, stop):
+        # the runs that overlap the range are found with two binary searches and expanded without a search per row
+        r0, r1 = np.searchsorted(self.end, [start, stop], side="right")
+        r1 = min(r1 + 1, len(self.end)) if stop > start else r0
+        run_starts = np.concatenate(([0], self.end[:-1]))[r0:r1]
+        lo = np.maximum(run_starts, start)
+        counts = np.minimum(self.end[r0:r1], stop) - lo
+        k = np.arange(stop - start) - np.repeat(np.cumsum(counts) - counts - (lo - run_starts), counts)
+        values = _run_values(np.repeat(self.first[r0:r1], counts), np.repeat(self.step[r0:r1], counts), k, self.dtype)
+        return values if self.base is None else np.asarray(self.base[start:stop]) + values
+
+
+class _FillValueIterator(AbstractDataChunkIterator):
+    """An iterator without chunks, so that a dataset of the given length is created but only holds its fill value."""
+
+    def __init__(self, length, dtype, chunk_length):
+        self.__length = length
+        self.__dtype = np.dtype(dtype)
+        self.__chunk_length = chunk_length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise StopIteration
+
+    def recommended_chunk_shape(self):
+        return (self.__chunk_length,)
+
+    def recommended_data_shape(self):
+        return (self.__length,)
+
+    @property
+    def dtype(self):
+        return self.__dtype
+
+    @property
+    def maxshape(self):
+        return (self.__length,)
+
+
+def _compact_datasets(table):
+    """Return the datasets of a table that can be stored as runs, by their code in `compact_columns`."""
+    return {COMPACT_COLUMNS.index(d.name): d for d in _table_datasets(table) if d.name in COMPACT_COLUMNS}
+
+
+@docval(
+    {"name": "table", "type": DynamicTable, "doc": "the OptogeneticPulsesTable whose columns to store as runs"},
+    {"name": "backend", "type": str, "doc": "the backend that the table will be written with", "default": "hdf5"},
+    {
+        "name": "fallback",
+        "type": bool,
+        "doc": (
+            "whether to also write the full values of the encoded columns, compressed, so that tools that do not "
+            "support the compact encoding can read them. If False, these datasets are written only with their fill "
+            "value, which takes no space."
+        ),
+        "default": True,
+    },
+    {
+        "name": "min_ratio",
+        "type": (int, float),
+        "doc": "minimum ratio of the number of values of a column to its number of runs for the column to be encoded",
+        "default": 8,
+    },
+    *get_docval(configure_io, "target_chunk_bytes", "compression_level"),
+    returns="the names of the encoded columns",
+    rtype=list,
+    is_method=False,
+)
+def configure_compact_storage(**kwargs):
+    """
+    Store the columns of an OptogeneticPulsesTable that consist of runs of constant or evenly spaced values as runs.
+
+    Each of the `id`, `start_time`, `stop_time`, `power_in_mW`, `wavelength_in_nm`, `optogenetic_sites`, and
+    `optogenetic_sites_index` columns is split into runs of values ``first + k * step`` that reproduce it exactly,
+    e.g., one run for a constant power and one run per train for the start times of regular pulse trains. The
+    `stop_time` column is encoded as the durations of the rows, which are constant for pulses of equal length.
+    Columns with at least `min_ratio` values per run are encoded in the `compact_columns` dataset of the table, which
+    takes a few bytes per run. When the file is read with ndx-optogenetics, the encoded columns are read as
+    `RunArray`s that compute their values on access from the runs, so the full columns are not read from the file.
+
+    With ``fallback=True``, the full values of the encoded columns are also written, chunked and compressed, so that
+    the file is readable by any tool. With ``fallback=False``, the datasets of the encoded columns are written with
+    their full length but without data, so they take no space and hold only their fill value: the constant value of a
+    constant column, and NaN or 0 otherwise. Tools that do not support the compact encoding read these fill values.
+
+    Call this after all rows have been added to the table and before writing the file. Call `configure_io`
+    afterwards to compress the columns that are not encoded. The encoded columns cannot be accessed before the file is
+    written and read back when ``fallback=False``.
+    """
+    table, backend, fallback, min_ratio, target_chunk_bytes, compression_level = getargs(
+        "table", "backend", "fallback", "min_ratio", "target_chunk_bytes", "compression_level", kwargs
+    )
+    if backend not in ("hdf5", "zarr"):
+        raise ValueError("backend must be 'hdf5' or 'zarr', got '%s'" % backend)
+    if min_ratio < 1:
+        raise ValueError("min_ratio must be at least 1, got %s" % min_ratio)
+    if getattr(table, "compact_columns", None) is not None:
+        raise ValueError("%s '%s' already has compact columns" % (table.__class__.__name__, table.name))
+
+    runs = []
+    encoded = []
+    datasets = _compact_datasets(table)
+    wrapped = {
+        code for code, dataset in datasets.items() if isinstance(dataset.data, (DataIO, AbstractDataChunkIterator))
+    }
+    start_time = None if 1 in wrapped else np.asarray(datasets[1].data, dtype=np.float64)
+    for code, dataset in sorted(datasets.items()):
+        if code in wrapped or (code == _DURATION_COLUMN and start_time is None):
+            continue
+        values = np.asarray(dataset.data)
+        if len(values) == 0 or values.ndim != 1 or values.dtype.kind not in "iuf":
+            continue
+        base = start_time if code == _DURATION_COLUMN else None
+        encoding = _encode_runs(values, max_runs=len(values) / min_ratio, base=base)
+        if encoding is None:
+            continue
+        first, step, end = (np.asarray(a, dtype=np.float64) for a in encoding)
+        if values.dtype.kind in "iu" and not (
+            np.array_equal(first.astype(values.dtype), encoding[0])
+            and np.array_equal(step.astype(np.int64), encoding[1])
+        ):
+            # integers beyond the range of exactly representable float64 values
+            continue
+        runs.append(np.column_stack((np.full(len(end), code, dtype=np.float64), first, step, end)))
+        encoded.append(dataset.name)
+
+        chunk_length = _chunk_length(len(values), values.dtype.itemsize, target_chunk_bytes)
+        if fallback:
+            data_io = _make_data_io(backend, values, chunk_length, compression_level)
+        else:
+            constant = len(end) == 1 and step[0] == 0 and base is None
+            fill_value = values[0] if constant else (np.nan if values.dtype.kind == "f" else 0)
+            iterator = _FillValueIterator(len(values), values.dtype, chunk_length)
+            data_io = _make_data_io(
+                backend, iterator, chunk_length, compression_level, fill_value=values.dtype.type(fill_value)
+            )
+        dataset.transform(lambda _, data_io=data_io: data_io)
+
+    if runs:
+        table.compact_columns = np.concatenate(runs)
+    return encoded
+
+
+def _read_compact_columns(table, compact_columns):
+    """Replace the data of the columns of a table that are encoded in `compact_columns` by RunArrays."""
+    runs = np.asarray(compact_columns[:], dtype=np.float64)
+    codes = runs[:, 0].astype(np.int64)
+    datasets = _compact_datasets(table)
+    for code, dataset in sorted(datasets.items()):
+        column_runs = runs[codes == code]
+        if len(column_runs) == 0:
+            continue
+        end = column_runs[:, 3].astype(np.int64)
+        base = datasets[1].data if code == _DURATION_COLUMN else None
+        array = RunArray(column_runs[:, 1], column_runs[:, 2], end, dataset.data.dtype, base=base)
+        dataset.transform(lambda _, array=array: array)
+
+
+# columns that can be stored as codes into their distinct values in `dictionary_values`, in the order of their codes
+DICTIONARY_COLUMNS = ("power_in_mW", "wavelength_in_nm")
+
+
+class CodedArray(_LazyArray):
+    """
+    A read-only 1D array whose values are looked up on access from integer codes into an array of distinct values.
+
+    The columns of an OptogeneticEpochsTable or OptogeneticPulsesTable that were written with
+    `configure_dictionary_storage` are read as CodedArrays. `values` holds the distinct values of the column, and
+    `codes` reads the code of each row from column `column` of the `dictionary_codes` dataset, e.g., to group rows by
+    integer code instead of by floating-point value. Indexing and ``np.asarray`` return NumPy values, like RunArray.
+    """
+
+    def __init__(self, codes, values, column=0):
+        self.__codes = codes
+        self.__column = column
+        self.values = values
+        self.dtype = values.dtype
+
+    def __len__(self):
+        return len(self.__codes)
+
+    def __repr__(self):
+        return "%s of %d values with %d distinct values" % (self.__class__.__name__, len(self), len(self.values))
+
+    @property
+    def codes(self):
+        """The codes of all rows into `values`."""
+        return self._codes_range(0, len(self))
+
+    def _codes_range(self, start, stop):
+        if stop <= start:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.__codes[start:stop, self.__column])
+
+    def _decode(self, rows):
+        if len(rows) == 0:
+            return self.values[:0]
+        lo = rows.min()
+        return self.values[self._codes_range(lo, rows.max() + 1)[rows - lo]]
+
+    def _decode_range(self, start, stop):
+        return self.values[self._codes_range(start, stop)]
+
+
+def _exact_unique(values):
+    """Return the distinct values of an array, compared bit for bit, and the code of each value into them."""
+    if values.dtype.kind == "f":
+        # compare floats by their bits so that the encoding is lossless, e.g., for -0.0 and NaN payloads
+        _, first, codes = np.unique(values.view(np.dtype("u%d" % values.dtype.itemsize)), True, True)
+        return values[first], codes.ravel()
+    distinct, codes = np.unique(values, return_inverse=True)
+    return distinct, codes.ravel()
+
+
+@docval(
+    {
+        "name": "table",
+        "type": DynamicTable,
+        "doc": "the OptogeneticEpochsTable or OptogeneticPulsesTable whose columns to store as codes",
+    },
+    *get_docval(configure_compact_storage, "backend", "fallback"),
+    {
+        "name": "max_values",
+        "type": int,
+        "doc": "maximum number of distinct values of a column for the column to be encoded, at most 65536",
+        "default": 256,
+    },
+    *get_docval(configure_io, "target_chunk_bytes", "compression_level"),
+    returns="the names of the encoded columns",
+    rtype=list,
+    is_method=False,
+)
+def configure_dictionary_storage(**kwargs):
+    """
+    Store the `power_in_mW` and `wavelength_in_nm` columns of a table as small integer codes into their distinct values.
+
+    A session usually uses only a few distinct powers and wavelengths, so each of these columns with at most
+    `max_values` distinct values is encoded as the distinct values, in the `dictionary_values` dataset of the table,
+    and one code per row, in the `dictionary_codes` dataset, which takes one byte per row and column for up to 256
+    distinct values instead of eight, and the smallest wider unsigned integer type for more values. The encoding is
+    lossless. When the file is read with ndx-optogenetics, the encoded columns are read as `CodedArray`s that look up
+    their values on access, and whose `codes` can be used to group rows by condition.
+
+    With ``fallback=True``, the full values of the encoded columns are also written, chunked and compressed, so that
+    the file is readable by any tool. With ``fallback=False``, they are written only with their fill value, as in
+    `configure_compact_storage`. Columns that are empty or already wrapped in a DataIO, e.g., by
+    `configure_compact_storage` or `configure_io`, are left unchanged.
+
+    Call this after all rows have been added to the table and before writing the file.
+    """
+    table, backend, fallback, max_values, target_chunk_bytes, compression_level = getargs(
+        "table", "backend", "fallback", "max_values", "target_chunk_bytes", "compression_level", kwargs
+    )
+    if backend not in ("hdf5", "zarr"):
+        raise ValueError("backend must be 'hdf5' or 'zarr', got '%s'" % backend)
+    if not 1 <= max_values <= 65536:
+        raise ValueError("max_values must be between 1 and 65536, got %d" % max_values)
+    if getattr(table, "dictionary_values", None) is not None:
+        raise ValueError("%s '%s' already has dictionary columns" % (table.__class__.__name__, table.name))
+
+    entries = []
+    codes = []
+    encoded = []
+    for code, name in enumerate(DICTIONARY_COLUMNS):
+        if name not in table.colnames:
+            continue
+        dataset = table[name]
+        if isinstance(dataset.data, (DataIO, AbstractDataChunkIterator)) or len(dataset.data) == 0:
+            continue
+        values = np.asarray(dataset.data)
+        if values.ndim != 1 or values.dtype.kind not in "iuf":
+            continue
+        distinct, column_codes = _exact_unique(values)
+        if len(distinct) > max_values:
+            continue
+        entries.append(np.column_stack((np.full(len(distinct), code, dtype=np.float64), distinct)))
+        codes.append(column_codes)
+        encoded.append(name)
+
+        chunk_length = _chunk_length(len(values), values.dtype.itemsize, target_chunk_bytes)
+        if fallback:
+            data_io = _make_data_io(backend, values, chunk_length, compression_level)
+        else:
+            fill_value = distinct[0] if len(distinct) == 1 else (np.nan if values.dtype.kind == "f" else 0)
+            iterator = _FillValueIterator(len(values), values.dtype, chunk_length)
+            data_io = _make_data_io(
+                backend, iterator, chunk_length, compression_level, fill_value=values.dtype.type(fill_value)
+            )
+        dataset.transform(lambda _, data_io=data_io: data_io)
+
+    if encoded:
+        table.dictionary_values = np.concatenate(entries)
+        max_code = max(len(entry) for entry in entries) - 1
+        dictionary_codes = np.column_stack(codes).astype(np.promote_types(np.uint8, np.min_scalar_type(max_code)))
+        chunk_length = _chunk_length(
+            len(dictionary_codes), dictionary_codes.itemsize * len(encoded), target_chunk_bytes
+        )
+        table.dictionary_codes = _make_data_io(
+            backend, dictionary_codes, chunk_length, compression_level, row_shape=(len(encoded),)
+        )
+    return encoded
+
+
+def _read_dictionary_columns(table, dictionary_values, dictionary_codes):
+    """Replace the data of the columns of a table that are encoded in `dictionary_values` by CodedArrays."""
+    entries = np.asarray(dictionary_values[:], dtype=np.float64)
+    column_codes = entries[:, 0].astype(np.int64)
+    for column, code in enumerate(np.unique(column_codes)):
+        dataset = table[DICTIONARY_COLUMNS[code]]
+        values = entries[column_codes == code, 1].astype(dataset.data.dtype)
+        array = CodedArray(dictionary_codes, values, column=column)
+        dataset.transform(lambda _, array=array: array)
+
+
+# default number of rows per block of the tick encoding whose first row has its start time stored in ticks
+DEFAULT_TICK_BLOCK_LENGTH = 65536
+
+
+def _decode_ticks(deltas, anchors, block_length, start, stop):
+    """Compute the start times in ticks of the rows [start, stop) from their deltas and the anchors of their blocks."""
+    if stop <= start:
+        return np.empty(0, dtype=np.int64)
+    block_start = (start // block_length) * block_length
+    # the deltas of the first row of each block are 0, so each block starts at its anchor
+    cumulative = np.cumsum(np.asarray(deltas[block_start:stop], dtype=np.int64))
+    rows = np.arange(block_start, stop)
+    blocks = rows // block_length
+    ticks = anchors[blocks] + cumulative - cumulative[(blocks - blocks[0]) * block_length]
+    return ticks[start - block_start :]
+
+
+class TickArray(_LazyArray):
+    """
+    A read-only 1D array of times that are computed on access from integer ticks at a timebase.
+
+    The `start_time` and `stop_time` columns of an OptogeneticPulsesTable that were written with
+    `configure_tick_storage` are read as TickArrays. The start time of each row, in ticks, is the anchor of its block
+    plus the cumulative sum of the deltas within the block, so any range of rows is decoded by reading only the deltas
+    from the start of its first block. If `duration_codes` and `durations` are given, the duration in ticks with the
+    code of each row is added, for the stop times.
+    """
+
+    def __init__(self, deltas, anchors, block_length, timebase, duration_codes=None, durations=None):
+        self.deltas = deltas
+        self.anchors = anchors
+        self.block_length = block_length
+        self.timebase = timebase
+        self.duration_codes = duration_codes
+        self.durations = durations
+        self.dtype = np.dtype(np.float64)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def __repr__(self):
+        return "%s of %d times with a timebase of %g s" % (self.__class__.__name__, len(self), self.timebase)
+
+    def _decode(self, rows):
+        if len(rows) == 0:
+            return np.empty(0, dtype=self.dtype)
+        lo = rows.min()
+        return self._decode_range(lo, rows.max() + 1)[rows - lo]
+
+    def _decode_range(self, start, stop):
+        ticks = _decode_ticks(self.deltas, self.anchors, self.block_length, start, stop)
+        if self.durations is not None and stop > start:
+            ticks = ticks + self.durations[np.asarray(self.duration_codes[start:stop], dtype=np.int64)]
+        return ticks * self.timebase
+
+
+@docval(
+    {"name": "table", "type": DynamicTable, "doc": "the OptogeneticPulsesTable whose start and stop times to encode"},
+    {"name": "timebase", "type": float, "doc": "the duration of one tick, in seconds, e.g., 1e-6 or 1 / 30000"},
+    *get_docval(configure_compact_storage, "backend", "fallback"),
+    {
+        "name": "max_durations",
+        "type": int,
+        "doc": "maximum number of distinct durations, in ticks, for the stop times to be encoded, at most 65536",
+        "default": 256,
+    },
+    {
+        "name": "block_length",
+        "type": int,
+        "doc": "number of rows per block of rows whose first start time is stored in ticks",
+        "default": DEFAULT_TICK_BLOCK_LENGTH,
+    },
+    *get_docval(configure_io, "target_chunk_bytes", "compression_level"),
+    returns="a dict that maps the name of each encoded column to the largest absolute error of its times, in seconds",
+    rtype=dict,
+    is_method=False,
+)
+def configure_tick_storage(**kwargs):
+    """
+    Store the start and stop times of an OptogeneticPulsesTable as integer ticks at a timebase.
+
+    Each start time is rounded to the nearest tick and stored as the difference to the previous start time, in ticks,
+    in the smallest unsigned integer type that holds the largest difference, e.g., two bytes per pulse for pulses at
+    20 Hz with a timebase of 1 µs, with the start time of the first row of each block of `block_length` rows in ticks
+    for random access. The duration of each pulse, in ticks, is stored as a code into the distinct durations, if there
+    are at most `max_durations` of them, so stop times take one byte per pulse for up to 256 distinct durations and
+    two bytes for more. When the file is read with
+    ndx-optogenetics, the encoded columns are read as `TickArray`s that compute the times on access.
+
+    Precision: each time is read back as ``ticks * timebase`` and differs from the original time by at most half a
+    tick plus the rounding error of float64 arithmetic, i.e., about ``timebase / 2``. Times that are integer multiples
+    of the timebase are read back within one rounding error of float64, typically exactly. The largest error of
+    each encoded column is returned.
+
+    The start times must be sorted and finite. With ``fallback=True``, the full values of the encoded columns are also
+    written, chunked and compressed, as in `configure_compact_storage`; with ``fallback=False``, they are written only
+    with their fill value (NaN). Columns that are already wrapped in a DataIO, e.g., by `configure_compact_storage`,
+    are left unchanged.
+    """
+    table, timebase, backend, fallback, max_durations, block_length, target_chunk_bytes, compression_level = getargs(
+        "table",
+        "timebase",
+        "backend",
+        "fallback",
+        "max_durations",
+        "block_length",
+        "target_chunk_bytes",
+        "compression_level",
+        kwargs,
+    )
+    if backend not in ("hdf5", "zarr"):
+        raise ValueError("backend must be 'hdf5' or 'zarr', got '%s'" % backend)
+    if not timebase > 0:
+        raise ValueError("timebase must be positive, got %s" % timebase)
+    if not 1 <= max_durations <= 65536:
+        raise ValueError("max_durations must be between 1 and 65536, got %d" % max_durations)
+    if block_length < 1:
+        raise ValueError("block_length must be positive, got %d" % block_length)
+    if getattr(table, "tick_encoding", None) is not None:
+        raise ValueError("%s '%s' already has tick-encoded times" % (table.__class__.__name__, table.name))
+
+    start_dataset, stop_dataset = table.start_time, table.stop_time
+    if isinstance(start_dataset.data, (DataIO, AbstractDataChunkIterator)) or len(start_dataset.data) == 0:
+        return dict()
+    start_time = np.asarray(start_dataset.data, dtype=np.float64)
+    if not np.all(np.isfinite(start_time)) or np.any(np.diff(start_time) < 0):
+        raise ValueError("the start times must be finite and sorted to be stored as ticks")
+    ticks = np.rint(start_time / timebase).astype(np.int64)
+    deltas = np.diff(ticks, prepend=ticks[0])
+    deltas[::block_length] = 0
+    table.start_time_tick_deltas = deltas.astype(np.promote_types(np.uint8, np.min_scalar_type(deltas.max())))
+    table.start_time_tick_anchors = ticks[::block_length]
+    table.tick_encoding = np.array([timebase, block_length], dtype=np.float64)
+    errors = {"start_time": float(np.max(np.abs(ticks * timebase - start_time)))}
+    encoded = {"start_time": start_dataset}
+
+    if not isinstance(stop_dataset.data, (DataIO, AbstractDataChunkIterator)):
+        stop_time = np.asarray(stop_dataset.data, dtype=np.float64)
+        stop_ticks = np.rint(stop_time / timebase).astype(np.int64) if np.all(np.isfinite(stop_time)) else None
+        if stop_ticks is not None:
+            durations, codes = np.unique(stop_ticks - ticks, return_inverse=True)
+            if len(durations) <= max_durations:
+                table.duration_tick_codes = codes.ravel().astype(
+                    np.promote_types(np.uint8, np.min_scalar_type(len(durations) - 1))
+                )
+                table.duration_tick_values = durations
+                errors["stop_time"] = float(np.max(np.abs(stop_ticks * timebase - stop_time)))
+                encoded["stop_time"] = stop_dataset
+
+    for name, dataset in encoded.items():
+        values = np.asarray(dataset.data, dtype=np.float64)
+        chunk_length = _chunk_length(len(values), values.dtype.itemsize, target_chunk_bytes)
+        if fallback:
+            data_io = _make_data_io(backend, values, chunk_length, compression_level)
+        else:
+            iterator = _FillValueIterator(len(values), values.dtype, chunk_length)
+            data_io = _make_data_io(backend, iterator, chunk_length, compression_level, fill_value=np.float64(np.nan))
+        dataset.transform(lambda _, data_io=data_io: data_io)
+    return errors
+
+
+def _read_tick_columns(table):
+    """Replace the data of the start and stop times of a table that are encoded as ticks by TickArrays."""
+    timebase, block_length = np.asarray(table.tick_encoding[:], dtype=np.float64)
+    anchors = np.asarray(table.start_time_tick_anchors[:], dtype=np.int64)
+    args = (table.start_time_tick_deltas, anchors, int(block_length), float(timebase))
+    start_time = TickArray(*args)
+    table.start_time.transform(lambda _: start_time)
+    if table.duration_tick_codes is not None and table.duration_tick_values is not None:
+        durations = np.asarray(table.duration_tick_values[:], dtype=np.int64)
+        stop_time = TickArray(*args, duration_codes=table.duration_tick_codes, durations=durations)
+        table.stop_time.transform(lambda _: stop_time)
+
+
+class _PulseBatchStream:
+    """
+    Split a stream of batches of pulses into per-column streams of arrays.
+
+    Each column is consumed by its own PulseColumnIterator. A new batch is read from the stream only when a column has
+    consumed all previous batches, and the arrays of the other columns are queued until they are consumed. When the
+    iterators are read in turn, one chunk at a time (as hdmf does with `exhaust_dci=False`), at most a few batches are
+    held in memory at any time.
+    """
+
+    dtypes = {
+        "id": np.int64,
+        "start_time": np.float64,
+        "stop_time": np.float64,
+        "power_in_mW": np.float64,
+        "wavelength_in_nm": np.float64,
+        "optogenetic_sites": np.int64,
+        "optogenetic_sites_index": np.uint64,
+    }
+
+    def __init__(self, batches, sites_region=None):
+        self.__batches = iter(batches)
+        self.__sites_region = sites_region
+        self.__queues = {column: deque() for column in self.dtypes}
+        self.num_rows = 0
+        self.num_sites = 0
+
+    def next_values(self, column):
+        """Return the values of `column` in the next batch. Raises StopIteration when the stream is exhausted."""
+        queue = self.__queues[column]
+        while not queue:
+            self.__push(next(self.__batches))
+        return queue.popleft()
+
+    def __push(self, batch):
+        from .optogenetics import _as_ragged, _check_region_rows
+
+        values = {
+            column: np.asarray(batch[column], dtype=self.dtypes[column])
+            for column in ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm")
+        }
+        num_rows = len(values["start_time"])
+        if any(len(v) != num_rows for v in values.values()):
+            raise ValueError("All columns of a batch of pulses must have the same length")
+        sites, offsets = _as_ragged(batch["optogenetic_sites"], batch.get("optogenetic_sites_index"))
+        if len(offsets) != num_rows or (num_rows and offsets[-1] != len(sites)):
+            raise ValueError("The optogenetic_sites of a batch of pulses do not match the number of pulses")
+        _check_region_rows(self.__sites_region, sites)
+
+        values["id"] = np.arange(self.num_rows, self.num_rows + num_rows, dtype=np.int64)
+        values["optogenetic_sites"] = sites.astype(np.int64)
+        values["optogenetic_sites_index"] = (offsets + self.num_sites).astype(np.uint64)
+        self.num_rows += num_rows
+        self.num_sites += len(sites)
+        for column, queue in self.__queues.items():
+            queue.append(values[column])
+
+
+class PulseColumnIterator(AbstractDataChunkIterator):
+    """Iterator over the chunks of one column of an OptogeneticPulsesTable that is written from a stream of batches."""
+
+    def __init__(self, stream, column, chunk_length):
+        self.__stream = stream
+        self.__column = column
+        self.__chunk_length = chunk_length
+        self.__num_written = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        values = self.__stream.next_values(self.__column)
+        while len(values) == 0:
+            values = self.__stream.next_values(self.__column)
+        selection = np.s_[self.__num_written : self.__num_written + len(values)]
+        self.__num_written += len(values)
+        return DataChunk(data=values, selection=selection)
+
+    def recommended_chunk_shape(self):
+        return (self.__chunk_length,)
+
+    def recommended_data_shape(self):
+        return (0,)
+
+    @property
+    def dtype(self):
+        return np.dtype(_PulseBatchStream.dtypes[self.__column])
+
+    @property
+    def maxshape(self):
+        return (None,)
+
+
+@docval(
+    {"name": "table", "type": DynamicTable, "doc": "the empty OptogeneticPulsesTable to fill"},
+    {
+        "name": "batches",
+        "type": Iterable,
+        "doc": "iterable of dicts of arrays with the keyword arguments of `OptogeneticPulsesTable.add_pulses`",
+    },
+    {"name": "chunk_length", "type": int, "doc": "number of rows per chunk of each dataset", "default": 65536},
+    is_method=False,
+)
+def set_pulse_stream(**kwargs):
+    """
+    Back all columns of an empty OptogeneticPulsesTable by iterators that consume a stream of batches of pulses.
+
+    See `OptogeneticPulsesTable.from_batches`.
+    """
+    table, batches, chunk_length = getargs("table", "batches", "chunk_length", kwargs)
+    if len(table) > 0:
+        raise ValueError("%s '%s' must be empty to be filled from a stream" % (table.__class__.__name__, table.name))
+    stream = _PulseBatchStream(batches, sites_region=table.optogenetic_sites)
+    for dataset in _table_datasets(table):
+        if dataset.name not in _PulseBatchStream.dtypes:
+            raise ValueError("column '%s' cannot be filled from a stream of pulses" % dataset.name)
+        iterator = PulseColumnIterator(stream, dataset.name, chunk_length)
+        dataset.transform(lambda _, iterator=iterator: iterator)
+
+
+# columns of an OptogeneticPulsesTable that are mapped by `memmap_columns` by default
+MEMMAP_COLUMNS = ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm", "optogenetic_sites_index")
+
+
+def memmap_dataset(dataset):
+    """
+    Return a read-only `np.memmap` of a 1D h5py dataset that is stored contiguously and uncompressed in its file.
+
+    Raises ValueError if the dataset cannot be mapped, e.g., because it is chunked or compressed, stored in external
+    files, or not in a local file opened read-only.
+    """
+    import h5py
+
+    if not isinstance(dataset, h5py.Dataset):
+        raise ValueError("only datasets read with NWBHDF5IO can be memory-mapped, got %s" % type(dataset).__name__)
+    if dataset.file.mode != "r":
+        raise ValueError("dataset '%s' is in a file that is not opened read-only" % dataset.name)
+    if dataset.file.driver not in ("sec2", "stdio"):
+        raise ValueError("dataset '%s' is not in a local file (driver '%s')" % (dataset.name, dataset.file.driver))
+    if dataset.ndim != 1 or dataset.dtype.kind not in "biuf":
+        raise ValueError("dataset '%s' is not a 1D numeric dataset" % dataset.name)
+    if dataset.chunks is not None or dataset.external:
+        # recent versions of hdmf write the columns of tables in chunks so that they can be extended, unless
+        # `expandable=[]` is passed to `NWBHDF5IO.write`
+        raise ValueError(
+            "dataset '%s' is not stored contiguously in its file; write it without chunking and compression, e.g., "
+            "with io.write(nwbfile, expandable=[])" % dataset.name
+        )
+    if len(dataset) == 0:
+        return np.empty(0, dtype=dataset.dtype)
+    offset = dataset.id.get_offset()
+    if offset is None:
+        # the dataset was created but never written, so it has no storage
+        raise ValueError("dataset '%s' has no data in its file" % dataset.name)
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+
+
+@docval(
+    {"name": "table", "type": DynamicTable, "doc": "the table read with NWBHDF5IO, e.g., OptogeneticPulsesTable"},
+    {
+        "name": "columns",
+        "type": (list, tuple),
+        "doc": (
+            "names of the columns to map, e.g., 'start_time' or 'optogenetic_sites_index'. Defaults to the "
+            "start_time, stop_time, power_in_mW, wavelength_in_nm, and optogenetic_sites_index columns."
+        ),
+        "default": MEMMAP_COLUMNS,
+    },
+    returns="a dict that maps the name of each column to a read-only np.memmap of its data",
+    rtype=dict,
+    is_method=False,
+)
+def memmap_columns(**kwargs):
+    """
+    Map columns of a table read from an HDF5 file into memory without copying them.
+
+    Slicing a column of a table read with NWBHDF5IO reads the values from the file into a new NumPy array. Instead,
+    each column, which must be stored contiguously and uncompressed, i.e., written without `configure_io` or
+    `configure_compact_storage`, is mapped read-only at its offset in the file. Scanning the mapped columns reads
+    only the pages that are accessed, and several processes that map the same file share these pages in the page
+    cache of the operating system.
+
+    The file must be opened read-only and stay open while the mapped columns are used. Raises ValueError if a column
+    cannot be mapped. Recent versions of hdmf write the columns of tables in chunks so that rows can be appended; pass
+    ``expandable=[]`` to `NWBHDF5IO.write` to write them contiguously.
+    """
+    table, columns = getargs("table", "columns", kwargs)
+    datasets = {dataset.name: dataset for dataset in _table_datasets(table)}
+    mapped = dict()
+    for name in columns:
+        if name not in datasets:
+            raise ValueError("%s '%s' has no column '%s'" % (table.__class__.__name__, table.name, name))
+        mapped[name] = memmap_dataset(datasets[name].data)
+    return mapped
+
+
+def _appendable_dataset(table, dataset):
+    """Return the h5py or Zarr dataset of a column (or id) of a table read from a file, if rows can be appended."""
+    data = dataset.data
+    if hasattr(data, "maxshape") and hasattr(data, "resize") and hasattr(data, "file"):
+        # h5py.Dataset
+        if data.maxshape[0] is not None:
+            raise ValueError(
+                "column '%s' of %s '%s' is stored in a dataset of fixed size; write the file with resizable datasets, "
+                "e.g., with the default settings of NWBHDF5IO.write or after configure_io"
+                % (dataset.name, table.__class__.__name__, table.name)
+            )
+    elif not (hasattr(data, "append") and hasattr(data, "store")):
+        # neither h5py.Dataset nor zarr.Array
+        raise ValueError(
+            "column '%s' of %s '%s' is not read from a file" % (dataset.name, table.__class__.__name__, table.name)
+        )
+    if data.dtype.names is not None:
+        raise ValueError("cannot append to column '%s' of compound values" % dataset.name)
+    return data
+
+
+def _append_dataset(data, values):
+    """Append values to a resizable h5py or Zarr dataset in place."""
+    if hasattr(data, "append") and hasattr(data, "store"):
+        data.append(values)
+        return
+    num_rows = data.shape[0]
+    data.resize(num_rows + len(values), axis=0)
+    data[num_rows:] = values
+
+
+def _check_new_rows(table, columns, ragged):
+    """Check that the values of new rows are given for all columns of a table with the same length and return it."""
+    lengths = {name: len(values) for name, values in columns.items()}
+    lengths.update({name: len(offsets) for name, (_, offsets) in ragged.items()})
+    if len(set(lengths.values())) > 1:
+        raise ValueError("All columns must have the same number of rows, got %s" % lengths)
+    for colname in table.colnames:
+        if colname not in columns and colname not in ragged:
+            raise ValueError("column '%s' missing" % colname)
+    for colname in list(columns) + list(ragged):
+        if colname not in table.colnames:
+            raise ValueError("column '%s' is not a column of %s '%s'" % (colname, table.__class__.__name__, table.name))
+    return next(iter(lengths.values()), 0)
+
+
+def _append_rows(io, table, columns, ragged, ids=None):
+    """
+    Append rows to the datasets of a table read from a file opened for writing with `io`, in place.
+
+    `columns` and `ragged` are as in `_bulk_add_rows`. All values are validated and converted to the dtypes of the
+    datasets before any dataset is resized, and only the last offset of each VectorIndex is read from the file.
+    """
+    for field in ("compact_columns", "dictionary_values", "tick_encoding"):
+        if getattr(table, field, None) is not None:
+            raise ValueError(
+                "cannot append rows to %s '%s' with %s"
+                % (table.__class__.__name__, table.name, field.replace("_", " "))
+            )
+    if io.mode == "r":
+        raise ValueError("the file must be opened with mode 'a' or 'r+' to append rows, got mode 'r'")
+    source = table.container_source
+    if source is None or os.path.abspath(str(source)) != os.path.abspath(str(io.source)):
+        raise ValueError("%s '%s' was not read from the file of this io" % (table.__class__.__name__, table.name))
+
+    from .optogenetics import _check_region_rows
+
+    num_rows = _check_new_rows(table, columns, ragged)
+    appends = list()
+    num_existing_rows = len(table)
+    if ids is None:
+        ids = np.arange(num_existing_rows, num_existing_rows + num_rows)
+    elif len(ids) != num_rows:
+        raise ValueError("Expected %d ids, got %d" % (num_rows, len(ids)))
+    appends.append((_appendable_dataset(table, table.id), ids))
+    for colname, values in columns.items():
+        appends.append((_appendable_dataset(table, table[colname]), values))
+    for colname, (values, offsets) in ragged.items():
+        index = table[colname]
+        target = _appendable_dataset(table, index.target)
+        index_data = _appendable_dataset(table, index)
+        last_offset = int(index_data[-1]) if len(index_data) else 0
+        if len(offsets) and len(values) != offsets[-1]:
+            raise ValueError(
+                "The last offset of column '%s' (%d) does not match the number of values (%d)"
+                % (colname, offsets[-1], len(values))
+            )
+        _check_region_rows(index.target, values)
+        offsets = offsets + last_offset
+        if len(offsets) and index_data.dtype.kind == "u" and offsets[-1] > np.iinfo(index_data.dtype).max:
+            raise ValueError(
+                "the offsets of column '%s' exceed the maximum of the dtype %s of its index in the file"
+                % (colname, index_data.dtype)
+            )
+        appends.append((target, values))
+        appends.append((index_data, offsets))
+
+    # convert all values before resizing any dataset so that invalid values leave the file unchanged
+    appends = [(data, np.asarray(values).astype(data.dtype)) for data, values in appends]
+    for data, values in appends:
+        _append_dataset(data, values)
+    if hasattr(appends[0][0], "file"):
+        appends[0][0].file.flush()
+    else:
+        _reconsolidate_metadata(io)
+
+
+def _reconsolidate_metadata(io):
+    """Update the consolidated metadata of a Zarr store written with hdmf-zarr, which holds the shapes of arrays."""
+    import zarr
+
+    store = zarr.storage.normalize_store_arg(str(io.path))
+    if ".zmetadata" in store:
+        zarr.consolidate_metadata(store)
+
+
+@docval(
+    {
+        "name": "path",
+        "type": (str, Mapping),
+        "doc": "path or URL of the NWB Zarr store, e.g., 's3://bucket/session.nwb.zarr', or a Zarr store",
+    },
+    {
+        "name": "storage_options",
+        "type": dict,
+        "doc": "options of the fsspec filesystem of a URL, e.g., {'anon': True} or an 'endpoint_url'",
+        "default": None,
+    },
+    returns="a dict that maps the name of each optogenetics table in the intervals of the file to its Zarr group",
+    rtype=dict,
+    is_method=False,
+)
+def open_zarr_tables(**kwargs):
+    """
+    Open the OptogeneticEpochsTable and OptogeneticPulsesTable groups of an NWB Zarr store for partial reads.
+
+    The store is opened with its consolidated metadata, which hdmf-zarr writes by default, so the metadata of all
+    groups and arrays is read with a single request instead of one request per group and array, and no data is read
+    and no containers are built. Pass the groups to `read_time_window` to read the rows of a time window. Stores
+    without consolidated metadata are opened without it.
+    """
+    import zarr
+
+    path, storage_options = getargs("path", "storage_options", kwargs)
+    open_kwargs = dict(mode="r")
+    if storage_options is not None:
+        open_kwargs["storage_options"] = storage_options
+    try:
+        root = zarr.open_consolidated(path, **open_kwargs)
+    except KeyError:
+        root = zarr.open_group(path, **open_kwargs)
+    if "intervals" not in root:
+        return dict()
+    return {
+        name: group
+        for name, group in root["intervals"].groups()
+        if group.attrs.get("namespace") == "ndx-optogenetics"
+        and group.attrs.get("neurodata_type") in ("OptogeneticEpochsTable", "OptogeneticPulsesTable")
+    }
+
+
+# number of rows read at once from datasets that are not chunked
+_UNCHUNKED_READ_LENGTH = 65536
+
+
+class _ChunkReader:
+    """Reads a 1D Zarr array or h5py dataset one whole chunk at a time and caches the chunks that were read."""
+
+    def __init__(self, array):
+        self.array = array
+        chunks = getattr(array, "chunks", None)
+        self.chunk_length = chunks[0] if chunks else _UNCHUNKED_READ_LENGTH
+        self.__chunks = dict()
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    @property
+    def num_chunks(self):
+        return -(-len(self) // self.chunk_length)
+
+    def chunk(self, k):
+        if k not in self.__chunks:
+            self.__chunks[k] = np.asarray(self.array[k * self.chunk_length : (k + 1) * self.chunk_length])
+        return self.__chunks[k]
+
+    def submit(self, executor, start, stop):
+        """Submit the reads of the chunks that cover the rows [start, stop) to the executor."""
+        if stop <= start:
+            return []
+        chunks = range(start // self.chunk_length, (stop - 1) // self.chunk_length + 1)
+        return [executor.submit(self.chunk, k) for k in chunks]
+
+    def result(self, futures, start, stop):
+        """Return the rows [start, stop) from the futures of `submit`."""
+        if stop <= start:
+            return np.empty(0, dtype=self.array.dtype)
+        values = np.concatenate([future.result() for future in futures])
+        offset = (start // self.chunk_length) * self.chunk_length
+        return values[start - offset : stop - offset]
+
+    def searchsorted(self, value, side, executor, num_probes):
+        """
+        Find where `value` would be inserted into the sorted values to keep them sorted, like `np.searchsorted`.
+
+        The chunk that contains the position is found by a search on the first values of the chunks, which reads
+        `num_probes` chunks concurrently in each round, and the position within that chunk by binary search.
+        """
+
+        def before(first_value):
+            return first_value <= value if side == "right" else first_value < value
+
+        # chunks [0, lo) start before the value and chunks [hi, num_chunks) do not
+        lo, hi = 0, self.num_chunks
+        while lo < hi:
+            probes = np.unique(np.linspace(lo, hi - 1, min(num_probes, hi - lo)).astype(np.int64))
+            first_values = list(executor.map(lambda k: self.chunk(k)[0], probes))
+            for k, first_value in zip(probes, first_values):
+                if before(first_value):
+                    lo = k + 1
+                else:
+                    hi = k
+                    break
+        if lo == 0:
+            return 0
+        return (lo - 1) * self.chunk_length + int(np.searchsorted(self.chunk(lo - 1), value, side=side))
+
+
+def _table_arrays(table):
+    """Return the names of the columns of a table and its id, column, and index arrays by name."""
+    if isinstance(table, DynamicTable):
+        arrays = dict()
+        for dataset in _table_datasets(table):
+            arrays[dataset.name] = dataset.data
+        return list(table.colnames), arrays
+    return list(table.attrs["colnames"]), {name: array for name, array in table.arrays()}
+
+
+@docval(
+    {
+        "name": "table",
+        "type": None,
+        "doc": (
+            "the Zarr group of the table, from `open_zarr_tables`, or the table read with NWBZarrIO or NWBHDF5IO, "
+            "e.g., OptogeneticPulsesTable"
+        ),
+    },
+    {"name": "t0", "type": (float, int), "doc": "start of the time window, in seconds"},
+    {"name": "t1", "type": (float, int), "doc": "end of the time window, in seconds"},
+    {
+        "name": "columns",
+        "type": (list, tuple),
+        "doc": "names of the columns to read. Defaults to all numeric columns.",
+        "default": None,
+    },
+    {"name": "num_threads", "type": int, "doc": "number of threads to read chunks with", "default": 8},
+    returns=(
+        "a dict with the `id` and the values of each column of the rows in the window, and the end offsets "
+        "`<column>_index` of the values of each row of indexed columns"
+    ),
+    rtype=dict,
+    is_method=False,
+)
+def read_time_window(**kwargs):
+    """
+    Read the rows of a table whose start time is in the time window [t0, t1), reading only the chunks that hold them.
+
+    The rows of the table must be sorted by start time, as the rows of pulses and epochs tables usually are. The
+    first and last row of the window are found by a search on the first start time of each chunk of `start_time`,
+    which reads a few chunks per round, and then all chunks of all columns that hold the rows of the window, and of
+    the values of indexed columns such as `optogenetic_sites`, are read concurrently in a pool of `num_threads`
+    threads. Chunks of `start_time` read by the search are not read again. With Zarr stores on object storage,
+    where every chunk is a separate request, this keeps the number of sequential requests small.
+
+    The result has the keys of `OptogeneticPulsesTable.add_pulses`, so the rows can be added to another table with
+    ``add_pulses(**rows)``. Datasets that are not chunked are read in blocks of 65536 rows.
+    """
+    table, t0, t1, columns, num_threads = getargs("table", "t0", "t1", "columns", "num_threads", kwargs)
+    if t1 < t0:
+        raise ValueError("t1 (%s) must not be smaller than t0 (%s)" % (t1, t0))
+    if num_threads < 1:
+        raise ValueError("num_threads must be a positive integer, got %d" % num_threads)
+    colnames, arrays = _table_arrays(table)
+    if columns is None:
+        columns = [
+            name
+            for name in colnames
+            if arrays[name].dtype.kind in "biuf" and len(arrays[name].shape) == 1 and arrays[name].dtype.names is None
+        ]
+    for name in columns:
+        if name not in colnames:
+            raise ValueError("table has no column '%s'" % name)
+
+    readers = {name: _ChunkReader(array) for name, array in arrays.items()}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        start_time = readers["start_time"]
+        start = start_time.searchsorted(t0, "left", executor, num_threads)
+        stop = start_time.searchsorted(t1, "left", executor, num_threads)
+
+        # read the rows of all columns, and the end offset of the row before the window of indexed columns
+        names = ["id"] + [name + "_index" if name + "_index" in arrays else name for name in columns]
+        futures = {name: readers[name].submit(executor, start, stop) for name in names}
+        indexed = [name for name in columns if name + "_index" in arrays]
+        previous = {name: readers[name + "_index"].submit(executor, start - 1, start) for name in indexed if start > 0}
+        rows = {name: readers[name].result(futures[name], start, stop) for name in names}
+
+        # read the values of the rows of indexed columns
+        bounds = dict()
+        for name in indexed:
+            first = int(readers[name + "_index"].result(previous[name], start - 1, start)[0]) if start > 0 else 0
+            last = int(rows[name + "_index"][-1]) if stop > start else first
+            bounds[name] = (first, last)
+            futures[name] = readers[name].submit(executor, first, last)
+        for name, (first, last) in bounds.items():
+            rows[name] = readers[name].result(futures[name], first, last)
+            rows[name + "_index"] = rows[name + "_index"].astype(np.int64) - first
+    return rows
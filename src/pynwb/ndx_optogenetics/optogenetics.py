@@ -1,13 +1,1011 @@
-from hdmf.common import DynamicTable
-from hdmf.utils import docval, get_docval, AllowPositional
+from collections.abc import Iterable
 
-from pynwb import register_class
+import numpy as np
+import pandas as pd
+from hdmf.backends.io import HDMFIO
+from hdmf.common import DynamicTable, DynamicTableRegion, VectorIndex
+from hdmf.data_utils import GenericDataChunkIterator
+from hdmf.utils import docval, get_docval, getargs, popargs, AllowPositional
+
+from pynwb import register_class, TimeSeries
 from pynwb.base import TimeSeriesReferenceVectorData
 from pynwb.epoch import TimeIntervals
 
+from . import _load_namespace
+from .ttl import detect_pulses
+
+# the custom classes can be registered only after the namespace is loaded
+_load_namespace()
+
+
+def _extend_column(column, values):
+    """Append an array of values to the data of a column (or id) of a DynamicTable with one array write."""
+
+    def extend(data):
+        if len(data) == 0:
+            return values
+        return np.concatenate((np.asarray(data), values))
+
+    column.transform(extend)
+
+
+def _index_dtype(max_value):
+    """Return the smallest unsigned integer dtype (at least uint8) that can hold `max_value`, as VectorIndex does."""
+    return np.promote_types(np.uint8, np.min_scalar_type(max_value))
+
+
+def _bulk_add_rows(table, columns, ragged, ids=None):
+    """
+    Add many rows to a DynamicTable at once, bypassing the per-row validation of `DynamicTable.add_row`.
+
+    `columns` maps column names to 1D arrays with one value per new row. `ragged` maps names of indexed columns to a
+    tuple of the concatenated values of all new rows and the end offset of each new row within those values, following
+    the VectorIndex convention. Every column of the table must be provided.
+    """
+    lengths = {name: len(values) for name, values in columns.items()}
+    lengths.update({name: len(offsets) for name, (_, offsets) in ragged.items()})
+    if len(set(lengths.values())) > 1:
+        raise ValueError("All columns must have the same number of rows, got %s" % lengths)
+    num_rows = next(iter(lengths.values()), 0)
+
+    for colname in table.colnames:
+        if colname not in columns and colname not in ragged:
+            raise ValueError("column '%s' missing" % colname)
+    for colname in list(columns) + list(ragged):
+        if colname not in table.colnames:
+            raise ValueError("column '%s' is not a column of %s '%s'" % (colname, table.__class__.__name__, table.name))
+
+    for colname, (values, offsets) in ragged.items():
+        if len(offsets) and len(values) != offsets[-1]:
+            raise ValueError(
+                "The last offset of column '%s' (%d) does not match the number of values (%d)"
+                % (colname, offsets[-1], len(values))
+            )
+        _check_region_rows(getattr(table, colname), values)
+
+    num_existing_rows = len(table)
+    if ids is None:
+        ids = np.arange(num_existing_rows, num_existing_rows + num_rows)
+    elif len(ids) != num_rows:
+        raise ValueError("Expected %d ids, got %d" % (num_rows, len(ids)))
+    _extend_column(table.id, np.asarray(ids))
+
+    for colname, values in columns.items():
+        _extend_column(getattr(table, colname), values)
+    for colname, (values, offsets) in ragged.items():
+        index = getattr(table, colname + "_index")
+        offsets = offsets + len(index.target)
+        max_offset = offsets[-1] if len(offsets) else 0
+        dtype = _index_dtype(max_offset)
+        if len(index.data):
+            dtype = np.promote_types(dtype, np.asarray(index.data).dtype)
+        _extend_column(index.target, values)
+        _extend_column(index, offsets.astype(dtype))
+
+
+def _check_region_rows(region, values):
+    """Raise a ValueError if any value of a DynamicTableRegion column is not a row of the table that it references."""
+    if not isinstance(region, DynamicTableRegion) or region.table is None or len(values) == 0:
+        return
+    values = np.asarray(values)
+    num_rows = len(region.table)
+    invalid = (values < 0) | (values >= num_rows)
+    if np.any(invalid):
+        raise ValueError(
+            "column '%s' references rows %s that are not rows of %s '%s' with %d rows"
+            % (
+                region.name,
+                np.unique(values[invalid]).tolist()[:10],
+                region.table.__class__.__name__,
+                region.table.name,
+                num_rows,
+            )
+        )
+
+
+def _as_ragged(values, index=None):
+    """
+    Normalize a possibly ragged column given as bulk arrays to a (concatenated values, end offsets) tuple.
+
+    `values` is either a 1D array with one value per row, a 2D array with a fixed number of values per row, or,
+    if `index` is given, the concatenated values of all rows where `index` holds the end offset of each row.
+    """
+    values = np.asarray(values)
+    if index is not None:
+        offsets = np.asarray(index, dtype=np.int64)
+        if values.ndim != 1:
+            raise ValueError("Concatenated values of a ragged column must be 1D when an index is given")
+        if np.any(np.diff(offsets) < 0) or (len(offsets) and offsets[0] < 0):
+            raise ValueError("The index of a ragged column must be non-decreasing and non-negative")
+        return values, offsets
+    if values.ndim == 1:
+        return values, np.arange(1, len(values) + 1, dtype=np.int64)
+    if values.ndim == 2:
+        num_rows, row_length = values.shape
+        return values.ravel(), np.arange(1, num_rows + 1, dtype=np.int64) * row_length
+    raise ValueError("Values of a ragged column must be 1D or 2D, got %dD" % values.ndim)
+
+
+def _column_array(column, dtype=None):
+    """Read the full data of a column of a DynamicTable into a NumPy array with a single slice."""
+    if len(column.data) == 0:
+        return np.asarray([], dtype=dtype)
+    return np.asarray(column.data[:], dtype=dtype)
+
+
+def _take_ragged(values, offsets, rows):
+    """
+    Select `rows` of a ragged column given as concatenated `values` and end `offsets`.
+
+    Returns the concatenated values and end offsets of the selected rows, computed with offset arithmetic.
+    """
+    starts = np.concatenate(([0], offsets[:-1]))[rows]
+    counts = offsets[rows] - starts
+    new_offsets = np.cumsum(counts)
+    positions = np.repeat(starts - (new_offsets - counts), counts) + np.arange(new_offsets[-1] if len(rows) else 0)
+    return values[positions], new_offsets
+
+
+def _split_ragged(values, offsets):
+    """Split the concatenated `values` of a ragged column into a list with one array per row."""
+    if len(offsets) == 0:
+        return []
+    return np.split(values, offsets[:-1])
+
+
+def _site_set_codes(values, offsets):
+    """
+    Number the distinct sets of sites of the rows of a ragged `optogenetic_sites` column.
+
+    Returns the code of the set of sites of each row and the concatenated sites of each code with their end offsets.
+    Rows with one site each are coded by their site in linear time; rows with the same number of sites by their
+    sorted sites with `np.unique`.
+    """
+    counts = np.diff(offsets, prepend=0)
+    if len(counts) and np.all(counts == 1):
+        present = np.flatnonzero(np.bincount(values))
+        codes = np.zeros(present[-1] + 1, dtype=np.int64)
+        codes[present] = np.arange(len(present))
+        return codes[values], present, np.arange(1, len(present) + 1)
+    if len(counts) and np.all(counts == counts[0]):
+        site_sets, codes = np.unique(np.sort(values.reshape(len(counts), -1), axis=1), axis=0, return_inverse=True)
+        return codes.ravel(), site_sets.ravel(), np.arange(1, len(site_sets) + 1) * site_sets.shape[1]
+    keys = [tuple(np.unique(sites)) for sites in _split_ragged(values, offsets)]
+    site_sets = list(dict.fromkeys(keys))
+    lookup = {key: code for code, key in enumerate(site_sets)}
+    codes = np.array([lookup[key] for key in keys], dtype=np.int64)
+    concatenated = np.array([site for key in site_sets for site in key], dtype=np.int64)
+    return codes, concatenated, np.cumsum([len(key) for key in site_sets], dtype=np.int64)
+
+
+class _PulseSchedule:
+    """
+    The pulses defined by the parameters of the stimulation epochs of an OptogeneticEpochsTable.
+
+    Pulses are numbered consecutively across all epochs with stimulation on, in the order of the epochs, then of the
+    trains within an epoch, then of the pulses within a train. The times and metadata of any set of pulses are
+    computed from the pulse numbers with index arithmetic, without generating the other pulses.
+    """
+
+    def __init__(self, epochs_table):
+        stimulation_on = _column_array(epochs_table.stimulation_on, dtype=bool)
+        number_pulses_per_pulse_train = _column_array(epochs_table.number_pulses_per_pulse_train, dtype=np.int64)
+        number_trains = _column_array(epochs_table.number_trains, dtype=np.int64)
+        counts = np.where(stimulation_on, number_pulses_per_pulse_train * number_trains, 0)
+        self.epochs = np.flatnonzero(counts > 0)
+        self.counts = counts[self.epochs]
+        self.offsets = np.cumsum(self.counts)
+
+        rows = self.epochs
+        self.start_time = _column_array(epochs_table.start_time, dtype=np.float64)[rows]
+        self.pulse_length = _column_array(epochs_table.pulse_length_in_ms, dtype=np.float64)[rows] / 1000.0
+        self.period = _column_array(epochs_table.period_in_ms, dtype=np.float64)[rows] / 1000.0
+        self.intertrain_interval = (
+            _column_array(epochs_table.intertrain_interval_in_ms, dtype=np.float64)[rows] / 1000.0
+        )
+        self.number_pulses_per_pulse_train = number_pulses_per_pulse_train[rows]
+        self.power_in_mW = _column_array(epochs_table.power_in_mW, dtype=np.float64)[rows]
+        self.wavelength_in_nm = _column_array(epochs_table.wavelength_in_nm, dtype=np.float64)[rows]
+        self.sites = _column_array(epochs_table.optogenetic_sites)
+        self.sites_offsets = _column_array(epochs_table.optogenetic_sites_index, dtype=np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def pulses(self, indices):
+        """
+        Compute the columns of the pulses with the given pulse numbers.
+
+        Returns a dict with the `start_time`, `stop_time`, `power_in_mW`, `wavelength_in_nm` arrays, the concatenated
+        `optogenetic_sites` and their `optogenetic_sites_index`, and the `epoch` row of each pulse.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        epoch = np.searchsorted(self.offsets, indices, side="right")
+        within_epoch = indices - (self.offsets[epoch] - self.counts[epoch])
+        train, pulse = np.divmod(within_epoch, self.number_pulses_per_pulse_train[epoch])
+        start_time = self.start_time[epoch] + train * self.intertrain_interval[epoch] + pulse * self.period[epoch]
+        sites, sites_offsets = _take_ragged(self.sites, self.sites_offsets, self.epochs[epoch])
+        return {
+            "start_time": start_time,
+            "stop_time": start_time + self.pulse_length[epoch],
+            "power_in_mW": self.power_in_mW[epoch],
+            "wavelength_in_nm": self.wavelength_in_nm[epoch],
+            "optogenetic_sites": sites,
+            "optogenetic_sites_index": sites_offsets,
+            "epoch": self.epochs[epoch],
+        }
+
+    def columns(self, indices, chunk_size=None):
+        """
+        Compute the columns of the pulses with the given pulse numbers, a range or an array, into arrays allocated once.
+
+        The columns are filled with the pulses of one chunk of `chunk_size` pulses at a time, so only the temporary
+        arrays of one chunk are allocated besides the columns. Returns a dict with the arrays of `pulses` without
+        `epoch`, ready for `OptogeneticPulsesTable.add_pulses`.
+        """
+        num_pulses = len(indices)
+        chunk_size = chunk_size or max(num_pulses, 1)
+        chunks = [slice(start, min(start + chunk_size, num_pulses)) for start in range(0, num_pulses, chunk_size)]
+        # each pulse has the sites of its epoch
+        num_sites = np.diff(self.sites_offsets, prepend=0)[self.epochs]
+        if isinstance(indices, range) and indices == range(len(self)):
+            total_sites = int(np.sum(self.counts * num_sites))
+        else:
+            total_sites = sum(
+                int(np.sum(num_sites[np.searchsorted(self.offsets, np.asarray(indices[chunk]), side="right")]))
+                for chunk in chunks
+            )
+        columns = {
+            column: np.empty(num_pulses, dtype=np.float64)
+            for column in ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm")
+        }
+        sites = np.empty(total_sites, dtype=self.sites.dtype)
+        sites_offsets = np.empty(num_pulses, dtype=np.int64)
+        num_filled_sites = 0
+        for chunk in chunks:
+            pulses = self.pulses(indices[chunk])
+            for column, values in columns.items():
+                values[chunk] = pulses[column]
+            chunk_sites = pulses["optogenetic_sites"]
+            sites[num_filled_sites : num_filled_sites + len(chunk_sites)] = chunk_sites
+            sites_offsets[chunk] = pulses["optogenetic_sites_index"] + num_filled_sites
+            num_filled_sites += len(chunk_sites)
+        return dict(columns, optogenetic_sites=sites, optogenetic_sites_index=sites_offsets)
+
+
+def _close(a, b, tolerance):
+    """Return whether `a` and `b` differ by at most `tolerance`, with NaN close to NaN."""
+    return (np.abs(a - b) <= tolerance) | (np.isnan(a) & np.isnan(b))
+
+
+# the columns of an OptogeneticEpochsTable that are fitted to pulses
+_FITTED_EPOCH_COLUMNS = (
+    "start_time",
+    "stop_time",
+    "pulse_length_in_ms",
+    "period_in_ms",
+    "number_pulses_per_pulse_train",
+    "number_trains",
+    "intertrain_interval_in_ms",
+)
+
+
+def _fit_epochs(start_time, stop_time, max_gap=None, tolerance=0.0, segment_starts=None):
+    """
+    Fit the parameters of epochs of regular pulse trains to pulses sorted by start time.
+
+    Pulses are split into trains where the interval between the starts of consecutive pulses exceeds `max_gap`
+    (by default, 1.5 times the shortest interval) and where `segment_starts`, a boolean array, is True, e.g., where
+    the power of the pulses changes; trains that start at a segment start also start an epoch. Consecutive trains
+    with the same number of pulses, period, and pulse length, and equal intervals between their starts, within
+    `tolerance` seconds, are grouped into epochs; each epoch is extended greedily over the following trains. The gaps
+    and train parameters are computed with vectorized operations, so the pulses are fitted in linear time; only the
+    epochs are looped over.
+
+    Returns a dict of arrays with the `start_time`, `stop_time`, `pulse_length_in_ms`, `period_in_ms`,
+    `number_pulses_per_pulse_train`, `number_trains`, and `intertrain_interval_in_ms` of each epoch, and the `epoch`
+    of each pulse and whether it is `deviating`, i.e., whether its start time or duration differs by more than
+    `tolerance` from those of its pulse in the schedule of its epoch. Evenly spaced trains of one pulse are fitted as
+    one train of pulses, the period of an epoch of one pulse is its pulse length, and the intertrain interval of an
+    epoch of one train is 0.
+    """
+    start_time = np.asarray(start_time, dtype=np.float64)
+    stop_time = np.asarray(stop_time, dtype=np.float64)
+    if len(start_time) == 0:
+        columns = dict.fromkeys(_FITTED_EPOCH_COLUMNS, np.empty(0))
+        columns.update(number_pulses_per_pulse_train=np.empty(0, dtype=np.int64))
+        columns.update(number_trains=np.empty(0, dtype=np.int64), epoch=np.empty(0, dtype=np.int64))
+        columns.update(deviating=np.empty(0, dtype=bool))
+        return columns
+    if segment_starts is None:
+        segment_starts = np.zeros(len(start_time), dtype=bool)
+    intervals = np.diff(start_time)
+    if max_gap is None:
+        max_gap = 1.5 * intervals.min() if len(intervals) else np.inf
+    new_train = (intervals > max_gap) | segment_starts[1:]
+    train_starts = np.concatenate(([0], np.flatnonzero(new_train) + 1)).astype(np.int64)
+    train_stops = np.append(train_starts[1:], len(start_time))
+    counts = train_stops - train_starts
+    first = start_time[train_starts]
+    last = start_time[train_stops - 1]
+    length = np.add.reduceat(stop_time - start_time, train_starts) / counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        period = np.where(counts > 1, (last - first) / (counts - 1), np.nan)
+
+    # link[k]: trains k - 1 and k have the same parameters; regular[k]: trains k - 2, k - 1, and k are linked and
+    # evenly spaced
+    num_trains = len(counts)
+    spacing = np.diff(first)
+    link = np.zeros(num_trains, dtype=bool)
+    link[1:] = (counts[1:] == counts[:-1]) & _close(period[1:], period[:-1], tolerance)
+    link[1:] &= _close(length[1:], length[:-1], tolerance) & ~segment_starts[train_starts[1:]]
+    regular = np.zeros(num_trains, dtype=bool)
+    regular[2:] = link[2:] & link[1:-1] & _close(spacing[1:], spacing[:-1], tolerance)
+    breaks = np.flatnonzero(~regular)
+
+    epoch_trains = []
+    i = 0
+    while i < num_trains:
+        last_train = i
+        if i + 1 < num_trains and link[i + 1]:
+            # the epoch extends to the train before the next train at or after i + 2 that is not regular
+            j = np.searchsorted(breaks, i + 2)
+            last_train = (breaks[j] if j < len(breaks) else num_trains) - 1
+        epoch_trains.append((i, last_train + 1))
+        i = last_train + 1
+
+    epoch_first, epoch_stop = np.array(epoch_trains, dtype=np.int64).reshape(-1, 2).T
+    number_trains = epoch_stop - epoch_first
+    pulse_starts = train_starts[epoch_first]
+    pulse_stops = train_stops[epoch_stop - 1]
+    num_pulses = pulse_stops - pulse_starts
+    pulse_length = np.add.reduceat(stop_time - start_time, pulse_starts) / num_pulses
+    # the period of an epoch is fitted to the spacing of the pulses of all of its trains
+    spans = np.add.reduceat(last - first, epoch_first)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        period = spans / (num_pulses - number_trains)
+        intertrain_interval = (first[epoch_stop - 1] - first[epoch_first]) / (number_trains - 1)
+    period = np.where(num_pulses > number_trains, period, pulse_length)
+    intertrain_interval = np.where(number_trains > 1, intertrain_interval, 0.0)
+    # an epoch of trains of one pulse is one train of evenly spaced pulses
+    single = (counts[epoch_first] == 1) & (number_trains > 1)
+    period[single] = intertrain_interval[single]
+    intertrain_interval[single] = 0.0
+    number_pulses_per_pulse_train = np.where(single, number_trains, counts[epoch_first])
+    number_trains = np.where(single, 1, number_trains)
+
+    # compare each pulse to its pulse in the schedule of its epoch
+    epoch = np.repeat(np.arange(len(num_pulses)), num_pulses)
+    train, pulse = np.divmod(np.arange(len(start_time)) - pulse_starts[epoch], number_pulses_per_pulse_train[epoch])
+    expected_start_time = start_time[pulse_starts][epoch] + train * intertrain_interval[epoch] + pulse * period[epoch]
+    deviating = np.abs(start_time - expected_start_time) > tolerance
+    deviating |= np.abs(stop_time - start_time - pulse_length[epoch]) > tolerance
+    return {
+        "start_time": start_time[pulse_starts],
+        "stop_time": np.maximum.reduceat(stop_time, pulse_starts),
+        "pulse_length_in_ms": pulse_length * 1000.0,
+        "period_in_ms": period * 1000.0,
+        "number_pulses_per_pulse_train": number_pulses_per_pulse_train,
+        "number_trains": number_trains,
+        "intertrain_interval_in_ms": intertrain_interval * 1000.0,
+        "epoch": epoch,
+        "deviating": deviating,
+    }
+
+
+class _IntervalIndex:
+    """
+    Index for fast queries of the intervals of the rows of a table that overlap a time window or contain a time.
+
+    The intervals are sorted by start time and paired with the running maximum of their stop times, so all intervals
+    that start before a time are found by binary search on the sorted start times, and whether any of them is still
+    ongoing is answered by the running maximum stop time at that position.
+    """
+
+    def __init__(self, start_time, stop_time, rows=None):
+        if rows is None:
+            rows = np.arange(len(start_time))
+        order = np.argsort(start_time[rows], kind="stable")
+        self.rows = rows[order]
+        self.start_time = start_time[self.rows]
+        self.stop_time = stop_time[self.rows]
+        self.max_stop_time = np.maximum.accumulate(self.stop_time) if len(self.rows) else self.stop_time
+
+    def overlapping(self, t0, t1):
+        """Return the sorted rows whose interval [start, stop] overlaps the window [t0, t1]."""
+        hi = np.searchsorted(self.start_time, t1, side="right")
+        lo = np.searchsorted(self.max_stop_time[:hi], t0, side="left")
+        candidates = np.arange(lo, hi)
+        return np.sort(self.rows[candidates[self.stop_time[candidates] >= t0]])
+
+    def contains(self, times):
+        """Return whether each of `times` falls within the interval [start, stop) of any row."""
+        hi = np.searchsorted(self.start_time, times, side="right")
+        max_stop_time = np.concatenate(([-np.inf], self.max_stop_time))[hi]
+        return max_stop_time > times
+
+
+class _SiteMembership:
+    """
+    The mapping of the rows of a table to the sites that they reference and its transpose.
+
+    `sites` and `indptr` are the column indices and row pointers of the sparse (rows x sites) membership matrix in
+    compressed sparse row layout, i.e., the `optogenetic_sites` values and the `optogenetic_sites_index` with a
+    leading 0. The transpose, in compressed sparse column layout, is built on first use with a stable sort of the
+    sites, so the rows of each site are sorted.
+    """
+
+    def __init__(self, sites, offsets, num_sites=0):
+        if len(sites) and sites.min() < 0:
+            raise ValueError("optogenetic_sites must be non-negative rows of the OptogeneticSitesTable")
+        self.sites = sites
+        self.indptr = np.concatenate(([0], offsets))
+        self.num_sites = max(num_sites, int(sites.max()) + 1 if len(sites) else 0)
+        self.__rows = None
+        self.__site_offsets = None
+
+    def __transpose(self):
+        if self.__rows is None:
+            rows = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+            order = np.argsort(self.sites, kind="stable")
+            sites = self.sites[order]
+            rows = rows[order]
+            # a row that references a site more than once is a row of that site once
+            keep = np.ones(len(rows), dtype=bool)
+            keep[1:] = (sites[1:] != sites[:-1]) | (rows[1:] != rows[:-1])
+            self.__rows = rows[keep]
+            self.__site_offsets = np.concatenate(([0], np.cumsum(np.bincount(sites[keep], minlength=self.num_sites))))
+        return self.__rows, self.__site_offsets
+
+    @property
+    def site_offsets(self):
+        """The start offset of the rows of each site in the transpose and the total number of entries."""
+        return self.__transpose()[1]
+
+    def rows_for_site(self, site):
+        if not 0 <= site < self.num_sites:
+            raise IndexError("site %d is out of range for %d sites" % (site, self.num_sites))
+        rows, site_offsets = self.__transpose()
+        return rows[site_offsets[site] : site_offsets[site + 1]]
+
+
+class _StimulusTrace:
+    """
+    The samples of a trace of pulses at a regular sampling rate, computed for any range of samples on demand.
+
+    Sample ``i`` at time ``t_start + i / rate`` is covered by a pulse if ``start_time <= t < stop_time``. The ranges of
+    samples covered by the pulses are sorted by their first sample and paired with the running maximum of their end,
+    as in _IntervalIndex, so the pulses that cover a range of samples are found by binary search. The trace of the
+    range is then computed from the cumulative sum of the pulse onsets and offsets in that range only.
+    """
+
+    def __init__(self, start_time, stop_time, values, rate, t_start, num_samples, dtype):
+        # the tolerance keeps a pulse edge that falls on a sample, e.g., 0.1 s at 30 kHz, on that sample
+        # despite the rounding error of the product
+        first = np.ceil((start_time - t_start) * rate - 1e-6).astype(np.int64)
+        end = np.ceil((stop_time - t_start) * rate - 1e-6).astype(np.int64)
+        keep = (end > first) & (end > 0) & (first < num_samples)
+        order = np.argsort(first[keep], kind="stable")
+        self.first = np.clip(first[keep][order], 0, num_samples)
+        self.end = np.clip(end[keep][order], 0, num_samples)
+        self.max_end = np.maximum.accumulate(self.end) if len(self.end) else self.end
+        self.values = None if values is None else values[keep][order]
+        self.num_samples = num_samples
+        self.dtype = np.dtype(dtype)
+
+    def samples(self, s0, s1):
+        """Return the samples ``s0`` to ``s1`` (exclusive) of the trace."""
+        n = s1 - s0
+        hi = np.searchsorted(self.first, s1, side="left")
+        lo = np.searchsorted(self.max_end[:hi], s0, side="right")
+        pulses = np.arange(lo, hi)
+        pulses = pulses[self.end[pulses] > s0]
+        first = self.first[pulses] - s0
+        end = np.minimum(self.end[pulses] - s0, n)
+        first[first < 0] = 0
+        active = np.cumsum(np.bincount(first, minlength=n + 1) - np.bincount(end, minlength=n + 1))[:n] > 0
+        if self.values is None:
+            return active.astype(self.dtype)
+        values = self.values[pulses]
+        if len(pulses) == 0:
+            return np.zeros(n, dtype=self.dtype)
+        if np.all(first[1:] >= np.maximum.accumulate(end)[:-1]):
+            # the pulses do not overlap, so each active sample takes the exact value of the last pulse that started
+            markers = np.full(n, -1)
+            markers[first] = np.arange(len(pulses))
+            trace = values[np.maximum.accumulate(markers)]
+        else:
+            # overlapping pulses add up
+            trace = np.cumsum(
+                np.bincount(first, weights=values, minlength=n + 1) - np.bincount(end, weights=values, minlength=n + 1)
+            )[:n]
+        return np.where(active, trace, 0).astype(self.dtype)
+
+
+# number of samples of a trace computed at once
+_TRACE_CHUNK_SIZE = 1 << 20
+
+# the unit and conversion factor to that unit of the TimeSeries of a trace of a column
+_TRACE_UNITS = {"power_in_mW": ("watts", 1e-3), "wavelength_in_nm": ("meters", 1e-9)}
+
+
+class _StimulusTraceIterator(GenericDataChunkIterator):
+    """Iterator over the chunks of a _StimulusTrace for writing it as the data of a TimeSeries."""
+
+    def __init__(self, trace, **kwargs):
+        self.__trace = trace
+        super().__init__(**kwargs)
+
+    def _get_data(self, selection):
+        return self.__trace.samples(selection[0].start or 0, selection[0].stop)
+
+    def _get_maxshape(self):
+        return (self.__trace.num_samples,)
+
+    def _get_dtype(self):
+        return self.__trace.dtype
+
+
+# tolerance of the comparisons of times computed from stimulation parameters, in seconds
+_TIME_TOLERANCE = 1e-9
+
+
+class ValidationReport(dict):
+    """
+    The result of `validate`: for each check, by name, the sorted indices of the rows of the table that fail it.
+
+    A check that passes maps to an empty array. The report is truthy if all checks pass.
+    """
+
+    @property
+    def valid(self):
+        """Whether all checks pass."""
+        return all(len(rows) == 0 for rows in self.values())
+
+    def __bool__(self):
+        return self.valid
+
+    def failed(self):
+        """Return the checks that fail, mapped to the rows that fail them."""
+        return {check: rows for check, rows in self.items() if len(rows)}
+
+    def __repr__(self):
+        failed = self.failed()
+        if not failed:
+            return "%s: all %d checks passed" % (self.__class__.__name__, len(self))
+        return "%s: %d of %d checks failed: %s" % (
+            self.__class__.__name__,
+            len(failed),
+            len(self),
+            ", ".join("%s (%d rows)" % (check, len(rows)) for check, rows in failed.items()),
+        )
+
+
+def _overlapping_at_site(start_time, stop_time, sites, offsets):
+    """
+    Return the sorted rows whose interval starts before the interval of an earlier row at one of its sites stops.
+
+    The (row, site) pairs are sorted by site and start time, and each interval is compared with the running maximum of
+    the stop times of the intervals before it at the same site, so all overlaps are found in one sorted pass.
+    """
+    rows = np.repeat(np.arange(len(offsets)), np.diff(offsets, prepend=0))
+    order = np.lexsort((start_time[rows], sites))
+    rows, sites = rows[order], sites[order]
+    max_stop_time = pd.Series(stop_time[rows]).groupby(sites).cummax().to_numpy()
+    previous_max_stop_time = np.concatenate(([-np.inf], max_stop_time[:-1]))
+    previous_max_stop_time[np.concatenate(([True], sites[1:] != sites[:-1]))] = -np.inf
+    return np.unique(rows[start_time[rows] < previous_max_stop_time])
+
+
+def _pulses_by_epoch_sites(pulses_table, epochs_table, epoch_rows=None):
+    """
+    Group the pulses of a table by their set of sites, with the epochs that share a site with the pulses of each group.
+
+    Yields the sorted rows of the pulses with each distinct set of sites and the sorted rows of the epochs, among
+    `epoch_rows` if given, that reference at least one of these sites, found with the site membership of the epochs.
+    Each pulse is in exactly one group, so per-epoch sums over the groups count each pulse once.
+    """
+    membership = epochs_table._site_membership()
+    sites = _column_array(pulses_table.optogenetic_sites, dtype=np.int64)
+    offsets = _column_array(pulses_table.optogenetic_sites_index, dtype=np.int64)
+    if len(sites) and sites.min() < 0:
+        # negative sites are invalid and are not sites of any epoch
+        sites = np.where(sites >= 0, sites, max(membership.num_sites, int(sites.max()) + 1))
+    codes, site_sets, site_set_offsets = _site_set_codes(sites, offsets)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(site_set_offsets) + 1))
+    site_set_starts = np.concatenate(([0], site_set_offsets[:-1]))
+    for code, (first, last) in enumerate(zip(site_set_starts, site_set_offsets)):
+        site_set = site_sets[first:last]
+        rows = [membership.rows_for_site(site) for site in site_set[site_set < membership.num_sites]]
+        epochs = np.unique(np.concatenate([np.empty(0, dtype=np.int64)] + rows))
+        if epoch_rows is not None:
+            epochs = np.intersect1d(epochs, epoch_rows)
+        yield order[bounds[code] : bounds[code + 1]], epochs
+
+
+class _OptogeneticIntervalsMixin:
+    """Methods shared by OptogeneticEpochsTable and OptogeneticPulsesTable."""
+
+    def _stimulation_rows(self):
+        """Return the rows of the table during which stimulation was on, or None if stimulation was on in all rows."""
+        return None
+
+    def _set_dictionary_columns(self, dictionary_values, dictionary_codes):
+        self.dictionary_values = dictionary_values
+        self.dictionary_codes = dictionary_codes
+        if dictionary_values is not None and dictionary_codes is not None:
+            # look up the encoded columns lazily from their codes instead of reading their datasets
+            from .io import _read_dictionary_columns
+
+            _read_dictionary_columns(self, dictionary_values, dictionary_codes)
+
+    def _index_cache(self):
+        # the indices are cached on the table and rebuilt when the number of rows changes
+        num_rows, cache = getattr(self, "_OptogeneticIntervalsMixin__cache", (None, None))
+        if num_rows != len(self):
+            cache = dict()
+            self.__cache = (len(self), cache)
+        return cache
+
+    def _interval_index(self, stimulation_only=False):
+        cache = self._index_cache()
+        if stimulation_only not in cache:
+            cache[stimulation_only] = _IntervalIndex(
+                _column_array(self.start_time, dtype=np.float64),
+                _column_array(self.stop_time, dtype=np.float64),
+                rows=self._stimulation_rows() if stimulation_only else None,
+            )
+        return cache[stimulation_only]
+
+    def _site_membership(self):
+        cache = self._index_cache()
+        if "sites" not in cache:
+            sites_table = self.optogenetic_sites.table
+            cache["sites"] = _SiteMembership(
+                _column_array(self.optogenetic_sites, dtype=np.int64),
+                _column_array(self.optogenetic_sites_index, dtype=np.int64),
+                num_sites=len(sites_table) if sites_table is not None else 0,
+            )
+        return cache["sites"]
+
+    @docval(
+        returns="the sparse matrix of the sites of each row, with one row per row and one column per site",
+        rtype="scipy.sparse.csr_matrix",
+    )
+    def site_matrix(self):
+        """
+        Return the optogenetic sites of the rows as a boolean `scipy.sparse.csr_matrix` of shape (rows, sites).
+
+        Element ``(i, j)`` is True if row ``i`` references row ``j`` of the OptogeneticSitesTable. The matrix is
+        built from the `optogenetic_sites` values, as column indices, and the `optogenetic_sites_index`, as row
+        pointers, without decoding the rows. Requires scipy.
+        """
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError as e:
+            raise ImportError("site_matrix requires the scipy package.") from e
+        membership = self._site_membership()
+        return csr_matrix(
+            (np.ones(len(membership.sites), dtype=bool), membership.sites, membership.indptr),
+            shape=(len(membership.indptr) - 1, membership.num_sites),
+        )
+
+    @docval(
+        {"name": "site", "type": int, "doc": "row of the OptogeneticSitesTable"},
+        returns="the sorted rows of this table that reference the site",
+        rtype=np.ndarray,
+    )
+    def rows_for_site(self, **kwargs):
+        """
+        Find the rows of the table that reference a site of the OptogeneticSitesTable, e.g., the pulses at a site.
+
+        The first call builds the transpose of the row-to-site mapping, i.e., the rows of each site in a compressed
+        sparse column layout, which is cached on the table and rebuilt when rows are added. Each lookup is then a
+        slice of that index.
+        """
+        site = getargs("site", kwargs)
+        return self._site_membership().rows_for_site(site)
+
+    @docval(
+        returns="the number of rows of this table that reference each row of the OptogeneticSitesTable",
+        rtype=np.ndarray,
+    )
+    def per_site_counts(self):
+        """
+        Count the rows of the table that reference each site, e.g., the number of pulses delivered at each site.
+
+        The counts are taken from the cached index of `rows_for_site`, and a row that references a site more than once
+        is counted once.
+        """
+        return np.diff(self._site_membership().site_offsets)
+
+    @docval(
+        {"name": "t0", "type": (float, int), "doc": "Start of the time window, in seconds"},
+        {"name": "t1", "type": (float, int), "doc": "End of the time window, in seconds"},
+        returns="the sorted row indices of the rows whose interval overlaps the time window",
+        rtype=np.ndarray,
+    )
+    def query_time(self, **kwargs):
+        """
+        Find the rows whose interval [start_time, stop_time] overlaps the time window [t0, t1].
+
+        The first call builds an index of the intervals sorted by start time, which is cached on the table, also when
+        the table is read from a file, and rebuilt when rows are added. Each query then takes O(log n + k) time for
+        k matching rows when the intervals do not overlap each other.
+        """
+        t0, t1 = getargs("t0", "t1", kwargs)
+        if t1 < t0:
+            raise ValueError("t1 (%s) must not be smaller than t0 (%s)" % (t1, t0))
+        return self._interval_index().overlapping(t0, t1)
+
+    @docval(
+        {"name": "times", "type": ("array_data", float, int), "doc": "Time(s) to query, in seconds"},
+        returns="whether stimulation was on at each of the given times",
+        rtype=(np.ndarray, bool),
+    )
+    def is_stimulating(self, **kwargs):
+        """
+        Determine whether stimulation was on at each of the given times, i.e., whether the time falls within
+        [start_time, stop_time) of any row with stimulation on.
+
+        All times are queried at once with a binary search on the cached index of the intervals (see `query_time`),
+        so millions of times can be queried in a single vectorized call.
+        """
+        times = getargs("times", kwargs)
+        result = self._interval_index(stimulation_only=True).contains(np.asarray(times, dtype=np.float64))
+        return bool(result) if np.ndim(times) == 0 else result
+
+    @docval(
+        {"name": "io", "type": HDMFIO, "doc": "the IO that the table was read with, opened with mode 'a' or 'r+'"},
+        {
+            "name": "id",
+            "type": "array_data",
+            "doc": "IDs of the new rows. Defaults to consecutive integers following the last row.",
+            "default": None,
+        },
+        allow_extra=True,
+    )
+    def append_rows(self, **kwargs):
+        """
+        Append rows to the table in the file that it was read from, in place, e.g., to add the pulses of another day.
+
+        The values of the new rows are given as keyword arguments with one array per column of the table, e.g.,
+        ``start_time``, as in `OptogeneticPulsesTable.add_pulses`. The values of an indexed column such as
+        ``optogenetic_sites`` are either a 1D array with one value per row, a 2D array with the same number of values
+        per row, or the concatenated values of all rows with their end offsets given as ``<column>_index``, e.g.,
+        ``optogenetic_sites_index``, relative to the new rows.
+
+        Each column, its index, and the `id` are resized and written in place with one array write, in time
+        proportional to the number of new rows; only the last offset of each index is read from the file. The
+        datasets must be resizable, which is the default of recent versions of hdmf and of `configure_io`.
+        """
+        from .io import _append_rows
+
+        io, ids = popargs("io", "id", kwargs)
+        columns, ragged = dict(), dict()
+        for colname, values in kwargs.items():
+            if colname.endswith("_index") and colname[: -len("_index")] in kwargs:
+                continue
+            if colname in self.colnames and isinstance(self[colname], VectorIndex):
+                ragged[colname] = _as_ragged(values, kwargs.get(colname + "_index"))
+            else:
+                columns[colname] = np.asarray(values)
+        _append_rows(io, self, columns, ragged, ids=None if ids is None else np.asarray(ids))
+
+    def _validate_intervals_and_sites(self):
+        """Check the intervals and sites of all rows. See `validate`."""
+        start_time = _column_array(self.start_time, dtype=np.float64)
+        stop_time = _column_array(self.stop_time, dtype=np.float64)
+        sites = _column_array(self.optogenetic_sites, dtype=np.int64)
+        offsets = _column_array(self.optogenetic_sites_index, dtype=np.int64)
+        num_sites = len(self.optogenetic_sites.table) if self.optogenetic_sites.table is not None else np.inf
+        site_rows = np.repeat(np.arange(len(offsets)), np.diff(offsets, prepend=0))
+        invalid_sites = np.diff(offsets, prepend=0) == 0
+        invalid_sites[site_rows[(sites < 0) | (sites >= num_sites)]] = True
+        return {
+            "stop_not_after_start": np.flatnonzero(~(stop_time > start_time)),
+            "invalid_sites": np.flatnonzero(invalid_sites),
+            "overlapping_at_site": _overlapping_at_site(start_time, stop_time, sites, offsets),
+        }
+
+    @docval(
+        {"name": "name", "type": str, "doc": "Name of the column of the OptogeneticSitesTable, e.g., 'effector'"},
+        {
+            "name": "rows",
+            "type": ("array_data", slice),
+            "doc": "Rows of this table to look up. Defaults to all rows.",
+            "default": None,
+        },
+        returns=(
+            "an object array of the unique values of the column of the OptogeneticSitesTable, the integer codes into "
+            "the unique values for each site of the selected rows, concatenated, and the end offset of the codes of "
+            "each selected row"
+        ),
+        rtype=tuple,
+    )
+    def resolve_site_column(self, **kwargs):
+        """
+        Look up a column of the OptogeneticSitesTable, e.g., the excitation source, for the sites of many rows at once.
+
+        The column is resolved through the cache of `OptogeneticSitesTable.resolve_column`, so each referenced device
+        or effector is dereferenced only once, and the values for the selected rows are gathered with a vectorized
+        take on integer codes instead of one dereference per row. For example, the excitation sources of the sites
+        of row ``i`` (in the selection) are ``objects[codes[offsets[i - 1]:offsets[i]]]`` with ``offsets[-1] = 0``.
+        The generic lookups ``self[i, "optogenetic_sites"]`` and `to_dataframe` do not use this cache.
+        """
+        name, rows = getargs("name", "rows", kwargs)
+        sites_table = self.optogenetic_sites.table
+        objects, site_codes = sites_table.resolve_column(name)
+        sites = _column_array(self.optogenetic_sites, dtype=np.int64)
+        offsets = _column_array(self.optogenetic_sites_index, dtype=np.int64)
+        if rows is not None:
+            rows = np.arange(len(offsets))[rows]
+            sites, offsets = _take_ragged(sites, offsets, rows)
+        return objects, site_codes[sites], offsets
+
+    @docval(
+        {
+            "name": "site_columns",
+            "type": (list, tuple),
+            "doc": (
+                "Columns of the OptogeneticSitesTable to join by site. Columns of object references are joined by the "
+                "names of the referenced objects. Columns that the OptogeneticSitesTable does not have are skipped."
+            ),
+            "default": ("excitation_source", "optical_fiber", "effector"),
+        },
+        {
+            "name": "output",
+            "type": str,
+            "doc": "'pandas' to return a pandas DataFrame or 'arrow' to return a pyarrow Table",
+            "default": "pandas",
+        },
+    )
+    def to_columnar_dataframe(self, **kwargs):
+        """
+        Export the table in a flat, columnar form, with one row per row of this table and stimulated site.
+
+        This is a fast alternative to `to_dataframe` for large tables, also when the table is read from a file. Each
+        column is read with a single slice, the ragged `optogenetic_sites` column is decoded with offset arithmetic
+        on the `optogenetic_sites_index`, and the requested columns of the OptogeneticSitesTable are looked up once
+        per site and joined to the rows with a vectorized take. The result has no object-dtype columns: the `id` of
+        the row, the scalar numeric columns of this table, the site row `optogenetic_sites`, and one categorical
+        (pandas) or dictionary-encoded (pyarrow) column per joined site column. Ragged columns other than
+        `optogenetic_sites`, e.g., `tags` and `timeseries`, are not exported.
+
+        A row of this table that references several sites becomes several rows of the result, so group by `id`
+        to recover the rows.
+        """
+        site_columns, output = getargs("site_columns", "output", kwargs)
+        if output not in ("pandas", "arrow"):
+            raise ValueError("output must be 'pandas' or 'arrow', got '%s'" % output)
+
+        sites = _column_array(self.optogenetic_sites, dtype=np.int64)
+        offsets = _column_array(self.optogenetic_sites_index, dtype=np.int64)
+        rows = np.repeat(np.arange(len(offsets)), np.diff(offsets, prepend=0))
+
+        columns = {"id": _column_array(self.id)[rows]}
+        index_columns = {column.name for column in self.columns if isinstance(column, VectorIndex)}
+        ragged_columns = {getattr(self, name).target.name for name in index_columns}
+        for column in self.columns:
+            if column.name in index_columns or column.name in ragged_columns:
+                continue
+            values = _column_array(column)
+            if values.ndim == 1 and values.dtype.kind in "biuf":
+                columns[column.name] = values[rows]
+        columns["optogenetic_sites"] = sites
+
+        categories = {}
+        sites_table = self.optogenetic_sites.table
+        for name in site_columns:
+            if sites_table is None or name not in sites_table.colnames:
+                continue
+            labels, codes = _site_column_codes(sites_table, name)
+            categories[name] = (codes[sites], labels)
+
+        if output == "arrow":
+            try:
+                import pyarrow as pa
+            except ImportError as e:
+                raise ImportError("output='arrow' requires the pyarrow package.") from e
+            arrays = {name: pa.array(values) for name, values in columns.items()}
+            for name, (codes, labels) in categories.items():
+                arrays[name] = pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(labels))
+            return pa.table(arrays)
+
+        df = pd.DataFrame(columns)
+        for name, (codes, labels) in categories.items():
+            df[name] = pd.Categorical.from_codes(codes, categories=labels)
+        return df
+
+
+def _site_column_codes(sites_table, name):
+    """
+    Encode a column of an OptogeneticSitesTable as sorted unique labels and one integer code per site.
+
+    Object references are labeled by the name of the referenced object, and other values by their string form.
+    """
+    if isinstance(sites_table, OptogeneticSitesTable):
+        objects, codes = sites_table.resolve_column(name)
+    else:
+        objects, codes = np.unique(np.asarray(sites_table[name].data[:], dtype=object), return_inverse=True)
+    labels = [getattr(obj, "name", None) or str(obj) for obj in objects]
+    labels, label_codes = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    return labels.tolist(), label_codes.astype(np.int32)[codes]
+
+
+@register_class("OptogeneticSitesTable", "ndx-optogenetics")
+class OptogeneticSitesTable(DynamicTable):
+    """
+    This table contains information about the optogenetic stimulation sites, including the excitation source, the
+    optical fiber, and targeted effector.
+    """
+
+    __columns__ = (
+        {
+            "name": "excitation_source",
+            "description": "The excitation source device connected to the optical fiber.",
+            "required": False,
+        },
+        {"name": "optical_fiber", "description": "The optical fiber device.", "required": False},
+        {"name": "effector", "description": "The effector protein, e.g., ChR2.", "required": True},
+    )
+
+    @docval(
+        {"name": "description", "type": str, "doc": "Description of this OptogeneticSitesTable"},
+        {
+            "name": "name",
+            "type": str,
+            "doc": "name of this OptogeneticSitesTable",
+            "default": "optogenetic_sites_table",
+        },
+        *get_docval(DynamicTable.__init__, "id", "columns", "colnames", "target_tables"),
+        allow_positional=AllowPositional.WARNING,
+    )
+    def __init__(self, **kwargs):
+        DynamicTable.__init__(self, **kwargs)
+        self.__resolved_columns = dict()
+        self.__resolved_num_rows = None
+
+    @docval(
+        {"name": "name", "type": str, "doc": "Name of the column, e.g., 'excitation_source'"},
+        returns=(
+            "an object array of the unique values of the column, in order of first occurrence, and an integer array "
+            "with the position of the value of each row in the unique values"
+        ),
+        rtype=tuple,
+    )
+    def resolve_column(self, **kwargs):
+        """
+        Resolve a column of this table, e.g., of references to devices, into its unique values and integer codes.
+
+        The column is read (and, for a table read from a file, its object references are dereferenced) only once.
+        The result is cached on the table until rows are added, so code that looks up the device or effector of
+        many pulses or epochs does not dereference the same few objects over and over. The cache is used by this
+        method, `resolve_site_column`, and `to_columnar_dataframe`; indexing the table or a region that refers to it,
+        e.g., ``epochs_table[i, "optogenetic_sites"]`` or `to_dataframe`, does not use it.
+        """
+        name = getargs("name", kwargs)
+        if self.__resolved_num_rows != len(self):
+            self.__resolved_columns.clear()
+            self.__resolved_num_rows = len(self)
+        if name not in self.__resolved_columns:
+            if name not in self.colnames:
+                raise KeyError("'%s' is not a column of %s '%s'" % (name, self.__class__.__name__, self.name))
+            objects, codes = [], np.empty(len(self), dtype=np.int32)
+            positions = dict()  # position of each unique object, by identity
+            for row, obj in enumerate(self[name].data[:]):
+                codes[row] = positions.setdefault(id(obj), len(objects))
+                if codes[row] == len(objects):
+                    objects.append(obj)
+            unique_objects = np.empty(len(objects), dtype=object)
+            unique_objects[:] = objects
+            self.__resolved_columns[name] = (unique_objects, codes)
+        return self.__resolved_columns[name]
+
 
 @register_class("OptogeneticEpochsTable", "ndx-optogenetics")
-class OptogeneticEpochsTable(TimeIntervals):
+class OptogeneticEpochsTable(_OptogeneticIntervalsMixin, TimeIntervals):
     """
     General metadata about the optogenetic stimulation that may change per epoch. Some epochs have no
     stimulation and are used as control epochs. If the stimulation is on, then the epoch is a stimulation.
@@ -87,17 +1085,363 @@ class OptogeneticEpochsTable(TimeIntervals):
         },
     )
 
+    __fields__ = ("dictionary_values", "dictionary_codes")
+
     @docval(
         {"name": "name", "type": str, "doc": "name of this OptogeneticEpochsTable"},
         {"name": "description", "type": str, "doc": "Description of this OptogeneticEpochsTable"},
         *get_docval(DynamicTable.__init__, "id", "columns", "colnames", "target_tables"),
+        {
+            "name": "dictionary_values",
+            "type": "array_data",
+            "doc": (
+                "Distinct values (column, value) of the columns stored as codes. Set by "
+                "`ndx_optogenetics.io.configure_dictionary_storage`."
+            ),
+            "default": None,
+        },
+        {
+            "name": "dictionary_codes",
+            "type": "array_data",
+            "doc": (
+                "Codes of the values of the columns stored as codes, with one column per encoded column. Set by "
+                "`ndx_optogenetics.io.configure_dictionary_storage`."
+            ),
+            "default": None,
+        },
         allow_positional=AllowPositional.WARNING,
     )
     def __init__(self, **kwargs):
+        dictionary_values, dictionary_codes = popargs("dictionary_values", "dictionary_codes", kwargs)
         DynamicTable.__init__(self, **kwargs)
+        self._set_dictionary_columns(dictionary_values, dictionary_codes)
+
+    def _stimulation_rows(self):
+        return np.flatnonzero(_column_array(self.stimulation_on, dtype=bool))
+
+    @docval(
+        {
+            "name": "chunk_size",
+            "type": int,
+            "doc": "Maximum number of pulses per chunk. If None, all pulses are returned in a single chunk.",
+            "default": None,
+        },
+    )
+    def iter_pulses(self, **kwargs):
+        """
+        Generate the individual pulses defined by the parameters of the epochs with stimulation on, in chunks.
+
+        The `pulse_length_in_ms`, `period_in_ms`, `number_pulses_per_pulse_train`, `number_trains`, and
+        `intertrain_interval_in_ms` of each epoch are expanded into `number_trains` trains of
+        `number_pulses_per_pulse_train` pulses, starting at the start time of the epoch. Each pulse has the power,
+        wavelength, and optogenetic sites of its epoch. Pulses are ordered by epoch, train, and pulse within a train.
+
+        Each chunk is a dict of arrays with the keyword arguments of `OptogeneticPulsesTable.add_pulses` and the
+        additional key `epoch`, the row of this table that each pulse belongs to. Only one chunk is held in memory at a
+        time, so epochs with hundreds of millions of pulses can be expanded in bounded memory.
+        """
+        chunk_size = getargs("chunk_size", kwargs)
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer, got %d" % chunk_size)
+        schedule = _PulseSchedule(self)
+        num_pulses = len(schedule)
+        chunk_size = chunk_size or max(num_pulses, 1)
+        for start in range(0, num_pulses, chunk_size):
+            yield schedule.pulses(np.arange(start, min(start + chunk_size, num_pulses)))
+
+    @docval(
+        {"name": "name", "type": str, "doc": "name of the OptogeneticPulsesTable", "default": "optogenetic_pulses"},
+        {
+            "name": "description",
+            "type": str,
+            "doc": "Description of the OptogeneticPulsesTable",
+            "default": "Optogenetic stimulation pulses expanded from the parameters of the stimulation epochs.",
+        },
+        *get_docval(iter_pulses, "chunk_size"),
+    )
+    def to_pulses_table(self, **kwargs):
+        """
+        Create an OptogeneticPulsesTable with the individual pulses defined by the parameters of the epochs.
+
+        The columns of the new table are allocated once for all pulses and filled with the pulses computed in one
+        vectorized pass, or one pass per chunk of `chunk_size` pulses, which bounds the memory of the temporary arrays
+        of each pass. The filled columns are added to the new table with `OptogeneticPulsesTable.add_pulses` without
+        copying. See `iter_pulses` for how epochs are expanded. The new table references the same
+        OptogeneticSitesTable as this table.
+        """
+        name, description, chunk_size = getargs("name", "description", "chunk_size", kwargs)
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer, got %d" % chunk_size)
+        sites_table = self.optogenetic_sites.table
+        pulses_table = OptogeneticPulsesTable(
+            name=name,
+            description=description,
+            target_tables={"optogenetic_sites": sites_table} if sites_table is not None else None,
+        )
+        schedule = _PulseSchedule(self)
+        pulses_table.add_pulses(**schedule.columns(range(len(schedule)), chunk_size))
+        return pulses_table
+
+    @classmethod
+    @docval(
+        {"name": "pulses_table", "type": TimeIntervals, "doc": "the OptogeneticPulsesTable to fit epochs to"},
+        {"name": "name", "type": str, "doc": "name of the OptogeneticEpochsTable", "default": "optogenetic_epochs"},
+        {
+            "name": "description",
+            "type": str,
+            "doc": "Description of the OptogeneticEpochsTable",
+            "default": "Optogenetic stimulation epochs fitted to the pulses of an OptogeneticPulsesTable.",
+        },
+        {
+            "name": "max_gap",
+            "type": (float, int),
+            "doc": (
+                "maximum interval between the starts of consecutive pulses of a train, in seconds. If None, 1.5 times "
+                "the shortest interval between the starts of consecutive pulses at the same sites."
+            ),
+            "default": None,
+        },
+        {
+            "name": "tolerance",
+            "type": (float, int),
+            "doc": "tolerance of the times of the pulses and trains of an epoch, in seconds",
+            "default": 1e-4,
+        },
+        returns="the fitted OptogeneticEpochsTable and the rows of the pulses that deviate from its schedule",
+        rtype=tuple,
+    )
+    def from_pulses(cls, **kwargs):
+        """
+        Fit the parameters of the epochs of an OptogeneticEpochsTable to the pulses of an OptogeneticPulsesTable.
+
+        This is the inverse of `to_pulses_table`. The pulses are grouped by their set of sites and sorted by start
+        time. The pulses of each group are split into trains where the interval between the starts of consecutive
+        pulses exceeds `max_gap` and where the power or wavelength changes, and consecutive trains with the same
+        number of pulses, period, and pulse length and evenly spaced starts, within `tolerance`, are grouped into
+        epochs, with stimulation on and the power, wavelength, and sites of their pulses. The period of an epoch is
+        fitted to the spacing of the pulses of all of its trains, and evenly spaced single pulses form one train.
+        Gaps and train parameters are found with vectorized operations on the columns, so 10^7 pulses are fitted in
+        seconds, in time linear in the number of pulses when each pulse has one site.
+
+        Also returns the rows of the pulses whose start time or duration differs by more than `tolerance` from those
+        of their pulse in the schedule of their epoch, e.g., pulses with timing jitter. The epochs are sorted by start
+        time; expanding them with `to_pulses_table` reproduces the pulses that do not deviate.
+        """
+        pulses_table, name, description, max_gap, tolerance = getargs(
+            "pulses_table", "name", "description", "max_gap", "tolerance", kwargs
+        )
+        start_time = _column_array(pulses_table.start_time, dtype=np.float64)
+        stop_time = _column_array(pulses_table.stop_time, dtype=np.float64)
+        power = _column_array(pulses_table.power_in_mW, dtype=np.float64)
+        wavelength = _column_array(pulses_table.wavelength_in_nm, dtype=np.float64)
+        sites = _column_array(pulses_table.optogenetic_sites, dtype=np.int64)
+        sites_offsets = _column_array(pulses_table.optogenetic_sites_index, dtype=np.int64)
+        codes, site_sets, site_set_offsets = _site_set_codes(sites, sites_offsets)
+
+        # sort the pulses by set of sites and start time; the sort is stable, so sorted pulses are not reordered
+        if np.all(start_time[1:] >= start_time[:-1]):
+            order = np.argsort(codes.astype(_index_dtype(len(site_set_offsets))), kind="stable")
+        else:
+            order = np.lexsort((start_time, codes))
+        group_stops = np.cumsum(np.bincount(codes, minlength=len(site_set_offsets)))
+
+        epochs = {key: [] for key in _FITTED_EPOCH_COLUMNS + ("power_in_mW", "wavelength_in_nm", "group")}
+        deviating = []
+        for group, (first, stop) in enumerate(zip(np.concatenate(([0], group_stops[:-1])), group_stops)):
+            rows = order[first:stop]
+            conditions = np.stack((power[rows], wavelength[rows]))
+            segment_starts = np.ones(len(rows), dtype=bool)
+            segment_starts[1:] = ~_close(conditions[:, 1:], conditions[:, :-1], 0.0).all(axis=0)
+            fit = _fit_epochs(start_time[rows], stop_time[rows], max_gap, tolerance, segment_starts=segment_starts)
+            first_pulses = rows[np.flatnonzero(np.diff(fit["epoch"], prepend=-1))]
+            for key in _FITTED_EPOCH_COLUMNS:
+                epochs[key].append(fit[key])
+            epochs["power_in_mW"].append(power[first_pulses])
+            epochs["wavelength_in_nm"].append(wavelength[first_pulses])
+            epochs["group"].append(np.full(len(first_pulses), group))
+            deviating.append(rows[fit["deviating"]])
+
+        columns = {key: np.concatenate(values) if values else np.empty(0) for key, values in epochs.items()}
+        epoch_order = np.argsort(columns["start_time"], kind="stable")
+        columns = {key: values[epoch_order] for key, values in columns.items()}
+        groups = columns.pop("group").astype(np.int64)
+        columns["stimulation_on"] = np.ones(len(groups), dtype=bool)
+
+        table = cls(
+            name=name,
+            description=description,
+            target_tables={"optogenetic_sites": pulses_table.optogenetic_sites.table},
+        )
+        _bulk_add_rows(table, columns, {"optogenetic_sites": _take_ragged(site_sets, site_set_offsets, groups)})
+        return table, np.sort(np.concatenate(deviating)) if deviating else np.empty(0, dtype=np.int64)
+
+    @docval(returns="the rows that fail each check", rtype=ValidationReport)
+    def validate(self):
+        """
+        Check that the rows of the table satisfy the invariants of the spec.
+
+        The checks, by name, are:
+
+        - ``stop_not_after_start``: the stop time is not after the start time.
+        - ``invalid_sites``: the row has no optogenetic sites or references a row that is not in the
+          OptogeneticSitesTable.
+        - ``overlapping_at_site``: the epoch starts before an earlier epoch at one of its sites stops.
+        - ``off_values_not_null``: stimulation is off, but a stimulation parameter is not 0 or NaN (or 0 or -1 for the
+          numbers of pulses and trains).
+        - ``on_values_invalid``: stimulation is on, but the pulse length or period is not positive, the number of
+          pulses per train or of trains is less than 1, the intertrain interval or the power is negative, the
+          wavelength is not positive, or any of these is NaN.
+        - ``period_shorter_than_pulse_length``: stimulation is on and the period is shorter than the pulse length.
+        - ``intertrain_interval_shorter_than_train``: stimulation is on with more than one train and the intertrain
+          interval is shorter than a train, so consecutive trains overlap.
+        - ``stimulation_exceeds_epoch``: stimulation is on and the last pulse stops after the stop time of the epoch.
+
+        Each check is a vectorized operation on the columns, and overlaps are found in one pass over the rows sorted by
+        site and start time, so validating millions of rows takes seconds.
+        """
+        stimulation_on = _column_array(self.stimulation_on, dtype=bool)
+        start_time = _column_array(self.start_time, dtype=np.float64)
+        stop_time = _column_array(self.stop_time, dtype=np.float64)
+        pulse_length = _column_array(self.pulse_length_in_ms, dtype=np.float64)
+        period = _column_array(self.period_in_ms, dtype=np.float64)
+        intertrain_interval = _column_array(self.intertrain_interval_in_ms, dtype=np.float64)
+        power = _column_array(self.power_in_mW, dtype=np.float64)
+        wavelength = _column_array(self.wavelength_in_nm, dtype=np.float64)
+        number_pulses = _column_array(self.number_pulses_per_pulse_train, dtype=np.int64)
+        number_trains = _column_array(self.number_trains, dtype=np.int64)
+
+        values = np.stack([pulse_length, period, intertrain_interval, power, wavelength])
+        not_null = ~(np.isnan(values) | (values == 0)).all(axis=0)
+        not_null |= ~np.isin(number_pulses, (0, -1)) | ~np.isin(number_trains, (0, -1))
+        # comparisons with NaN are False, so each condition is negated to flag NaN as invalid
+        on_invalid = ~(pulse_length > 0) | ~(period > 0) | ~(intertrain_interval >= 0) | ~(power >= 0)
+        on_invalid |= ~(wavelength > 0) | (number_pulses < 1) | (number_trains < 1)
+        train_length = (number_pulses - 1) * period + pulse_length
+        stimulation_length = (number_trains - 1) * intertrain_interval + train_length
+
+        report = ValidationReport(self._validate_intervals_and_sites())
+        report["off_values_not_null"] = np.flatnonzero(~stimulation_on & not_null)
+        report["on_values_invalid"] = np.flatnonzero(stimulation_on & on_invalid)
+        report["period_shorter_than_pulse_length"] = np.flatnonzero(stimulation_on & (period < pulse_length))
+        report["intertrain_interval_shorter_than_train"] = np.flatnonzero(
+            stimulation_on & (number_trains > 1) & (intertrain_interval < train_length)
+        )
+        report["stimulation_exceeds_epoch"] = np.flatnonzero(
+            stimulation_on & (start_time + stimulation_length / 1000.0 > stop_time + _TIME_TOLERANCE)
+        )
+        return report
+
+    @docval(
+        {
+            "name": "pulses_table",
+            "type": TimeIntervals,
+            "doc": (
+                "the OptogeneticPulsesTable of the pulses that were delivered. If None, the metrics are computed from "
+                "the pulse parameters of the epochs."
+            ),
+            "default": None,
+        },
+        returns="the summary metrics of each epoch",
+        rtype=pd.DataFrame,
+    )
+    def summary(self, **kwargs):
+        """
+        Compute summary metrics of the stimulation in each epoch.
+
+        Returns a pandas DataFrame indexed by the id of the epochs with the columns:
+
+        - ``num_pulses``: the number of pulses.
+        - ``stimulation_time_in_s``: the total duration of the pulses, in seconds.
+        - ``duty_cycle``: the fraction of the epoch during which stimulation was on.
+        - ``energy_in_mJ``: the energy delivered, i.e., the sum of the power times the duration of each pulse, in mJ.
+        - ``frequency_in_Hz``: the effective frequency, i.e., the number of pulses per second of the epoch.
+
+        Without `pulses_table`, the pulses are those defined by the parameters of the epochs with stimulation on (see
+        `iter_pulses`), and epochs with stimulation off have no pulses. With `pulses_table`, the pulses of each epoch
+        are the pulses of the table that start in ``[start_time, stop_time)`` of the epoch and share at least one of its
+        optogenetic sites. The pulses are grouped by their set of sites, and the pulses of each group are found for the
+        epochs that share a site with the group with binary searches on the pulses sorted by start time, and their
+        metrics are summed with cumulative sums, so summarizing 10^7 pulses takes less than a second.
+
+        The result is cached on the table, separately for each pulses table, and recomputed when rows are added to
+        either table. The returned DataFrame is a copy that can be modified.
+        """
+        pulses_table = getargs("pulses_table", kwargs)
+        cache = getattr(self, "_OptogeneticEpochsTable__summary_cache", None)
+        if cache is None:
+            cache = self.__summary_cache = dict()
+        key = (len(self), None if pulses_table is None else len(pulses_table))
+        cached = cache.get(id(pulses_table))
+        if cached is None or cached[0] is not pulses_table or cached[1] != key:
+            cached = (pulses_table, key, self.__summary(pulses_table))
+            cache[id(pulses_table)] = cached
+        return cached[2].copy()
+
+    def __summary(self, pulses_table):
+        start_time = _column_array(self.start_time, dtype=np.float64)
+        stop_time = _column_array(self.stop_time, dtype=np.float64)
+        if pulses_table is None:
+            stimulation_on = _column_array(self.stimulation_on, dtype=bool)
+            num_pulses = np.where(
+                stimulation_on,
+                _column_array(self.number_pulses_per_pulse_train, dtype=np.int64)
+                * _column_array(self.number_trains, dtype=np.int64),
+                0,
+            )
+            pulse_length = _column_array(self.pulse_length_in_ms, dtype=np.float64) / 1000.0
+            stimulation_time = np.where(stimulation_on, num_pulses * pulse_length, 0.0)
+            energy = np.where(stimulation_on, stimulation_time * _column_array(self.power_in_mW, dtype=np.float64), 0.0)
+        else:
+            all_start_time = _column_array(pulses_table.start_time, dtype=np.float64)
+            all_duration = _column_array(pulses_table.stop_time, dtype=np.float64) - all_start_time
+            all_energy = all_duration * _column_array(pulses_table.power_in_mW, dtype=np.float64)
+            num_pulses = np.zeros(len(start_time), dtype=np.int64)
+            stimulation_time = np.zeros(len(start_time))
+            energy = np.zeros(len(start_time))
+            for rows, epochs in _pulses_by_epoch_sites(pulses_table, self):
+                pulse_start_time, duration, pulse_energy = all_start_time[rows], all_duration[rows], all_energy[rows]
+                if np.any(pulse_start_time[1:] < pulse_start_time[:-1]):
+                    order = np.argsort(pulse_start_time, kind="stable")
+                    pulse_start_time, duration, pulse_energy = (
+                        pulse_start_time[order],
+                        duration[order],
+                        pulse_energy[order],
+                    )
+                lo = np.searchsorted(pulse_start_time, start_time[epochs], side="left")
+                hi = np.searchsorted(pulse_start_time, stop_time[epochs], side="left")
+                hi = np.maximum(hi, lo)
+                num_pulses[epochs] += hi - lo
+                # the sum over the pulses [lo, hi) of each epoch is the difference of the cumulative sums at hi and lo
+                cumulative_duration = np.concatenate(([0.0], np.cumsum(duration)))
+                cumulative_energy = np.concatenate(([0.0], np.cumsum(pulse_energy)))
+                stimulation_time[epochs] += cumulative_duration[hi] - cumulative_duration[lo]
+                energy[epochs] += cumulative_energy[hi] - cumulative_energy[lo]
+        epoch_duration = stop_time - start_time
+        with np.errstate(divide="ignore", invalid="ignore"):
+            duty_cycle = np.where(epoch_duration > 0, stimulation_time / epoch_duration, np.nan)
+            frequency = np.where(epoch_duration > 0, num_pulses / epoch_duration, np.nan)
+        return pd.DataFrame(
+            {
+                "num_pulses": num_pulses,
+                "stimulation_time_in_s": stimulation_time,
+                "duty_cycle": duty_cycle,
+                "energy_in_mJ": energy,
+                "frequency_in_Hz": frequency,
+            },
+            index=pd.Index(_column_array(self.id), name="id"),
+        )
+
+    def pulses_view(self):
+        """
+        Return a lazy, read-only OptogeneticPulsesView of the pulses defined by the parameters of the epochs.
+
+        No pulses are generated until they are accessed. See `iter_pulses` for how epochs are expanded.
+        """
+        return OptogeneticPulsesView(_PulseSchedule(self), sites_table=self.optogenetic_sites.table)
+
 
 @register_class("OptogeneticPulsesTable", "ndx-optogenetics")
-class OptogeneticPulsesTable(TimeIntervals):
+class OptogeneticPulsesTable(_OptogeneticIntervalsMixin, TimeIntervals):
     """
     General metadata about the optogenetic stimulation recorded on a per-pulse basis.
     """
@@ -131,12 +1475,578 @@ class OptogeneticPulsesTable(TimeIntervals):
         },
     )
 
+    __fields__ = (
+        "compact_columns",
+        "dictionary_values",
+        "dictionary_codes",
+        "tick_encoding",
+        "start_time_tick_deltas",
+        "start_time_tick_anchors",
+        "duration_tick_codes",
+        "duration_tick_values",
+    )
+
     @docval(
         {"name": "name", "type": str, "doc": "name of this OptogeneticPulsesTable"},
         {"name": "description", "type": str, "doc": "Description of this OptogeneticPulsesTable"},
         *get_docval(DynamicTable.__init__, "id", "columns", "colnames", "target_tables"),
+        {
+            "name": "compact_columns",
+            "type": "array_data",
+            "doc": (
+                "Runs (column, first, step, end) of the columns stored in compact form. Set by "
+                "`ndx_optogenetics.io.configure_compact_storage`."
+            ),
+            "default": None,
+        },
+        *get_docval(OptogeneticEpochsTable.__init__, "dictionary_values", "dictionary_codes"),
+        {
+            "name": "tick_encoding",
+            "type": "array_data",
+            "doc": (
+                "The timebase, in seconds, and block length of the start and stop times stored as ticks. Set by "
+                "`ndx_optogenetics.io.configure_tick_storage`."
+            ),
+            "default": None,
+        },
+        {
+            "name": "start_time_tick_deltas",
+            "type": "array_data",
+            "doc": "Difference of each start time to the previous start time, in ticks, or 0 at the start of a block",
+            "default": None,
+        },
+        {
+            "name": "start_time_tick_anchors",
+            "type": "array_data",
+            "doc": "Start time of the first row of each block, in ticks",
+            "default": None,
+        },
+        {
+            "name": "duration_tick_codes",
+            "type": "array_data",
+            "doc": "Code of the duration of each row into `duration_tick_values`",
+            "default": None,
+        },
+        {
+            "name": "duration_tick_values",
+            "type": "array_data",
+            "doc": "Distinct durations of the rows, in ticks",
+            "default": None,
+        },
         allow_positional=AllowPositional.WARNING,
     )
     def __init__(self, **kwargs):
+        compact_columns, dictionary_values, dictionary_codes = popargs(
+            "compact_columns", "dictionary_values", "dictionary_codes", kwargs
+        )
+        ticks = popargs(
+            "tick_encoding",
+            "start_time_tick_deltas",
+            "start_time_tick_anchors",
+            "duration_tick_codes",
+            "duration_tick_values",
+            kwargs,
+        )
         DynamicTable.__init__(self, **kwargs)
+        self.compact_columns = compact_columns
+        if compact_columns is not None:
+            # read the encoded columns lazily from their runs instead of from their datasets
+            from .io import _read_compact_columns
+
+            _read_compact_columns(self, compact_columns)
+        self._set_dictionary_columns(dictionary_values, dictionary_codes)
+        (
+            self.tick_encoding,
+            self.start_time_tick_deltas,
+            self.start_time_tick_anchors,
+            self.duration_tick_codes,
+            self.duration_tick_values,
+        ) = ticks
+        if self.tick_encoding is not None:
+            # compute the start and stop times lazily from their ticks instead of reading their datasets
+            from .io import _read_tick_columns
+
+            _read_tick_columns(self)
+
+    @docval(
+        {"name": "start_time", "type": "array_data", "doc": "Start time of each pulse, in seconds"},
+        {"name": "stop_time", "type": "array_data", "doc": "Stop time of each pulse, in seconds"},
+        {"name": "power_in_mW", "type": "array_data", "doc": "Power of the excitation source for each pulse, in mW"},
+        {"name": "wavelength_in_nm", "type": "array_data", "doc": "Wavelength of the excitation source, in nm"},
+        {
+            "name": "optogenetic_sites",
+            "type": "array_data",
+            "doc": (
+                "Row(s) of OptogeneticSitesTable stimulated by each pulse. Either a 1D array with one row index per "
+                "pulse, a 2D array with the same number of row indices per pulse, or, if `optogenetic_sites_index` "
+                "is given, the concatenated row indices of all pulses."
+            ),
+        },
+        {
+            "name": "optogenetic_sites_index",
+            "type": "array_data",
+            "doc": (
+                "End offset of the row indices of each pulse within `optogenetic_sites`, following the VectorIndex "
+                "convention, e.g., [1, 3] for the sites [0], [0, 1] given as `optogenetic_sites=[0, 0, 1]`."
+            ),
+            "default": None,
+        },
+        {
+            "name": "id",
+            "type": "array_data",
+            "doc": "IDs of the new rows. Defaults to consecutive integers following the last row.",
+            "default": None,
+        },
+    )
+    def add_pulses(self, **kwargs):
+        """
+        Add many pulses at once from arrays.
+
+        Each column, the `optogenetic_sites_index`, and the `id` are extended with a single array write instead of
+        validating and appending one row at a time as `add_row` does, so this is the recommended way to add
+        large numbers of pulses. The table must not have optional columns other than those listed here.
+        """
+        start_time, stop_time, power_in_mW, wavelength_in_nm, optogenetic_sites, optogenetic_sites_index, ids = getargs(
+            "start_time",
+            "stop_time",
+            "power_in_mW",
+            "wavelength_in_nm",
+            "optogenetic_sites",
+            "optogenetic_sites_index",
+            "id",
+            kwargs,
+        )
+        columns = {
+            "start_time": np.asarray(start_time, dtype=np.float64),
+            "stop_time": np.asarray(stop_time, dtype=np.float64),
+            "power_in_mW": np.asarray(power_in_mW, dtype=np.float64),
+            "wavelength_in_nm": np.asarray(wavelength_in_nm, dtype=np.float64),
+        }
+        ragged = {"optogenetic_sites": _as_ragged(optogenetic_sites, optogenetic_sites_index)}
+        _bulk_add_rows(self, columns, ragged, ids=ids)
+
+    @classmethod
+    @docval(
+        *get_docval(__init__, "name", "description"),
+        {
+            "name": "optogenetic_sites_table",
+            "type": DynamicTable,
+            "doc": "the OptogeneticSitesTable that the `optogenetic_sites` column references",
+        },
+        {
+            "name": "batches",
+            "type": Iterable,
+            "doc": (
+                "Iterable (e.g., a generator) of batches of pulses. Each batch is a dict of arrays with the keyword "
+                "arguments of `add_pulses` except `id`."
+            ),
+        },
+        {"name": "chunk_length", "type": int, "doc": "Number of rows per chunk of each dataset", "default": 65536},
+    )
+    def from_batches(cls, **kwargs):
+        """
+        Create an OptogeneticPulsesTable whose columns are written incrementally from a stream of batches of pulses.
+
+        Each column, the `optogenetic_sites_index`, and the `id` are backed by an `AbstractDataChunkIterator` that
+        pulls the batches from `batches` while the file is written, so pulses can be streamed from an acquisition
+        system into the file without buffering them all first. The ids are consecutive integers and the offsets of
+        the `optogenetic_sites_index` are accumulated across batches.
+
+        Write the file with ``io.write(nwbfile, exhaust_dci=False)`` so that all columns are written round-robin,
+        one batch at a time, which keeps memory bounded to a few batches. With the default ``exhaust_dci=True``,
+        hdmf writes the columns one after the other, which queues all batches in memory.
+
+        The returned table can only be written; its rows cannot be accessed before the file is written and read back.
+        """
+        from .io import set_pulse_stream
+
+        name, description, sites_table, batches, chunk_length = getargs(
+            "name", "description", "optogenetic_sites_table", "batches", "chunk_length", kwargs
+        )
+        table = cls(name=name, description=description, target_tables={"optogenetic_sites": sites_table})
+        set_pulse_stream(table, batches, chunk_length=chunk_length)
+        return table
+
+    @classmethod
+    @docval(
+        *get_docval(detect_pulses, "signal", "rate"),
+        *get_docval(from_batches.__func__, "optogenetic_sites_table"),
+        {
+            "name": "sites",
+            "type": (int, "array_data"),
+            "doc": "row(s) of the OptogeneticSitesTable stimulated by every pulse",
+        },
+        {"name": "power_in_mW", "type": (float, int), "doc": "power of the excitation source for every pulse, in mW"},
+        {"name": "wavelength_in_nm", "type": (float, int), "doc": "wavelength of the excitation source, in nm"},
+        {"name": "name", "type": str, "doc": "name of the OptogeneticPulsesTable", "default": "optogenetic_pulses"},
+        {
+            "name": "description",
+            "type": str,
+            "doc": "Description of the OptogeneticPulsesTable",
+            "default": "Optogenetic stimulation pulses detected in a TTL signal.",
+        },
+        *get_docval(detect_pulses, "t_start", "threshold", "bit", "chunk_length", "num_threads"),
+        {
+            "name": "fit_epochs",
+            "type": bool,
+            "doc": "whether to also fit an OptogeneticEpochsTable named 'optogenetic_epochs' to the pulses",
+            "default": False,
+        },
+        {
+            "name": "max_gap",
+            "type": (float, int),
+            "doc": (
+                "maximum interval between the starts of consecutive pulses of a train, in seconds, for fitting "
+                "epochs. If None, 1.5 times the shortest interval."
+            ),
+            "default": None,
+        },
+        {
+            "name": "tolerance",
+            "type": (float, int),
+            "doc": (
+                "tolerance of the times of the trains of an epoch, in seconds, for fitting epochs. If None, 2 samples."
+            ),
+            "default": None,
+        },
+        returns="the pulses table, or a tuple of the pulses table and the epochs table if `fit_epochs` is True",
+    )
+    def from_ttl(cls, **kwargs):
+        """
+        Create an OptogeneticPulsesTable from a TTL recording of the line that gates the excitation source.
+
+        The pulses are the intervals in which the line is high, detected in chunks, optionally in several threads,
+        with `ndx_optogenetics.ttl.detect_pulses`, e.g., from an `np.memmap` of hours of a 30-kHz digital line. All
+        pulses have the given sites, power, and wavelength, and are added to the table with `add_pulses`.
+
+        With ``fit_epochs=True``, an OptogeneticEpochsTable of regular pulse trains is also fitted to the pulses with
+        `OptogeneticEpochsTable.from_pulses`. Expanding these epochs with `OptogeneticEpochsTable.to_pulses_table`
+        reproduces the pulses within about `tolerance`.
+        """
+        name, description, sites_table, sites, power_in_mW, wavelength_in_nm = getargs(
+            "name", "description", "optogenetic_sites_table", "sites", "power_in_mW", "wavelength_in_nm", kwargs
+        )
+        fit_epochs, max_gap, tolerance = getargs("fit_epochs", "max_gap", "tolerance", kwargs)
+        detect_kwargs = {
+            key: kwargs[key] for key in ("signal", "rate", "t_start", "threshold", "bit", "chunk_length", "num_threads")
+        }
+        start_time, stop_time = detect_pulses(**detect_kwargs)
+        sites = np.atleast_1d(np.asarray(sites, dtype=np.int64))
+        num_pulses = len(start_time)
+
+        table = cls(name=name, description=description, target_tables={"optogenetic_sites": sites_table})
+        table.add_pulses(
+            start_time=start_time,
+            stop_time=stop_time,
+            power_in_mW=np.full(num_pulses, power_in_mW, dtype=np.float64),
+            wavelength_in_nm=np.full(num_pulses, wavelength_in_nm, dtype=np.float64),
+            optogenetic_sites=np.tile(sites, (num_pulses, 1)),
+        )
+        if not fit_epochs:
+            return table
+
+        if tolerance is None:
+            tolerance = 2.0 / detect_kwargs["rate"]
+        epochs_table, _ = OptogeneticEpochsTable.from_pulses(
+            table,
+            description="Optogenetic stimulation epochs fitted to the pulses detected in a TTL signal.",
+            max_gap=max_gap,
+            tolerance=tolerance,
+        )
+        return table, epochs_table
+
+    @docval(
+        {
+            "name": "epochs_table",
+            "type": OptogeneticEpochsTable,
+            "doc": "the epochs that the pulses should fall within. If None, pulses are not checked against epochs.",
+            "default": None,
+        },
+        returns="the rows that fail each check",
+        rtype=ValidationReport,
+    )
+    def validate(self, **kwargs):
+        """
+        Check that the rows of the table satisfy the invariants of the spec.
+
+        The checks, by name, are:
+
+        - ``stop_not_after_start``: the stop time is not after the start time.
+        - ``invalid_sites``: the pulse has no optogenetic sites or references a row that is not in the
+          OptogeneticSitesTable.
+        - ``overlapping_at_site``: the pulse starts before an earlier pulse at one of its sites stops.
+        - ``invalid_values``: the power is negative, the wavelength is not positive, or either is NaN.
+        - ``outside_stimulation_epochs``: only if `epochs_table` is given, the pulse is not contained in an epoch
+          of `epochs_table` with stimulation on that shares one of its optogenetic sites.
+
+        Each check is a vectorized operation on the columns. Overlaps are found in one pass over the pulses sorted by
+        site and start time, and containment, for the pulses with each set of sites, with binary searches on the epochs
+        at these sites sorted by start time, so validating 10^7 pulses takes seconds.
+        """
+        epochs_table = getargs("epochs_table", kwargs)
+        start_time = _column_array(self.start_time, dtype=np.float64)
+        stop_time = _column_array(self.stop_time, dtype=np.float64)
+        power = _column_array(self.power_in_mW, dtype=np.float64)
+        wavelength = _column_array(self.wavelength_in_nm, dtype=np.float64)
+
+        report = ValidationReport(self._validate_intervals_and_sites())
+        report["invalid_values"] = np.flatnonzero(~(power >= 0) | ~(wavelength > 0))
+        if epochs_table is not None:
+            # a pulse is contained in an epoch at one of its sites if such an epoch that starts at or before the pulse
+            # stops at or after it
+            epoch_start_time = _column_array(epochs_table.start_time, dtype=np.float64)
+            epoch_stop_time = _column_array(epochs_table.stop_time, dtype=np.float64)
+            contained = np.zeros(len(start_time), dtype=bool)
+            for rows, epochs in _pulses_by_epoch_sites(self, epochs_table, epochs_table._stimulation_rows()):
+                index = _IntervalIndex(epoch_start_time, epoch_stop_time, rows=epochs)
+                hi = np.searchsorted(index.start_time, start_time[rows], side="right")
+                max_stop_time = np.concatenate(([-np.inf], index.max_stop_time))[hi]
+                contained[rows] = max_stop_time + _TIME_TOLERANCE >= stop_time[rows]
+            report["outside_stimulation_epochs"] = np.flatnonzero(~contained)
+        return report
+
+    def _stimulus_trace(self, rate, t_start, t_stop, value, site, dtype=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive, got %s" % rate)
+        if t_stop < t_start:
+            raise ValueError("t_stop (%s) must not be smaller than t_start (%s)" % (t_stop, t_start))
+        if value is not None and value not in self.colnames:
+            raise ValueError("'%s' is not a column of %s '%s'" % (value, self.__class__.__name__, self.name))
+        start_time = _column_array(self.start_time, dtype=np.float64)
+        stop_time = _column_array(self.stop_time, dtype=np.float64)
+        values = None if value is None else _column_array(self[value], dtype=np.float64)
+        if site is not None:
+            sites = _column_array(self.optogenetic_sites, dtype=np.int64)
+            offsets = _column_array(self.optogenetic_sites_index, dtype=np.int64)
+            rows = np.repeat(np.arange(len(offsets)), np.diff(offsets, prepend=0))
+            rows = np.unique(rows[sites == site])
+            start_time, stop_time = start_time[rows], stop_time[rows]
+            values = None if values is None else values[rows]
+        num_samples = int(round((t_stop - t_start) * rate))
+        if dtype is None:
+            dtype = bool if value is None else np.float64
+        return _StimulusTrace(start_time, stop_time, values, rate, t_start, num_samples, dtype)
+
+    @docval(
+        {"name": "rate", "type": (float, int), "doc": "Sampling rate of the trace, in Hz, e.g., 30000.0"},
+        {"name": "t_start", "type": (float, int), "doc": "Time of the first sample, in seconds"},
+        {
+            "name": "t_stop",
+            "type": (float, int),
+            "doc": "End time of the trace, in seconds. The trace has ``round((t_stop - t_start) * rate)`` samples.",
+        },
+        {
+            "name": "value",
+            "type": str,
+            "doc": (
+                "Column whose value each pulse takes in the trace, e.g., 'power_in_mW' or 'wavelength_in_nm', or None "
+                "for a boolean trace that is True while any pulse is on"
+            ),
+            "default": "power_in_mW",
+            "allow_none": True,
+        },
+        {
+            "name": "site",
+            "type": int,
+            "doc": "Row of the OptogeneticSitesTable. If given, only the pulses that stimulate this site are included.",
+            "default": None,
+        },
+        {
+            "name": "chunk_size",
+            "type": int,
+            "doc": "Number of samples per chunk. If given, an iterator over chunks of the trace is returned.",
+            "default": None,
+        },
+        returns="the trace as a 1D array, or an iterator over consecutive 1D arrays of at most `chunk_size` samples",
+    )
+    def to_stimulus_trace(self, **kwargs):
+        """
+        Sample the pulses at a regular rate as a trace, e.g., of the power at 30 kHz for aligning with ephys data.
+
+        Sample ``i`` is at time ``t_start + i / rate`` and takes the value of the pulse whose [start_time, stop_time)
+        contains that time, or 0 (False) if no pulse does. The values of overlapping pulses, e.g., of pulses at
+        different sites at the same time, are added. The trace is computed with binary searches and cumulative sums
+        over only the pulses within each chunk, without a loop over pulses, so with `chunk_size` traces of hours of
+        recordings can be generated in bounded memory.
+        """
+        rate, t_start, t_stop, value, site, chunk_size = getargs(
+            "rate", "t_start", "t_stop", "value", "site", "chunk_size", kwargs
+        )
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer, got %d" % chunk_size)
+        trace = self._stimulus_trace(rate, t_start, t_stop, value, site)
+        if chunk_size is None:
+            # compute the trace in chunks to bound the size of the intermediate arrays
+            samples = np.empty(trace.num_samples, dtype=trace.dtype)
+            for s0 in range(0, trace.num_samples, _TRACE_CHUNK_SIZE):
+                s1 = min(s0 + _TRACE_CHUNK_SIZE, trace.num_samples)
+                samples[s0:s1] = trace.samples(s0, s1)
+            return samples
+        return (
+            trace.samples(s0, min(s0 + chunk_size, trace.num_samples)) for s0 in range(0, trace.num_samples, chunk_size)
+        )
+
+    @docval(
+        {"name": "name", "type": str, "doc": "Name of the TimeSeries"},
+        *get_docval(to_stimulus_trace, "rate", "t_start", "t_stop", "value", "site"),
+        {
+            "name": "description",
+            "type": str,
+            "doc": "Description of the TimeSeries",
+            "default": "Optogenetic stimulation sampled from the pulses of an OptogeneticPulsesTable.",
+        },
+        {
+            "name": "buffer_gb",
+            "type": (float, int),
+            "doc": "Maximum size of the samples computed at once while writing, in GB",
+            "default": None,
+        },
+        returns="the TimeSeries with the trace",
+        rtype=TimeSeries,
+    )
+    def to_stimulus_series(self, **kwargs):
+        """
+        Create a TimeSeries of the trace of `to_stimulus_trace` whose samples are computed while it is written.
+
+        The data is a `GenericDataChunkIterator`, so the trace is never held in memory as a whole. As in an
+        OptogeneticSeries, the power is stored in mW with a `conversion` to watts, and the wavelength in nm with a
+        `conversion` to meters. A boolean trace is stored as 0 and 1.
+        """
+        name, rate, t_start, t_stop, value, site, description, buffer_gb = getargs(
+            "name", "rate", "t_start", "t_stop", "value", "site", "description", "buffer_gb", kwargs
+        )
+        trace = self._stimulus_trace(rate, t_start, t_stop, value, site, dtype=np.uint8 if value is None else None)
+        unit, conversion = _TRACE_UNITS.get(value, ("n/a", 1.0))
+        return TimeSeries(
+            name=name,
+            data=_StimulusTraceIterator(trace, buffer_gb=buffer_gb),
+            unit=unit,
+            conversion=conversion,
+            rate=float(rate),
+            starting_time=float(t_start),
+            description=description,
+        )
+
+
+class OptogeneticPulsesView:
+    """
+    A lazy, read-only sequence of the pulses defined by the parameters of an OptogeneticEpochsTable.
+
+    The view can be used like an OptogeneticPulsesTable without storing the pulses: the times and metadata of the
+    selected pulses are computed on access from the epoch parameters with index arithmetic, in O(1) per pulse
+    regardless of the total number of pulses. Create it with `OptogeneticEpochsTable.pulses_view`.
+
+    - ``len(view)`` is the number of pulses.
+    - ``view[i]`` returns the pulse as a single-row pandas DataFrame.
+    - ``view[i:j]`` or ``view[[i, j, k]]`` returns a new view of the selected pulses.
+    - ``view["start_time"]`` returns a NumPy array with the values of the column for the pulses in the view, and
+      ``view[i, "start_time"]`` or ``view[i:j, "start_time"]`` the values for the selected pulses.
+    - ``view.to_dataframe()`` returns the pulses of the view as a pandas DataFrame.
+    - ``view.materialize()`` writes the pulses of the view into a new OptogeneticPulsesTable.
+
+    The view reflects the epochs table at the time the view was created.
+    """
+
+    colnames = ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm", "optogenetic_sites")
+
+    def __init__(self, schedule, sites_table=None, indices=None):
+        self.__schedule = schedule
+        self.__indices = range(len(schedule)) if indices is None else indices
+        self.sites_table = sites_table
+
+    def __len__(self):
+        return len(self.__indices)
+
+    def __repr__(self):
+        return "%s with %d pulses" % (self.__class__.__name__, len(self))
+
+    def __select(self, key):
+        if isinstance(key, slice):
+            return self.__indices[key]
+        key = np.asarray(key)
+        if key.dtype == bool:
+            if key.shape != (len(self),):
+                raise IndexError("Boolean index must have the same length as the view (%d)" % len(self))
+            key = np.flatnonzero(key)
+        if np.any((key < -len(self)) | (key >= len(self))):
+            raise IndexError("Pulse index out of range for %s of length %d" % (self.__class__.__name__, len(self)))
+        if isinstance(self.__indices, range):
+            return self.__indices.start + np.where(key < 0, key + len(self), key) * self.__indices.step
+        return self.__indices[key]
+
+    def __select_one(self, key):
+        if not -len(self) <= key < len(self):
+            raise IndexError("Pulse index out of range for %s of length %d" % (self.__class__.__name__, len(self)))
+        return self.__indices[key : key + 1 or None]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.__column(self.__indices, key)
+        if isinstance(key, tuple):
+            rows, column = key
+            if isinstance(rows, (int, np.integer)):
+                return self.__column(self.__select_one(rows), column)[0]
+            return self.__column(self.__select(rows), column)
+        if isinstance(key, (int, np.integer)):
+            return self.__view(self.__select_one(key)).to_dataframe()
+        return self.__view(self.__select(key))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __view(self, indices):
+        return OptogeneticPulsesView(self.__schedule, sites_table=self.sites_table, indices=indices)
+
+    def __column(self, indices, column):
+        if column not in self.colnames:
+            raise KeyError("'%s' is not a column of %s" % (column, self.__class__.__name__))
+        pulses = self.__schedule.pulses(np.asarray(indices, dtype=np.int64))
+        if column == "optogenetic_sites":
+            return _split_ragged(pulses["optogenetic_sites"], pulses["optogenetic_sites_index"])
+        return pulses[column]
+
+    def to_dataframe(self):
+        """Compute the pulses of this view and return them as a pandas DataFrame indexed by pulse number."""
+        indices = np.asarray(self.__indices, dtype=np.int64)
+        pulses = self.__schedule.pulses(indices)
+        return pd.DataFrame(
+            {
+                "start_time": pulses["start_time"],
+                "stop_time": pulses["stop_time"],
+                "power_in_mW": pulses["power_in_mW"],
+                "wavelength_in_nm": pulses["wavelength_in_nm"],
+                "optogenetic_sites": _split_ragged(pulses["optogenetic_sites"], pulses["optogenetic_sites_index"]),
+            },
+            index=pd.Index(indices, name="id"),
+        )
+
+    @docval(
+        *get_docval(OptogeneticEpochsTable.to_pulses_table, "name", "description"),
+        {
+            "name": "chunk_size",
+            "type": int,
+            "doc": "Maximum number of pulses to compute at a time.",
+            "default": 1_000_000,
+        },
+    )
+    def materialize(self, **kwargs):
+        """
+        Compute the pulses of this view and write them into a new OptogeneticPulsesTable, in chunks.
 
+        The columns of the new table are allocated once and filled with the pulses of one chunk at a time, as in
+        `OptogeneticEpochsTable.to_pulses_table`. The new table references the same OptogeneticSitesTable as the epochs
+        table of this view. The ids of the rows of the new table are the pulse numbers.
+        """
+        name, description, chunk_size = getargs("name", "description", "chunk_size", kwargs)
+        pulses_table = OptogeneticPulsesTable(
+            name=name,
+            description=description,
+            target_tables={"optogenetic_sites": self.sites_table} if self.sites_table is not None else None,
+        )
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer, got %d" % chunk_size)
+        pulses_table.add_pulses(
+            id=np.asarray(self.__indices, dtype=np.int64), **self.__schedule.columns(self.__indices, chunk_size)
+        )
+        return pulses_table
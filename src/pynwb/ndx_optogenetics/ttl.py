@@ -0,0 +1,113 @@
+"""Detection of optogenetic stimulation pulses in TTL recordings of the gating signal of an excitation source."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from hdmf.utils import docval, getargs
+
+# default number of samples per chunk of the signal
+DEFAULT_TTL_CHUNK_LENGTH = 2**22
+
+
+def _high(samples, threshold, bit):
+    """Return whether the line is high at each sample of a chunk of the signal."""
+    if bit is not None:
+        return (samples >> bit) & 1 == 1
+    if threshold is not None:
+        return samples > threshold
+    return samples != 0
+
+
+def _chunk_edges(signal, start, stop, threshold, bit):
+    """
+    Find the rising and falling edges of the line in the samples [start, stop) of the signal.
+
+    The chunk is read with the sample before it, so an edge between the last sample of the previous chunk and the
+    first sample of this chunk is found in this chunk and in no other. The line is low before the first sample of the
+    signal. Returns the samples at which the line goes high and low.
+    """
+    if start == 0:
+        high = np.concatenate(([False], _high(np.asarray(signal[:stop]), threshold, bit)))
+    else:
+        high = _high(np.asarray(signal[start - 1 : stop]), threshold, bit)
+    rising = np.flatnonzero(high[1:] & ~high[:-1]) + start
+    falling = np.flatnonzero(~high[1:] & high[:-1]) + start
+    return rising, falling
+
+
+@docval(
+    {
+        "name": "signal",
+        "type": "array_data",
+        "doc": (
+            "1D digital or analog signal of the line that gates the excitation source, e.g., an `np.memmap` of a "
+            "binary file or an HDF5 dataset"
+        ),
+    },
+    {"name": "rate", "type": (float, int), "doc": "sampling rate of the signal, in Hz"},
+    {"name": "t_start", "type": (float, int), "doc": "time of the first sample, in seconds", "default": 0.0},
+    {
+        "name": "threshold",
+        "type": (float, int),
+        "doc": "the line is high where the signal is above this value. If None, where the signal is not zero.",
+        "default": None,
+    },
+    {
+        "name": "bit",
+        "type": int,
+        "doc": "the bit of the line in an integer signal of several digital lines. If given, `threshold` is ignored.",
+        "default": None,
+    },
+    {
+        "name": "chunk_length",
+        "type": int,
+        "doc": "number of samples per chunk of the signal",
+        "default": DEFAULT_TTL_CHUNK_LENGTH,
+    },
+    {"name": "num_threads", "type": int, "doc": "number of threads to process the chunks with", "default": 1},
+    returns="the start and stop time of each pulse, in seconds",
+    rtype=tuple,
+    is_method=False,
+)
+def detect_pulses(**kwargs):
+    """
+    Detect the pulses in a TTL signal as the intervals in which the line is high.
+
+    The signal is read and processed in chunks of `chunk_length` samples, so signals of billions of samples, e.g.,
+    hours of a 30-kHz digital line mapped from a binary file with `np.memmap`, are processed in bounded memory. The
+    rising and falling edges of each chunk are found with vectorized comparisons of consecutive samples, including
+    the last sample of the previous chunk, so pulses that span chunk boundaries are detected once. With `num_threads`
+    greater than 1, the chunks are processed in a thread pool; NumPy releases the GIL for these operations.
+
+    A pulse starts at the first sample at which the line is high and stops at the first sample after it at which the
+    line is low, i.e., ``t_start + sample / rate``. A pulse that is still on at the end of the signal stops at the end
+    of the signal, ``t_start + len(signal) / rate``.
+    """
+    signal, rate, t_start, threshold, bit, chunk_length, num_threads = getargs(
+        "signal", "rate", "t_start", "threshold", "bit", "chunk_length", "num_threads", kwargs
+    )
+    if isinstance(signal, (list, tuple)):
+        signal = np.asarray(signal)
+    rate, t_start = float(rate), float(t_start)
+    if not rate > 0:
+        raise ValueError("rate must be positive, got %s" % rate)
+    if chunk_length < 1:
+        raise ValueError("chunk_length must be a positive integer, got %d" % chunk_length)
+    if num_threads < 1:
+        raise ValueError("num_threads must be a positive integer, got %d" % num_threads)
+    if len(np.shape(signal)) != 1:
+        raise ValueError("signal must be 1D, got shape %s" % (np.shape(signal),))
+    if bit is not None and not np.issubdtype(signal.dtype, np.integer):
+        raise ValueError("bit can be given only for an integer signal, got dtype %s" % signal.dtype)
+
+    num_samples = len(signal)
+    bounds = list(range(0, num_samples, chunk_length)) + [num_samples]
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    with ThreadPoolExecutor(max_workers=max(1, min(num_threads, len(chunks)))) as executor:
+        edges = list(executor.map(lambda chunk: _chunk_edges(signal, *chunk, threshold, bit), chunks))
+    rising = np.concatenate([np.empty(0, dtype=np.int64)] + [r for r, _ in edges])
+    falling = np.concatenate([np.empty(0, dtype=np.int64)] + [f for _, f in edges])
+    if len(falling) < len(rising):
+        # the line is high at the end of the signal
+        falling = np.append(falling, num_samples)
+    return t_start + rising / rate, t_start + falling / rate
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from ndx_optogenetics import OptogeneticEpochsTable
+from ndx_optogenetics.analysis import align_to_pulses
+
+from .test_optogenetics import _make_nwbfile, _make_epochs_table
+
+
+def _brute_force(event_times, onsets, window):
+    return [np.sort(event_times[(event_times >= t + window[0]) & (event_times < t + window[1])]) - t for t in onsets]
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_align_to_pulses(num_threads):
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_epochs_table(sites_table).to_pulses_table()
+    rng = np.random.default_rng(0)
+    event_times = rng.uniform(-1, 16, 2000)
+    alignment = align_to_pulses(pulses_table, event_times, window=(-0.05, 0.1), num_threads=num_threads)
+
+    assert len(alignment) == 12
+    np.testing.assert_array_equal(alignment.pulses, np.arange(12))
+    onsets = np.asarray(pulses_table.start_time.data)
+    for i, expected in enumerate(_brute_force(event_times, onsets, (-0.05, 0.1))):
+        np.testing.assert_allclose(alignment[i], expected)
+    # the event indices refer to the unsorted event times
+    np.testing.assert_allclose(
+        event_times[alignment.event_indices] - np.repeat(alignment.onsets, alignment.counts), alignment.relative_times
+    )
+
+
+def test_align_to_pulses_sites_and_groups():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    pulses_table = epochs_table.to_pulses_table()
+    event_times = np.arange(0, 15, 0.01)
+
+    alignment = align_to_pulses(pulses_table, event_times, sites=[1], epochs_table=epochs_table)
+    np.testing.assert_array_equal(alignment.pulses, np.arange(6, 12))
+    np.testing.assert_array_equal(alignment.sites, [1] * 6)
+    assert alignment.conditions["epoch"].tolist() == [2] * 6
+
+    alignment = align_to_pulses(pulses_table, event_times, epochs_table=epochs_table)
+    np.testing.assert_allclose(alignment.conditions["frequency_in_Hz"], 10.0)
+    groups = alignment.groupby(["site", "power_in_mW"])
+    assert sorted(groups) == [(0, 50.0), (0, 77.0), (1, 50.0)]
+    np.testing.assert_array_equal(groups[(0, 50.0)].pulses, np.arange(6, 12))
+    np.testing.assert_array_equal(groups[(1, 50.0)].pulses, np.arange(6, 12))
+    assert groups[(0, 77.0)][0].tolist() == alignment[0].tolist()
+    assert sorted(alignment.groupby("epoch")) == [(0,), (2,)]
+
+    with pytest.raises(ValueError, match="cannot group by duration"):
+        alignment.groupby("duration")
+    with pytest.raises(ValueError, match="window"):
+        align_to_pulses(pulses_table, event_times, window=(0.1, -0.1))
+
+
+def test_align_to_pulses_overlapping_epochs_at_other_sites():
+    _, sites_table = _make_nwbfile()
+    epochs_table = OptogeneticEpochsTable(
+        name="optogenetic_epochs", description="epochs", target_tables={"optogenetic_sites": sites_table}
+    )
+    stimulation = dict(
+        stimulation_on=True,
+        pulse_length_in_ms=5.0,
+        number_trains=1,
+        intertrain_interval_in_ms=0.0,
+        power_in_mW=10.0,
+        wavelength_in_nm=473.0,
+    )
+    epochs_table.add_row(
+        start_time=0.0,
+        stop_time=1.0,
+        period_in_ms=50.0,
+        number_pulses_per_pulse_train=5,
+        optogenetic_sites=[0],
+        **stimulation,
+    )
+    epochs_table.add_row(
+        start_time=0.01,
+        stop_time=1.0,
+        period_in_ms=100.0,
+        number_pulses_per_pulse_train=3,
+        optogenetic_sites=[1],
+        **stimulation,
+    )
+    # a later control epoch at site 0 is not the epoch of the pulses at site 0
+    epochs_table.add_row(
+        start_time=0.1,
+        stop_time=1.0,
+        stimulation_on=False,
+        pulse_length_in_ms=np.nan,
+        period_in_ms=np.nan,
+        number_pulses_per_pulse_train=-1,
+        number_trains=-1,
+        intertrain_interval_in_ms=np.nan,
+        power_in_mW=np.nan,
+        wavelength_in_nm=np.nan,
+        optogenetic_sites=[0],
+    )
+    pulses_table = epochs_table.to_pulses_table()
+    alignment = align_to_pulses(pulses_table, np.arange(0, 1, 0.001), epochs_table=epochs_table)
+    assert alignment.conditions["epoch"].tolist() == [0] * 5 + [1] * 3
+    np.testing.assert_allclose(alignment.conditions["frequency_in_Hz"], [20.0] * 5 + [10.0] * 3)
+    alignment = align_to_pulses(pulses_table, np.arange(0, 1, 0.001), sites=0, epochs_table=epochs_table)
+    assert alignment.conditions["epoch"].tolist() == [0] * 5
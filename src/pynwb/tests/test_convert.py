@@ -0,0 +1,183 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+from pynwb import NWBHDF5IO
+
+from ndx_optogenetics import convert
+from ndx_optogenetics.convert import convert_sessions, main, parse_definitions
+
+DEFINITIONS = {
+    "excitation_source_models": [
+        {
+            "name": "laser model",
+            "manufacturer": "Omicron",
+            "source_type": "laser",
+            "excitation_mode": "one-photon",
+        },
+        {
+            "name": "unused model",
+            "manufacturer": "Omicron",
+            "source_type": "laser",
+            "excitation_mode": "one-photon",
+        },
+    ],
+    "excitation_sources": [{"name": "laser", "model": "laser model", "power_in_W": 0.077}],
+    "optical_fiber_models": [{"name": "fiber model", "manufacturer": "Optogenix", "numerical_aperture": 0.39}],
+    "optical_fibers": [{"name": "fiber", "model": "fiber model", "fiber_insertion": {"depth_in_mm": 2.0}}],
+    "viral_vectors": [
+        {
+            "name": "virus",
+            "construct_name": "AAV-EF1a-DIO-hChR2(H134R)-EYFP",
+            "manufacturer": "UNC Vector Core",
+            "titer_in_vg_per_ml": 1.0e12,
+        }
+    ],
+    "viral_vector_injections": [
+        {
+            "name": "injection",
+            "location": "GPe",
+            "hemisphere": "right",
+            "reference": "Bregma at the cortical surface",
+            "ap_in_mm": -1.5,
+            "ml_in_mm": 3.2,
+            "dv_in_mm": -6.0,
+            "volume_in_uL": 0.45,
+            "viral_vector": "virus",
+        }
+    ],
+    "effectors": [{"name": "effector", "label": "hChR2-EYFP", "viral_vector_injection": "injection"}],
+}
+
+
+def _session(i, **kwargs):
+    session = {
+        "path": "session%d.nwb" % i,
+        "session_description": "session %d" % i,
+        "identifier": "session%d" % i,
+        "session_start_time": "2026-01-01T10:00:00+00:00",
+        "stimulation_software": "FSGUI 2.0",
+        "sites": [{"excitation_source": "laser", "optical_fiber": "fiber", "effector": "effector"}],
+        "epochs": [
+            {
+                "start_time": 0.0,
+                "stop_time": 10.0,
+                "stimulation_on": True,
+                "pulse_length_in_ms": 10.0,
+                "period_in_ms": 100.0,
+                "number_pulses_per_pulse_train": 10,
+                "number_trains": 1,
+                "intertrain_interval_in_ms": 0.0,
+                "power_in_mW": 77.0,
+                "wavelength_in_nm": 488.0,
+                "optogenetic_sites": [0],
+            }
+        ],
+        "pulses": {
+            "start_time": [0.0, 0.1],
+            "stop_time": [0.01, 0.11],
+            "power_in_mW": [77.0, 77.0],
+            "wavelength_in_nm": [488.0, 488.0],
+            "optogenetic_sites": [0, 0],
+        },
+    }
+    session.update(kwargs)
+    return session
+
+
+@pytest.mark.parametrize("max_workers", [0, 2])
+def test_convert_sessions(tmp_path, max_workers):
+    sessions = [_session(0), _session(1, sites=[{"effector": "missing"}]), _session(2)]
+    completed = []
+    results = convert_sessions(
+        sessions,
+        DEFINITIONS,
+        max_workers=max_workers,
+        output_dir=str(tmp_path),
+        callback=lambda i, result: completed.append(i),
+    )
+    assert sorted(completed) == [0, 1, 2]
+    assert [result.succeeded for result in results] == [True, False, True]
+    assert "effectors 'missing' is not defined" in results[1].error
+    assert not (tmp_path / "session1.nwb").exists()
+    assert all(result.time_in_s > 0 for result in results)
+
+    with NWBHDF5IO(results[2].path, mode="r") as io:
+        nwbfile = io.read()
+        assert nwbfile.identifier == "session2"
+        assert set(nwbfile.device_models) == {"laser model", "fiber model"}
+        assert set(nwbfile.devices) == {"laser", "fiber"}
+        metadata = nwbfile.lab_meta_data["optogenetic_experiment_metadata"]
+        assert metadata.optogenetic_sites_table[0, "effector"].name == "effector"
+        assert metadata.optogenetic_effectors.effectors["effector"].viral_vector_injection.name == "injection"
+        assert len(nwbfile.intervals["optogenetic_epochs"]) == 1
+        np.testing.assert_array_equal(nwbfile.intervals["optogenetic_pulses"].start_time.data[:], [0.0, 0.1])
+
+
+def test_convert_sessions_invalid_paths_keep_files(tmp_path):
+    (tmp_path / "unrelated.txt").write_text("keep")
+    (tmp_path / "existing.nwb").write_text("keep")
+    sessions = [_session(0, path=""), _session(1), _session(2, path="existing.nwb", sites=[{"effector": "missing"}])]
+    del sessions[1]["path"]
+    results = convert_sessions(sessions, DEFINITIONS, max_workers=0, output_dir=str(tmp_path))
+    assert [result.error for result in results[:2]] == ["ValueError: the session spec has no 'path'"] * 2
+    assert "effectors 'missing' is not defined" in results[2].error
+    assert (tmp_path / "unrelated.txt").read_text() == "keep"
+    assert (tmp_path / "existing.nwb").read_text() == "keep"
+
+
+def test_convert_sessions_duplicate_paths(tmp_path):
+    sessions = [_session(0), _session(1, path="session0.nwb"), _session(2), _session(3, path="./sub/../session0.nwb")]
+    (tmp_path / "sub").mkdir()
+    results = convert_sessions(sessions, DEFINITIONS, max_workers=2, output_dir=str(tmp_path))
+    assert [result.succeeded for result in results] == [False, False, True, False]
+    assert "is also the output path of sessions 1, 3" in results[0].error
+    assert not (tmp_path / "session0.nwb").exists()
+
+
+def _crash_on_identifier(session, definitions):
+    if session["identifier"] == "crash":
+        os._exit(1)
+    return _build_nwbfile(session, definitions)
+
+
+_build_nwbfile = convert.build_nwbfile
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the patch must be inherited by the workers")
+def test_convert_sessions_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, "build_nwbfile", _crash_on_identifier)
+    sessions = [_session(i) for i in range(6)]
+    sessions[2]["identifier"] = "crash"
+    results = convert_sessions(sessions, DEFINITIONS, max_workers=2, output_dir=str(tmp_path))
+    assert [result.succeeded for result in results] == [True, True, False, True, True, True]
+    assert "BrokenProcessPool" in results[2].error
+
+
+def test_parse_definitions_invalid_reference():
+    definitions = dict(DEFINITIONS, effectors=[{"name": "effector", "label": "x", "viral_vector_injection": "no"}])
+    with pytest.raises(ValueError, match="refers to viral_vector_injection 'no'"):
+        parse_definitions(definitions)
+    with pytest.raises(ValueError, match="unknown kinds of definitions: lasers"):
+        parse_definitions({"lasers": []})
+
+
+def test_main(tmp_path, capsys):
+    pulses = _session(0)["pulses"]
+    np.savez(tmp_path / "pulses.npz", **pulses)
+    batch = {
+        "definitions": DEFINITIONS,
+        "sessions": [_session(0, pulses=str(tmp_path / "pulses.npz")), _session(1, stimulation_software=None)],
+    }
+    with open(tmp_path / "batch.json", "w") as f:
+        json.dump(batch, f)
+
+    assert main([str(tmp_path / "batch.json"), "-j", "1", "-o", str(tmp_path), "--configure-io"]) == 1
+    captured = capsys.readouterr()
+    assert "converted 1 of 2 sessions" in captured.out
+    assert "FAILED" in captured.err
+    with NWBHDF5IO(tmp_path / "session0.nwb", mode="r") as io:
+        pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert pulses_table.start_time.data.compression == "gzip"
@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+
+def _run(code):
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_import_registers_custom_classes():
+    _run(
+        "import ndx_optogenetics\n"
+        "from pynwb import get_class\n"
+        "from ndx_optogenetics.optogenetics import OptogeneticPulsesTable\n"
+        "assert get_class('OptogeneticPulsesTable', 'ndx-optogenetics') is OptogeneticPulsesTable\n"
+        "assert not ndx_optogenetics._loaded\n"
+        "from ndx_optogenetics import OptogeneticExperimentMetadata, OptogeneticSitesTable\n"
+        "assert ndx_optogenetics._loaded\n"
+        # the generated class uses the custom class that was registered before it was generated
+        "from hdmf.utils import get_docval\n"
+        "args = {a['name']: a for a in get_docval(OptogeneticExperimentMetadata.__init__)}\n"
+        "assert args['optogenetic_sites_table']['type'] is OptogeneticSitesTable\n"
+    )
+
+
+def test_read_after_import_uses_custom_classes(tmp_path):
+    from pynwb import NWBHDF5IO
+
+    from .test_optogenetics import _make_nwbfile, _make_pulses_table
+
+    nwbfile, sites_table = _make_nwbfile()
+    nwbfile.add_time_intervals(_make_pulses_table(sites_table))
+    path = tmp_path / "test_read_after_import.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    _run(
+        "import ndx_optogenetics\n"
+        "from pynwb import NWBHDF5IO\n"
+        "with NWBHDF5IO(%r, mode='r') as io:\n"
+        "    pulses_table = io.read().intervals['optogenetic_pulses']\n"
+        "    assert isinstance(pulses_table, ndx_optogenetics.OptogeneticPulsesTable)\n" % str(path)
+    )
+
+
+def test_import_submodule_loads_namespace():
+    _run(
+        "from ndx_optogenetics.optogenetics import OptogeneticPulsesTable\n"
+        "import ndx_optogenetics\n"
+        "assert ndx_optogenetics.OptogeneticPulsesTable is OptogeneticPulsesTable\n"
+    )
+
+
+def test_unknown_attribute():
+    _run(
+        "import ndx_optogenetics\n"
+        "try:\n"
+        "    ndx_optogenetics.NotAClass\n"
+        "except AttributeError:\n"
+        "    pass\n"
+        "else:\n"
+        "    raise AssertionError\n"
+        "assert not ndx_optogenetics._loaded\n"
+    )
@@ -0,0 +1,659 @@
+import numpy as np
+import pytest
+from hdmf.backends.hdf5 import HDF5IO, H5DataIO
+from hdmf.utils import get_docval
+from pynwb import NWBHDF5IO
+
+from ndx_optogenetics import OptogeneticPulsesTable
+from ndx_optogenetics.io import (
+    CodedArray,
+    RunArray,
+    TickArray,
+    _encode_runs,
+    configure_compact_storage,
+    configure_dictionary_storage,
+    configure_io,
+    configure_tick_storage,
+    memmap_columns,
+    open_zarr_tables,
+    read_time_window,
+)
+
+from .test_optogenetics import _make_nwbfile, _make_pulses_table, _make_epochs_table
+
+
+def _add_pulses(pulses_table, num_pulses):
+    start_time = np.arange(num_pulses) * 0.05
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + 0.01,
+        power_in_mW=np.full(num_pulses, 5.0),
+        wavelength_in_nm=np.full(num_pulses, 473.0),
+        optogenetic_sites=np.arange(num_pulses) % 2,
+    )
+
+
+def test_configure_io_hdf5(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 10000)
+    configure_io(pulses_table, backend="hdf5", target_chunk_bytes=8 * 1000)
+    assert isinstance(pulses_table.start_time.data, H5DataIO)
+    assert isinstance(pulses_table.optogenetic_sites_index.data, H5DataIO)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_io.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert read_pulses_table.start_time.data.chunks == (1000,)
+        assert read_pulses_table.start_time.data.compression == "gzip"
+        assert read_pulses_table.start_time.data.shuffle
+        assert read_pulses_table.start_time.data.maxshape == (None,)
+        assert read_pulses_table.id.data.chunks is not None
+        assert read_pulses_table.optogenetic_sites_index.data.chunks is not None
+        np.testing.assert_array_equal(read_pulses_table.start_time.data[:], np.arange(10000) * 0.05)
+        assert read_pulses_table[9999, "optogenetic_sites"].index.tolist() == [1]
+
+
+def test_configure_io_skips_empty_and_wrapped_columns():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    epochs_table.start_time.transform(lambda data: H5DataIO(np.asarray(data)))
+    wrapped = epochs_table.start_time.data
+    configure_io(epochs_table)
+    assert epochs_table.start_time.data is wrapped
+    assert isinstance(epochs_table.stimulation_on.data, H5DataIO)
+
+    pulses_table = _make_pulses_table(sites_table)
+    configure_io(pulses_table)
+    assert pulses_table.start_time.data == []
+
+
+def test_configure_io_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr")
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 10000)
+    configure_io(pulses_table, backend="zarr", target_chunk_bytes=8 * 1000)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_io.nwb.zarr"
+    with hdmf_zarr.NWBZarrIO(str(path), mode="w") as io:
+        io.write(nwbfile)
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert read_pulses_table.start_time.data.chunks == (1000,)
+        np.testing.assert_array_equal(read_pulses_table.start_time.data[:], np.arange(10000) * 0.05)
+
+
+def test_configure_io_invalid_backend():
+    _, sites_table = _make_nwbfile()
+    with pytest.raises(ValueError, match="backend"):
+        configure_io(_make_pulses_table(sites_table), backend="netcdf")
+
+
+def _pulse_batches(num_batches, batch_size, log=None):
+    for i in range(num_batches):
+        if log is not None:
+            log.append(i)
+        start_time = (np.arange(batch_size) + i * batch_size) * 0.05
+        yield dict(
+            start_time=start_time,
+            stop_time=start_time + 0.01,
+            power_in_mW=np.full(batch_size, float(i)),
+            wavelength_in_nm=np.full(batch_size, 473.0),
+            optogenetic_sites=np.tile([0, 1], batch_size),
+            optogenetic_sites_index=np.arange(1, batch_size + 1) * 2,
+        )
+
+
+@pytest.mark.parametrize("configured", [False, True])
+def test_from_batches(tmp_path, configured):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = OptogeneticPulsesTable.from_batches(
+        name="optogenetic_pulses",
+        description="Streamed pulses",
+        optogenetic_sites_table=sites_table,
+        batches=_pulse_batches(10, 1000),
+        chunk_length=500,
+    )
+    if configured:
+        configure_io(pulses_table)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_from_batches.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile, exhaust_dci=False)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert len(read_pulses_table) == 10000
+        np.testing.assert_array_equal(read_pulses_table.id.data[:], np.arange(10000))
+        np.testing.assert_allclose(read_pulses_table.start_time.data[:], np.arange(10000) * 0.05)
+        np.testing.assert_array_equal(read_pulses_table.power_in_mW.data[999:1001], [0.0, 1.0])
+        np.testing.assert_array_equal(read_pulses_table.optogenetic_sites_index.data[:], np.arange(1, 10001) * 2)
+        assert read_pulses_table[9999, "optogenetic_sites"].index.tolist() == [0, 1]
+        assert read_pulses_table.start_time.data.maxshape == (None,)
+        assert (read_pulses_table.start_time.data.compression == "gzip") == configured
+
+
+def test_from_batches_reads_batches_incrementally():
+    nwbfile, sites_table = _make_nwbfile()
+    log = []
+    pulses_table = OptogeneticPulsesTable.from_batches(
+        name="optogenetic_pulses",
+        description="Streamed pulses",
+        optogenetic_sites_table=sites_table,
+        batches=_pulse_batches(5, 100, log=log),
+    )
+    nwbfile.add_time_intervals(pulses_table)
+    assert log == []
+
+    # batches are read from the stream only when the next chunk of a column is requested
+    next(pulses_table.start_time.data)
+    assert log == [0]
+    next(pulses_table.stop_time.data)
+    assert log == [0]
+    next(pulses_table.start_time.data)
+    assert log == [0, 1]
+
+
+def test_from_batches_invalid_sites():
+    _, sites_table = _make_nwbfile()
+    batch = next(_pulse_batches(1, 10))
+    batch["optogenetic_sites"] = np.tile([0, 2], 10)
+    pulses_table = OptogeneticPulsesTable.from_batches(
+        name="optogenetic_pulses", description="Streamed pulses", optogenetic_sites_table=sites_table, batches=[batch]
+    )
+    with pytest.raises(ValueError, match="references rows \\[2\\]"):
+        next(pulses_table.start_time.data)
+
+
+def _add_pulse_trains(pulses_table, num_trains, train_length):
+    pulse = np.arange(num_trains * train_length)
+    start_time = (pulse // train_length) * 2.0 + (pulse % train_length) * 0.001
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + 0.0005,
+        power_in_mW=np.repeat(np.arange(num_trains) % 3 + 1.0, train_length),
+        wavelength_in_nm=np.full(len(pulse), 473.0),
+        optogenetic_sites=np.zeros(len(pulse), dtype=int),
+    )
+    return pulses_table.to_dataframe()
+
+
+@pytest.mark.parametrize("fallback", [True, False])
+def test_configure_compact_storage(tmp_path, fallback):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    expected = _add_pulse_trains(pulses_table, 20, 500)
+    encoded = configure_compact_storage(pulses_table, fallback=fallback)
+    assert encoded == [
+        "id",
+        "start_time",
+        "stop_time",
+        "power_in_mW",
+        "wavelength_in_nm",
+        "optogenetic_sites",
+        "optogenetic_sites_index",
+    ]
+    # one run per train for the start times and the power, and one run for each other column
+    assert pulses_table.compact_columns.shape == (45, 4)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_compact_storage.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert isinstance(read_pulses_table.start_time.data, RunArray)
+        assert isinstance(read_pulses_table.id.data, RunArray)
+        assert len(read_pulses_table) == 10000
+        df = read_pulses_table.to_dataframe()
+        np.testing.assert_array_equal(df.index, expected.index)
+        for column in ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm"):
+            np.testing.assert_array_equal(df[column], expected[column])
+        assert read_pulses_table[9999, "optogenetic_sites"].index.tolist() == [0]
+        np.testing.assert_array_equal(read_pulses_table.query_time(2.0, 2.0015), [500, 501])
+        assert read_pulses_table.validate().valid
+
+        # the datasets of the encoded columns hold the full values only with the fallback
+        dataset = io._file["intervals/optogenetic_pulses/start_time"]
+        assert dataset.shape == (10000,)
+        if fallback:
+            np.testing.assert_array_equal(dataset[:], expected["start_time"])
+        else:
+            assert dataset.id.get_storage_size() == 0
+            assert np.isnan(dataset[0])
+            # constant columns hold their value as the fill value
+            np.testing.assert_array_equal(io._file["intervals/optogenetic_pulses/wavelength_in_nm"][:3], 473.0)
+
+
+def test_configure_compact_storage_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr")
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    expected = _add_pulse_trains(pulses_table, 10, 100)
+    configure_compact_storage(pulses_table, backend="zarr", fallback=False)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_compact_storage.nwb.zarr"
+    with hdmf_zarr.NWBZarrIO(str(path), mode="w") as io:
+        io.write(nwbfile)
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert isinstance(read_pulses_table.stop_time.data, RunArray)
+        np.testing.assert_array_equal(read_pulses_table.stop_time.data[:], expected["stop_time"])
+
+
+def test_configure_compact_storage_irregular_start_times(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    start_time = np.sort(np.random.default_rng(0).random(1000)) * 100
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + 0.01,
+        power_in_mW=np.full(1000, 5.0),
+        wavelength_in_nm=np.full(1000, 473.0),
+        optogenetic_sites=np.zeros(1000, dtype=int),
+    )
+    # the stop times are encoded as durations, which are constant, and the start times are not encoded
+    assert configure_compact_storage(pulses_table, fallback=False)[:3] == ["id", "stop_time", "power_in_mW"]
+    assert not isinstance(pulses_table.start_time.data, H5DataIO)
+    with pytest.raises(ValueError, match="already has compact columns"):
+        configure_compact_storage(pulses_table)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_compact_storage.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert not isinstance(read_pulses_table.start_time.data, RunArray)
+        np.testing.assert_array_equal(read_pulses_table.stop_time.data[:], start_time + 0.01)
+        np.testing.assert_array_equal(read_pulses_table.stop_time.data[[900, 5, 10]], start_time[[900, 5, 10]] + 0.01)
+
+
+def test_encode_runs():
+    # runs of constant values, of evenly spaced values, and of values that are not evenly spaced
+    values = np.concatenate((np.full(5, 2.0), 10.0 + np.arange(6) * 0.1, [1.0, 5.0, 2.0], [np.nan, np.nan]))
+    first, step, end = _encode_runs(values, max_runs=len(values))
+    assert end.tolist() == [5, 11, 13, 14, 16]
+    array = RunArray(first, step, end, values.dtype)
+    np.testing.assert_array_equal(array[:], values)
+    np.testing.assert_array_equal(array[3:12:2], values[3:12:2])
+    np.testing.assert_array_equal(array[[15, 0, -5]], values[[15, 0, -5]])
+    np.testing.assert_array_equal(array[values > 3], values[values > 3])
+    assert array[7] == values[7]
+    with pytest.raises(IndexError):
+        array[16]
+    assert _encode_runs(values, max_runs=2) is None
+
+    ids = np.arange(10**6)
+    first, step, end = _encode_runs(ids, max_runs=1)
+    assert (first.tolist(), step.tolist(), end.tolist()) == ([0], [1], [10**6])
+
+
+def test_memmap_columns(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_memmap_columns.nwb"
+    # recent versions of hdmf write the columns in chunks by default
+    expandable = {"expandable": []} if any(arg["name"] == "expandable" for arg in get_docval(HDF5IO.write)) else {}
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile, **expandable)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        columns = memmap_columns(read_pulses_table)
+        assert list(columns) == [
+            "start_time",
+            "stop_time",
+            "power_in_mW",
+            "wavelength_in_nm",
+            "optogenetic_sites_index",
+        ]
+        assert all(isinstance(values, np.memmap) and not values.flags.writeable for values in columns.values())
+        np.testing.assert_array_equal(columns["start_time"], np.arange(1000) * 0.05)
+        np.testing.assert_array_equal(columns["optogenetic_sites_index"], np.arange(1, 1001))
+        sites = memmap_columns(read_pulses_table, columns=["optogenetic_sites"])["optogenetic_sites"]
+        np.testing.assert_array_equal(sites, np.arange(1000) % 2)
+        with pytest.raises(ValueError, match="has no column 'tags'"):
+            memmap_columns(read_pulses_table, columns=["tags"])
+    with NWBHDF5IO(path, mode="a") as io:
+        with pytest.raises(ValueError, match="not opened read-only"):
+            memmap_columns(io.read().intervals["optogenetic_pulses"])
+
+
+def test_memmap_columns_chunked(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    configure_io(pulses_table)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_memmap_columns.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        with pytest.raises(ValueError, match="not stored contiguously"):
+            memmap_columns(io.read().intervals["optogenetic_pulses"])
+    with pytest.raises(ValueError, match="only datasets read with NWBHDF5IO"):
+        memmap_columns(pulses_table)
+
+
+def test_append_rows(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    nwbfile.add_time_intervals(pulses_table)
+    nwbfile.add_time_intervals(_make_epochs_table(sites_table))
+
+    path = tmp_path / "test_append_rows.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="a") as io:
+        read_nwbfile = io.read()
+        read_pulses_table = read_nwbfile.intervals["optogenetic_pulses"]
+        read_pulses_table.append_rows(
+            io,
+            start_time=[100.0, 101.0],
+            stop_time=[100.01, 101.01],
+            power_in_mW=[10.0, 20.0],
+            wavelength_in_nm=[473.0, 473.0],
+            optogenetic_sites=[0, 0, 1],
+            optogenetic_sites_index=[1, 3],
+        )
+        assert len(read_pulses_table) == 1002
+        epochs_table = read_nwbfile.intervals["optogenetic_epochs"]
+        epochs = {name: epochs_table[name].data[-1:] for name in epochs_table.colnames if name != "optogenetic_sites"}
+        epochs_table.append_rows(io, **epochs, optogenetic_sites=[[0, 1]])
+        with pytest.raises(ValueError, match="column 'stop_time' missing"):
+            read_pulses_table.append_rows(
+                io, start_time=[1.0], power_in_mW=[1.0], wavelength_in_nm=[1.0], optogenetic_sites=[0]
+            )
+        with pytest.raises(ValueError, match="references rows \\[7\\]"):
+            read_pulses_table.append_rows(
+                io, start_time=[1.0], stop_time=[1.1], power_in_mW=[1.0], wavelength_in_nm=[1.0], optogenetic_sites=[7]
+            )
+    with NWBHDF5IO(path, mode="r") as io:
+        read_nwbfile = io.read()
+        read_pulses_table = read_nwbfile.intervals["optogenetic_pulses"]
+        np.testing.assert_array_equal(read_pulses_table.id.data[-3:], [999, 1000, 1001])
+        np.testing.assert_array_equal(read_pulses_table.power_in_mW.data[-3:], [5.0, 10.0, 20.0])
+        assert read_pulses_table[1001, "optogenetic_sites"].index.tolist() == [0, 1]
+        epochs_table = read_nwbfile.intervals["optogenetic_epochs"]
+        assert len(epochs_table) == 4
+        assert (
+            epochs_table[3, "optogenetic_sites"].index.tolist() == epochs_table[2, "optogenetic_sites"].index.tolist()
+        )
+        with pytest.raises(ValueError, match="mode 'a' or 'r\\+'"):
+            read_pulses_table.append_rows(
+                io, start_time=[1.0], stop_time=[1.1], power_in_mW=[1.0], wavelength_in_nm=[1.0], optogenetic_sites=[0]
+            )
+
+
+def test_append_rows_fixed_size(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulse_trains(pulses_table, 2, 100)
+    configure_compact_storage(pulses_table)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_append_rows.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile, expandable=[])
+    pulses = dict(
+        start_time=[100.0], stop_time=[100.1], power_in_mW=[1.0], wavelength_in_nm=[1.0], optogenetic_sites=[0]
+    )
+    with NWBHDF5IO(path, mode="a") as io:
+        with pytest.raises(ValueError, match="compact columns"):
+            io.read().intervals["optogenetic_pulses"].append_rows(io, **pulses)
+
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 10)
+    nwbfile.add_time_intervals(pulses_table)
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile, expandable=[])
+    with NWBHDF5IO(path, mode="a") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        with pytest.raises(ValueError, match="dataset of fixed size"):
+            read_pulses_table.append_rows(io, **pulses)
+        assert len(read_pulses_table) == 10
+
+
+def test_append_rows_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr")
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 100)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_append_rows.nwb.zarr"
+    with hdmf_zarr.NWBZarrIO(str(path), mode="w") as io:
+        io.write(nwbfile)
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r+") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        read_pulses_table.append_rows(
+            io, start_time=[10.0], stop_time=[10.1], power_in_mW=[1.0], wavelength_in_nm=[1.0], optogenetic_sites=[1]
+        )
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert len(read_pulses_table) == 101
+        np.testing.assert_array_equal(read_pulses_table.start_time.data[-2:], [4.95, 10.0])
+        np.testing.assert_array_equal(read_pulses_table.optogenetic_sites_index.data[-2:], [100, 101])
+
+
+def test_read_time_window_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr")
+    import zarr
+
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    configure_io(pulses_table, backend="zarr", target_chunk_bytes=800)
+    nwbfile.add_time_intervals(pulses_table)
+    nwbfile.add_time_intervals(_make_epochs_table(sites_table))
+
+    path = tmp_path / "test_read_time_window.nwb.zarr"
+    with hdmf_zarr.NWBZarrIO(str(path), mode="w") as io:
+        io.write(nwbfile)
+
+    class LoggingStore(zarr.storage.DirectoryStore):
+        def __getitem__(self, key):
+            keys.append(key)
+            return super().__getitem__(key)
+
+    keys = []
+    tables = open_zarr_tables(LoggingStore(str(path)))
+    assert sorted(tables) == ["optogenetic_epochs", "optogenetic_pulses"]
+    assert keys == [".zmetadata"]
+
+    keys.clear()
+    rows = read_time_window(tables["optogenetic_pulses"], 10.0, 12.0, num_threads=4)
+    np.testing.assert_array_equal(rows["id"], np.arange(200, 240))
+    np.testing.assert_allclose(rows["start_time"], np.arange(200, 240) * 0.05)
+    np.testing.assert_array_equal(rows["optogenetic_sites"], np.arange(200, 240) % 2)
+    np.testing.assert_array_equal(rows["optogenetic_sites_index"], np.arange(1, 41))
+    # rows 200 to 239 are in chunk 2 of each column of 100 rows per chunk
+    assert {key.split("/")[-1] for key in keys if "start_time" not in key} <= {"0", "2"}
+    assert "intervals/optogenetic_pulses/stop_time/2" in keys and len(keys) < 20
+
+    epochs = read_time_window(tables["optogenetic_epochs"], 5.0, 15.0, columns=["stop_time", "optogenetic_sites"])
+    assert sorted(epochs) == ["id", "optogenetic_sites", "optogenetic_sites_index", "stop_time"]
+    np.testing.assert_array_equal(epochs["optogenetic_sites"], [0, 0, 1])
+    np.testing.assert_array_equal(epochs["optogenetic_sites_index"], [1, 3])
+
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        for t0, t1 in [(10.0, 12.0), (-1.0, 0.0), (49.9, 100.0), (0.0, 100.0)]:
+            rows = read_time_window(read_pulses_table, t0, t1)
+            expected = np.flatnonzero((np.arange(1000) * 0.05 >= t0) & (np.arange(1000) * 0.05 < t1))
+            np.testing.assert_array_equal(rows["id"], expected)
+        with pytest.raises(ValueError, match="no column 'tags'"):
+            read_time_window(read_pulses_table, 0.0, 1.0, columns=["tags"])
+
+
+def test_read_time_window_hdf5(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    rows = read_time_window(pulses_table, 1.0, 1.2, num_threads=1)
+    np.testing.assert_array_equal(rows["id"], [20, 21, 22, 23])
+    configure_io(pulses_table, target_chunk_bytes=800)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_read_time_window.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        rows = read_time_window(io.read().intervals["optogenetic_pulses"], 1.0, 1.2)
+        np.testing.assert_array_equal(rows["id"], [20, 21, 22, 23])
+        np.testing.assert_array_equal(rows["optogenetic_sites"], [0, 1, 0, 1])
+        table = OptogeneticPulsesTable(name="optogenetic_pulses", description="copy")
+        table.add_pulses(**{name: values for name, values in rows.items() if name != "id"})
+        assert len(table) == 4
+
+
+@pytest.mark.parametrize("fallback", [True, False])
+def test_configure_dictionary_storage(tmp_path, fallback):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    power = np.tile([1.0, 2.5, -0.0, 0.0], 250)
+    pulses_table.power_in_mW.transform(lambda _: power)
+    assert configure_dictionary_storage(pulses_table, fallback=fallback) == ["power_in_mW", "wavelength_in_nm"]
+    epochs_table = _make_epochs_table(sites_table)
+    assert configure_dictionary_storage(epochs_table, max_values=2) == ["wavelength_in_nm"]
+    with pytest.raises(ValueError, match="already has dictionary columns"):
+        configure_dictionary_storage(epochs_table)
+    nwbfile.add_time_intervals(pulses_table)
+    nwbfile.add_time_intervals(epochs_table)
+
+    path = tmp_path / "test_configure_dictionary_storage.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_nwbfile = io.read()
+        read_pulses_table = read_nwbfile.intervals["optogenetic_pulses"]
+        assert read_pulses_table.dictionary_codes.dtype == np.uint8
+        power_in_mW = read_pulses_table.power_in_mW.data
+        assert isinstance(power_in_mW, CodedArray)
+        # the encoding is lossless, also for the sign of zero
+        np.testing.assert_array_equal(np.signbit(power_in_mW[:]), np.signbit(power))
+        np.testing.assert_array_equal(power_in_mW.values[power_in_mW.codes], power)
+        np.testing.assert_array_equal(power_in_mW[[7, 2, 999]], power[[7, 2, 999]])
+        assert read_pulses_table[9, "power_in_mW"] == 2.5
+        np.testing.assert_array_equal(read_pulses_table.wavelength_in_nm.data.codes, np.zeros(1000))
+        assert len(power_in_mW) == 1000
+        read_epochs_table = read_nwbfile.intervals["optogenetic_epochs"]
+        assert not isinstance(read_epochs_table.power_in_mW.data, CodedArray)
+        np.testing.assert_array_equal(read_epochs_table.wavelength_in_nm.data[:], [488.0, np.nan, 488.0])
+        np.testing.assert_array_equal(read_epochs_table.wavelength_in_nm.data.codes, [0, 1, 0])
+
+
+def test_configure_dictionary_storage_wide_codes(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    power = np.arange(1000) % 300 / 10.0
+    pulses_table.power_in_mW.transform(lambda _: power)
+    assert configure_dictionary_storage(pulses_table, max_values=1000) == ["power_in_mW", "wavelength_in_nm"]
+    assert pulses_table.dictionary_codes.dtype == np.uint16
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_dictionary_storage_wide_codes.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert read_pulses_table.dictionary_codes.dtype == np.uint16
+        np.testing.assert_array_equal(read_pulses_table.power_in_mW.data[:], power)
+
+
+def test_configure_dictionary_storage_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr")
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulse_trains(pulses_table, 20, 10)
+    assert configure_dictionary_storage(pulses_table, backend="zarr", fallback=False, max_values=1) == [
+        "wavelength_in_nm"
+    ]
+    # the wavelength is already stored as codes, so the power and the other columns are stored as runs
+    encoded = configure_compact_storage(pulses_table, backend="zarr")
+    assert "power_in_mW" in encoded and "wavelength_in_nm" not in encoded
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_dictionary_storage.nwb.zarr"
+    with hdmf_zarr.NWBZarrIO(str(path), mode="w") as io:
+        io.write(nwbfile)
+    with hdmf_zarr.NWBZarrIO(str(path), mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert isinstance(read_pulses_table.power_in_mW.data, RunArray)
+        assert isinstance(read_pulses_table.wavelength_in_nm.data, CodedArray)
+        np.testing.assert_array_equal(read_pulses_table.wavelength_in_nm.data[:], np.full(200, 473.0))
+
+
+@pytest.mark.parametrize("fallback", [False, True])
+def test_configure_tick_storage(tmp_path, fallback):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    rng = np.random.default_rng(0)
+    start_time = np.sort(100.0 + rng.uniform(0, 50, 1000))
+    stop_time = start_time + rng.choice([0.005, 0.01], 1000)
+    pulses_table.start_time.transform(lambda _: start_time)
+    pulses_table.stop_time.transform(lambda _: stop_time)
+    timebase = 1e-6
+    errors = configure_tick_storage(pulses_table, timebase=timebase, fallback=fallback, block_length=100)
+    assert set(errors) == {"start_time", "stop_time"}
+    assert max(errors.values()) <= timebase / 2 * (1 + 1e-6)
+    with pytest.raises(ValueError, match="already has tick-encoded times"):
+        configure_tick_storage(pulses_table, timebase=timebase)
+    nwbfile.add_time_intervals(pulses_table)
+
+    path = tmp_path / "test_configure_tick_storage.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert read_pulses_table.start_time_tick_deltas.dtype == np.uint32
+        assert read_pulses_table.duration_tick_codes.dtype == np.uint8
+        read_start_time = read_pulses_table.start_time.data
+        assert isinstance(read_start_time, TickArray)
+        np.testing.assert_allclose(read_start_time[:], start_time, rtol=0, atol=errors["start_time"] * (1 + 1e-9))
+        np.testing.assert_allclose(read_pulses_table.stop_time.data[:], stop_time, rtol=0, atol=timebase)
+        # slices and rows across blocks are decoded without reading the whole column
+        np.testing.assert_array_equal(read_start_time[250:420], read_start_time[:][250:420])
+        np.testing.assert_array_equal(read_start_time[[999, 0, 555]], read_start_time[:][[999, 0, 555]])
+        assert read_pulses_table[999, "stop_time"] == read_pulses_table.stop_time.data[-1]
+        assert np.isnan(read_start_time.deltas.parent["start_time"][0]) != fallback
+
+
+def test_configure_tick_storage_exact_and_unsorted():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 100)
+    # times that are multiples of the timebase are encoded within the rounding error of float64
+    errors = configure_tick_storage(pulses_table, timebase=1e-3, max_durations=1)
+    assert set(errors) == {"start_time", "stop_time"} and max(errors.values()) < 1e-12
+    assert pulses_table.start_time_tick_deltas.dtype == np.uint8
+
+    # more than 256 distinct durations are coded in two bytes
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 1000)
+    pulses_table.stop_time.transform(lambda data: np.asarray(pulses_table.start_time.data) + np.arange(1000) * 1e-5)
+    errors = configure_tick_storage(pulses_table, timebase=1e-6, max_durations=1000)
+    assert "stop_time" in errors and pulses_table.duration_tick_codes.dtype == np.uint16
+
+    pulses_table = _make_pulses_table(sites_table)
+    _add_pulses(pulses_table, 100)
+    pulses_table.start_time.transform(lambda data: np.asarray(data)[::-1])
+    with pytest.raises(ValueError, match="sorted"):
+        configure_tick_storage(pulses_table, timebase=1e-3)
+    with pytest.raises(ValueError, match="timebase must be positive"):
+        configure_tick_storage(pulses_table, timebase=0.0)
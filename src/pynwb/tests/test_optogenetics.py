@@ -0,0 +1,668 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from pynwb import NWBFile, NWBHDF5IO
+from ndx_ophys_devices import Effector, ExcitationSource, ExcitationSourceModel
+
+from ndx_optogenetics import (
+    OptogeneticSitesTable,
+    OptogeneticEffectors,
+    OptogeneticExperimentMetadata,
+    OptogeneticEpochsTable,
+    OptogeneticPulsesTable,
+)
+
+
+def _make_nwbfile(num_sites=2):
+    """Create an NWBFile with an OptogeneticSitesTable with `num_sites` rows."""
+    nwbfile = NWBFile(
+        session_description="session_description",
+        identifier="identifier",
+        session_start_time=datetime.now(timezone.utc),
+    )
+    excitation_source_model = ExcitationSourceModel(
+        name="laser model",
+        manufacturer="Omicron",
+        source_type="laser",
+        excitation_mode="one-photon",
+        wavelength_range_in_nm=[488.0, 488.0],
+    )
+    excitation_source = ExcitationSource(name="laser", model=excitation_source_model)
+    nwbfile.add_device_model(excitation_source_model)
+    nwbfile.add_device(excitation_source)
+
+    effectors = [Effector(name="effector%d" % i, label="hChR2-EYFP") for i in range(num_sites)]
+    sites_table = OptogeneticSitesTable(description="Information about the optogenetic stimulation sites.")
+    for effector in effectors:
+        sites_table.add_row(excitation_source=excitation_source, effector=effector)
+    nwbfile.add_lab_meta_data(
+        OptogeneticExperimentMetadata(
+            optogenetic_sites_table=sites_table,
+            optogenetic_effectors=OptogeneticEffectors(effectors=effectors),
+            stimulation_software="FSGUI 2.0",
+        )
+    )
+    return nwbfile, sites_table
+
+
+def _make_pulses_table(sites_table):
+    return OptogeneticPulsesTable(
+        name="optogenetic_pulses",
+        description="Metadata about optogenetic stimulation per pulse",
+        target_tables={"optogenetic_sites": sites_table},
+    )
+
+
+def _make_epochs_table(sites_table):
+    """Create an OptogeneticEpochsTable with two stimulation epochs around a control epoch."""
+    epochs_table = OptogeneticEpochsTable(
+        name="optogenetic_epochs",
+        description="Metadata about optogenetic stimulation parameters per epoch",
+        target_tables={"optogenetic_sites": sites_table},
+    )
+    stimulation = dict(
+        stimulation_on=True,
+        pulse_length_in_ms=10.0,
+        period_in_ms=100.0,
+        number_pulses_per_pulse_train=3,
+        number_trains=2,
+        intertrain_interval_in_ms=1000.0,
+        wavelength_in_nm=488.0,
+    )
+    epochs_table.add_row(start_time=0.0, stop_time=5.0, power_in_mW=77.0, optogenetic_sites=[0], **stimulation)
+    epochs_table.add_row(
+        start_time=5.0,
+        stop_time=10.0,
+        stimulation_on=False,
+        pulse_length_in_ms=np.nan,
+        period_in_ms=np.nan,
+        number_pulses_per_pulse_train=-1,
+        number_trains=-1,
+        intertrain_interval_in_ms=np.nan,
+        power_in_mW=np.nan,
+        wavelength_in_nm=np.nan,
+        optogenetic_sites=[0],
+    )
+    epochs_table.add_row(start_time=10.0, stop_time=15.0, power_in_mW=50.0, optogenetic_sites=[0, 1], **stimulation)
+    return epochs_table
+
+
+def test_add_pulses(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    pulses_table.add_row(
+        start_time=0.0, stop_time=0.04, power_in_mW=77.0, wavelength_in_nm=488.0, optogenetic_sites=[0]
+    )
+    start_time = np.arange(1, 1001) * 0.25
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + 0.04,
+        power_in_mW=np.full(1000, 50.0),
+        wavelength_in_nm=np.full(1000, 473.0),
+        optogenetic_sites=np.tile([0, 1], 1000),
+        optogenetic_sites_index=np.arange(1, 1001) * 2,
+    )
+    nwbfile.add_time_intervals(pulses_table)
+    assert len(pulses_table) == 1001
+    np.testing.assert_array_equal(pulses_table.id.data, np.arange(1001))
+
+    path = tmp_path / "test_add_pulses.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert len(read_pulses_table) == 1001
+        np.testing.assert_array_equal(read_pulses_table.start_time.data[1:], start_time)
+        np.testing.assert_array_equal(read_pulses_table.power_in_mW.data[:2], [77.0, 50.0])
+        assert read_pulses_table.optogenetic_sites_index.data[-1] == 2001
+        assert read_pulses_table[0, "optogenetic_sites"].index.tolist() == [0]
+        assert read_pulses_table[1000, "optogenetic_sites"].index.tolist() == [0, 1]
+
+
+def test_add_pulses_one_site_per_pulse():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    pulses_table.add_pulses(
+        start_time=[0.0, 1.0],
+        stop_time=[0.5, 1.5],
+        power_in_mW=[1.0, 2.0],
+        wavelength_in_nm=[488.0, 488.0],
+        optogenetic_sites=[1, 0],
+    )
+    np.testing.assert_array_equal(pulses_table.optogenetic_sites_index.data, [1, 2])
+    np.testing.assert_array_equal(pulses_table.optogenetic_sites.data, [1, 0])
+
+
+def test_add_pulses_mismatched_lengths():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    with pytest.raises(ValueError, match="same number of rows"):
+        pulses_table.add_pulses(
+            start_time=[0.0, 1.0],
+            stop_time=[0.5],
+            power_in_mW=[1.0, 2.0],
+            wavelength_in_nm=[488.0, 488.0],
+            optogenetic_sites=[0, 0],
+        )
+
+
+def test_add_pulses_invalid_sites():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    for sites in ([0, 2], [-1, 0]):
+        with pytest.raises(ValueError, match="references rows"):
+            pulses_table.add_pulses(
+                start_time=[0.0, 1.0],
+                stop_time=[0.5, 1.5],
+                power_in_mW=[1.0, 2.0],
+                wavelength_in_nm=[488.0, 488.0],
+                optogenetic_sites=sites,
+            )
+    assert len(pulses_table) == 0 and len(pulses_table.id) == 0
+
+
+def test_to_pulses_table():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    pulses_table = epochs_table.to_pulses_table()
+    assert pulses_table.optogenetic_sites.table is sites_table
+    train_start_time = np.array([0.0, 0.1, 0.2, 1.0, 1.1, 1.2])
+    expected_start_time = np.concatenate((train_start_time, train_start_time + 10.0))
+    np.testing.assert_allclose(pulses_table.start_time.data, expected_start_time)
+    np.testing.assert_allclose(pulses_table.stop_time.data, expected_start_time + 0.01)
+    np.testing.assert_array_equal(pulses_table.power_in_mW.data, [77.0] * 6 + [50.0] * 6)
+    assert pulses_table[0, "optogenetic_sites"].index.tolist() == [0]
+    assert pulses_table[11, "optogenetic_sites"].index.tolist() == [0, 1]
+    # chunks of 5 pulses split the trains and epochs
+    chunked = epochs_table.to_pulses_table(chunk_size=5)
+    for column in ("start_time", "stop_time", "power_in_mW", "wavelength_in_nm", "optogenetic_sites"):
+        np.testing.assert_array_equal(chunked[column].data, pulses_table[column].data)
+    np.testing.assert_array_equal(chunked.optogenetic_sites.data, pulses_table.optogenetic_sites.data)
+    with pytest.raises(ValueError, match="chunk_size"):
+        epochs_table.to_pulses_table(chunk_size=0)
+
+
+def test_from_pulses():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    fitted, deviating = OptogeneticEpochsTable.from_pulses(epochs_table.to_pulses_table())
+    assert len(deviating) == 0
+    expected = epochs_table.to_dataframe().iloc[[0, 2]]
+    df = fitted.to_dataframe()
+    for column in ("start_time", "pulse_length_in_ms", "period_in_ms", "intertrain_interval_in_ms", "power_in_mW"):
+        np.testing.assert_allclose(df[column], expected[column])
+    np.testing.assert_array_equal(df["number_pulses_per_pulse_train"], [3, 3])
+    np.testing.assert_array_equal(df["number_trains"], [2, 2])
+    np.testing.assert_allclose(df["stop_time"], [1.21, 11.21])
+    assert [sites.index.tolist() for sites in df["optogenetic_sites"]] == [[0], [0, 1]]
+    assert fitted.validate().valid
+
+
+def test_from_pulses_sites_conditions_and_deviations():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    # 10 pulses at site 0 whose power changes after 5 pulses, then 10 interleaved pulses at site 1
+    start_time = np.concatenate((np.arange(10) * 0.02, 0.01 + np.arange(10) * 0.02))
+    start_time[13] += 0.001
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + np.repeat([0.005, 0.002], 10),
+        power_in_mW=np.repeat([5.0, 10.0, 5.0], [5, 5, 10]),
+        wavelength_in_nm=np.full(20, 473.0),
+        optogenetic_sites=np.repeat([0, 1], 10),
+    )
+    fitted, deviating = OptogeneticEpochsTable.from_pulses(pulses_table)
+    np.testing.assert_array_equal(deviating, [13])
+    df = fitted.to_dataframe()
+    np.testing.assert_allclose(df["start_time"], [0.0, 0.01, 0.1])
+    np.testing.assert_allclose(df["power_in_mW"], [5.0, 5.0, 10.0])
+    np.testing.assert_allclose(df["pulse_length_in_ms"], [5.0, 2.0, 5.0])
+    np.testing.assert_allclose(df["period_in_ms"], [20.0, 20.0, 20.0])
+    np.testing.assert_array_equal(df["number_pulses_per_pulse_train"], [5, 10, 5])
+    assert [sites.index.tolist() for sites in df["optogenetic_sites"]] == [[0], [1], [0]]
+
+    # with a max_gap shorter than the period, each pulse is a train, and evenly spaced trains form one train
+    fitted, _ = OptogeneticEpochsTable.from_pulses(pulses_table, max_gap=0.01, tolerance=0.002)
+    np.testing.assert_array_equal(fitted.number_pulses_per_pulse_train.data, [5, 10, 5])
+    np.testing.assert_array_equal(fitted.number_trains.data, [1, 1, 1])
+    empty, deviating = OptogeneticEpochsTable.from_pulses(_make_pulses_table(sites_table))
+    assert len(empty) == 0 and len(deviating) == 0
+
+
+def test_iter_pulses_chunks():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    chunks = list(epochs_table.iter_pulses(chunk_size=5))
+    assert [len(chunk["start_time"]) for chunk in chunks] == [5, 5, 2]
+    np.testing.assert_array_equal(np.concatenate([chunk["epoch"] for chunk in chunks]), [0] * 6 + [2] * 6)
+    expected = epochs_table.to_pulses_table()
+    np.testing.assert_array_equal(np.concatenate([chunk["start_time"] for chunk in chunks]), expected.start_time.data)
+    np.testing.assert_array_equal(chunks[1]["optogenetic_sites_index"], [1, 3, 5, 7, 9])
+
+
+def test_pulses_view():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    expected = epochs_table.to_pulses_table()
+    view = epochs_table.pulses_view()
+    assert len(view) == 12
+    np.testing.assert_array_equal(view["start_time"], expected.start_time.data)
+    assert view[-1, "start_time"] == expected.start_time.data[-1]
+    assert view[7, "optogenetic_sites"].tolist() == [0, 1]
+
+    sub_view = view[2:9][1:3]
+    assert len(sub_view) == 2
+    np.testing.assert_array_equal(sub_view["stop_time"], expected.stop_time.data[3:5])
+    np.testing.assert_array_equal(view[[0, -1], "power_in_mW"], [77.0, 50.0])
+
+    df = view[4:8].to_dataframe()
+    assert df.index.tolist() == [4, 5, 6, 7]
+    np.testing.assert_array_equal(df["start_time"], expected.start_time.data[4:8])
+    assert view[3].index.tolist() == [3]
+    with pytest.raises(IndexError):
+        view[12]
+
+
+def test_pulses_view_materialize():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    pulses_table = epochs_table.pulses_view()[4:10].materialize(chunk_size=4)
+    assert type(pulses_table) is OptogeneticPulsesTable
+    assert pulses_table.optogenetic_sites.table is sites_table
+    np.testing.assert_array_equal(pulses_table.id.data, np.arange(4, 10))
+    np.testing.assert_allclose(pulses_table.start_time.data, [1.1, 1.2, 10.0, 10.1, 10.2, 11.0])
+    np.testing.assert_array_equal(pulses_table.optogenetic_sites_index.data, [1, 2, 4, 6, 8, 10])
+    # a view of selected pulses materializes the same pulses in chunks of any size
+    view = epochs_table.pulses_view()[[11, 0, 7, 3]]
+    for chunk_size in (1, 3, 100):
+        pulses_table = view.materialize(chunk_size=chunk_size)
+        np.testing.assert_array_equal(pulses_table.id.data, [11, 0, 7, 3])
+        np.testing.assert_allclose(pulses_table.start_time.data, view["start_time"])
+        np.testing.assert_array_equal(pulses_table.optogenetic_sites.data, [0, 1, 0, 0, 1, 0])
+        np.testing.assert_array_equal(pulses_table.optogenetic_sites_index.data, [2, 3, 5, 6])
+
+
+def test_query_time(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    nwbfile.add_time_intervals(epochs_table)
+    nwbfile.add_time_intervals(epochs_table.to_pulses_table())
+    assert epochs_table.query_time(4.0, 6.0).tolist() == [0, 1]
+
+    path = tmp_path / "test_query_time.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        pulses_table = io.read().intervals["optogenetic_pulses"]
+        assert pulses_table.query_time(0.05, 1.0).tolist() == [1, 2, 3]
+        assert pulses_table.query_time(0.2, 0.2).tolist() == [2]
+        assert pulses_table.query_time(20.0, 30.0).tolist() == []
+        assert pulses_table._interval_index() is pulses_table._interval_index()
+
+
+def test_is_stimulating():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    pulses_table = epochs_table.to_pulses_table()
+    times = [-1.0, 0.0, 0.005, 0.01, 0.5, 10.205, 100.0]
+    np.testing.assert_array_equal(pulses_table.is_stimulating(times), [False, True, True, False, False, True, False])
+    assert pulses_table.is_stimulating(1.1) is True
+    np.testing.assert_array_equal(epochs_table.is_stimulating([1.0, 7.0, 12.0]), [True, False, True])
+
+    # the cached index is rebuilt when rows are added
+    pulses_table.add_row(
+        start_time=50.0, stop_time=51.0, power_in_mW=1.0, wavelength_in_nm=488.0, optogenetic_sites=[0]
+    )
+    assert pulses_table.is_stimulating(50.5) is True
+    assert pulses_table.query_time(50.5, 60.0).tolist() == [12]
+
+
+def test_validate_epochs():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    report = epochs_table.validate()
+    assert report.valid and report
+    assert all(len(rows) == 0 for rows in report.values())
+
+    stimulation = dict(
+        stimulation_on=True,
+        number_pulses_per_pulse_train=3,
+        number_trains=2,
+        intertrain_interval_in_ms=1000.0,
+        power_in_mW=77.0,
+        wavelength_in_nm=488.0,
+    )
+    # overlaps the first epoch at site 0, and the period is shorter than the pulse length
+    epochs_table.add_row(
+        start_time=4.0, stop_time=5.0, pulse_length_in_ms=10.0, period_in_ms=5.0, optogenetic_sites=[0], **stimulation
+    )
+    # the trains overlap and the stimulation lasts longer than the epoch
+    epochs_table.add_row(
+        start_time=20.0,
+        stop_time=20.5,
+        pulse_length_in_ms=10.0,
+        period_in_ms=500.0,
+        optogenetic_sites=[1],
+        **stimulation,
+    )
+    # stimulation off with a power, and no sites
+    epochs_table.add_row(
+        start_time=30.0,
+        stop_time=30.0,
+        stimulation_on=False,
+        pulse_length_in_ms=np.nan,
+        period_in_ms=np.nan,
+        number_pulses_per_pulse_train=-1,
+        number_trains=-1,
+        intertrain_interval_in_ms=np.nan,
+        power_in_mW=1.0,
+        wavelength_in_nm=np.nan,
+        optogenetic_sites=[],
+    )
+    # stimulation on with a NaN power and no pulses
+    epochs_table.add_row(
+        start_time=40.0,
+        stop_time=50.0,
+        pulse_length_in_ms=10.0,
+        period_in_ms=100.0,
+        **dict(stimulation, power_in_mW=np.nan, number_trains=0),
+        optogenetic_sites=[1],
+    )
+
+    report = epochs_table.validate()
+    assert not report.valid
+    assert {check: rows.tolist() for check, rows in report.failed().items()} == {
+        "stop_not_after_start": [5],
+        "invalid_sites": [5],
+        "overlapping_at_site": [3],
+        "off_values_not_null": [5],
+        "on_values_invalid": [6],
+        "period_shorter_than_pulse_length": [3],
+        "intertrain_interval_shorter_than_train": [4],
+        "stimulation_exceeds_epoch": [3, 4],
+    }
+    assert "8 of 8 checks failed" in repr(report)
+
+    # the parameters of a control epoch may also be 0
+    control = dict(pulse_length_in_ms=0.0, period_in_ms=0.0, number_pulses_per_pulse_train=0, number_trains=0)
+    control.update(intertrain_interval_in_ms=0.0, power_in_mW=0.0, wavelength_in_nm=0.0)
+    epochs_table.add_row(start_time=60.0, stop_time=70.0, stimulation_on=False, optogenetic_sites=[0], **control)
+    assert epochs_table.validate()["off_values_not_null"].tolist() == [5]
+
+
+def test_validate_pulses():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    pulses_table = epochs_table.to_pulses_table()
+    assert pulses_table.validate(epochs_table=epochs_table).valid
+
+    pulses_table.add_pulses(
+        start_time=[7.0, 12.0, 12.005, 14.995, 20.0],
+        stop_time=[7.01, 12.01, 12.015, 15.0, 19.0],
+        power_in_mW=[77.0, -1.0, 50.0, 50.0, 50.0],
+        wavelength_in_nm=[488.0, 488.0, 488.0, 488.0, np.nan],
+        optogenetic_sites=[0, 1, 1, 0, 1, 1],
+        optogenetic_sites_index=[1, 2, 3, 5, 6],
+    )
+    # add_pulses rejects sites that are not in the sites table, but a table read from a file may have them
+    pulses_table.optogenetic_sites.data[-1] = 3
+    report = pulses_table.validate(epochs_table=epochs_table)
+    assert {check: rows.tolist() for check, rows in report.failed().items()} == {
+        "stop_not_after_start": [16],
+        "invalid_sites": [16],
+        "overlapping_at_site": [14],
+        "invalid_values": [13, 16],
+        "outside_stimulation_epochs": [12, 16],
+    }
+    # pulses are not checked against epochs without an epochs table
+    assert "outside_stimulation_epochs" not in pulses_table.validate()
+
+    # a pulse is contained only in epochs at one of its sites
+    pulses_table = _make_pulses_table(sites_table)
+    pulses_table.add_pulses(
+        start_time=[1.0, 2.0, 11.0, 12.0],
+        stop_time=[1.01, 2.01, 11.01, 12.01],
+        power_in_mW=[77.0] * 4,
+        wavelength_in_nm=[488.0] * 4,
+        optogenetic_sites=[1, 0, 1, 1, 1],
+        optogenetic_sites_index=[1, 3, 4, 5],
+    )
+    report = pulses_table.validate(epochs_table=epochs_table)
+    assert report["outside_stimulation_epochs"].tolist() == [0]
+
+
+def test_validate_many_pulses():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    start_time = np.arange(100_000) * 0.01
+    pulses_table.add_pulses(
+        start_time=start_time,
+        stop_time=start_time + 0.005,
+        power_in_mW=np.full(100_000, 10.0),
+        wavelength_in_nm=np.full(100_000, 488.0),
+        optogenetic_sites=np.tile([0, 1], 100_000),
+        optogenetic_sites_index=np.arange(1, 100_001) * 2,
+    )
+    assert pulses_table.validate().valid
+    pulses_table.stop_time.transform(lambda data: np.where(np.arange(len(data)) == 500, 5.5, data))
+    assert pulses_table.validate()["overlapping_at_site"].tolist() == list(range(501, 550))
+
+
+def test_summary():
+    _, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    summary = epochs_table.summary()
+    assert list(summary.columns) == [
+        "num_pulses",
+        "stimulation_time_in_s",
+        "duty_cycle",
+        "energy_in_mJ",
+        "frequency_in_Hz",
+    ]
+    np.testing.assert_array_equal(summary["num_pulses"], [6, 0, 6])
+    np.testing.assert_allclose(summary["stimulation_time_in_s"], [0.06, 0.0, 0.06])
+    np.testing.assert_allclose(summary["duty_cycle"], [0.012, 0.0, 0.012])
+    np.testing.assert_allclose(summary["energy_in_mJ"], [4.62, 0.0, 3.0])
+    np.testing.assert_allclose(summary["frequency_in_Hz"], [1.2, 0.0, 1.2])
+
+    pulses_table = epochs_table.to_pulses_table()
+    pd.testing.assert_frame_equal(epochs_table.summary(pulses_table=pulses_table), summary)
+
+    # the summary is recomputed when pulses are added
+    summary["num_pulses"] = 0
+    assert epochs_table.summary(pulses_table=pulses_table)["num_pulses"].tolist() == [6, 0, 6]
+    pulses_table.add_pulses(
+        start_time=[7.0, 20.0],
+        stop_time=[7.5, 20.5],
+        power_in_mW=[10.0, 10.0],
+        wavelength_in_nm=[488.0, 488.0],
+        optogenetic_sites=[0, 0],
+    )
+    summary = epochs_table.summary(pulses_table=pulses_table)
+    np.testing.assert_array_equal(summary["num_pulses"], [6, 1, 6])
+    np.testing.assert_allclose(summary["energy_in_mJ"], [4.62, 5.0, 3.0])
+    assert epochs_table.summary()["num_pulses"].tolist() == [6, 0, 6]
+
+    # pulses count only for the epochs that share one of their sites
+    pulses_table.add_pulses(
+        start_time=[2.0, 3.0, 12.0],
+        stop_time=[2.5, 3.5, 12.5],
+        power_in_mW=[10.0, 10.0, 10.0],
+        wavelength_in_nm=[488.0, 488.0, 488.0],
+        optogenetic_sites=[1, 0, 1, 1],
+        optogenetic_sites_index=[1, 3, 4],
+    )
+    summary = epochs_table.summary(pulses_table=pulses_table)
+    np.testing.assert_array_equal(summary["num_pulses"], [7, 1, 7])
+    np.testing.assert_allclose(summary["energy_in_mJ"], [9.62, 5.0, 8.0])
+
+
+def test_site_membership():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_pulses_table(sites_table)
+    pulses_table.add_pulses(
+        start_time=np.arange(4.0),
+        stop_time=np.arange(4.0) + 0.5,
+        power_in_mW=np.ones(4),
+        wavelength_in_nm=np.full(4, 473.0),
+        optogenetic_sites=[1, 0, 1, 1, 0, 0],
+        optogenetic_sites_index=[1, 3, 4, 6],
+    )
+    np.testing.assert_array_equal(pulses_table.rows_for_site(0), [1, 3])
+    np.testing.assert_array_equal(pulses_table.rows_for_site(1), [0, 1, 2])
+    np.testing.assert_array_equal(pulses_table.per_site_counts(), [2, 3])
+    with pytest.raises(IndexError, match="site 2 is out of range"):
+        pulses_table.rows_for_site(2)
+
+    # the index is rebuilt when rows are added
+    pulses_table.add_pulses(
+        start_time=[5.0], stop_time=[5.5], power_in_mW=[1.0], wavelength_in_nm=[473.0], optogenetic_sites=[0]
+    )
+    np.testing.assert_array_equal(pulses_table.rows_for_site(0), [1, 3, 4])
+
+    pytest.importorskip("scipy")
+    matrix = pulses_table.site_matrix()
+    assert matrix.shape == (5, 2)
+    np.testing.assert_array_equal(
+        matrix.toarray(), [[False, True], [True, True], [False, True], [True, False], [True, False]]
+    )
+    np.testing.assert_array_equal(matrix[:, [1]].nonzero()[0], pulses_table.rows_for_site(1))
+
+
+def test_to_stimulus_trace():
+    _, sites_table = _make_nwbfile()
+    pulses_table = _make_epochs_table(sites_table).to_pulses_table()
+    trace = pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0)
+    assert trace.shape == (12000,) and trace.dtype == np.float64
+    np.testing.assert_array_equal(
+        trace[[0, 9, 10, 100, 1209, 1210, 9999, 10000, 11209]], [77, 77, 0, 77, 77, 0, 0, 50, 50]
+    )
+    assert trace.sum() == 6 * 10 * 77.0 + 6 * 10 * 50.0
+
+    mask = pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0, value=None, site=1)
+    assert mask.dtype == bool
+    assert mask.sum() == 60 and mask[10000] and not mask[0]
+
+    # the trace starts at t_start and the values of overlapping pulses are added
+    pulses_table.add_row(
+        start_time=10.005, stop_time=10.02, power_in_mW=1.0, wavelength_in_nm=488.0, optogenetic_sites=[1]
+    )
+    trace = pulses_table.to_stimulus_trace(1000.0, 10.0, 10.1, site=1)
+    np.testing.assert_array_equal(trace[:21], [50] * 5 + [51] * 5 + [1] * 10 + [0])
+
+    chunks = list(pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0, value="wavelength_in_nm", chunk_size=5000))
+    assert [len(chunk) for chunk in chunks] == [5000, 5000, 2000]
+    np.testing.assert_array_equal(
+        np.concatenate(chunks), pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0, value="wavelength_in_nm")
+    )
+    with pytest.raises(ValueError, match="'tags' is not a column"):
+        pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0, value="tags")
+
+
+def test_to_stimulus_series(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    pulses_table = _make_epochs_table(sites_table).to_pulses_table()
+    series = pulses_table.to_stimulus_series("stimulus_power", 1000.0, 0.0, 12.0, buffer_gb=1e-5)
+    assert series.unit == "watts" and series.conversion == 1e-3
+    nwbfile.add_stimulus(series)
+    nwbfile.add_stimulus(pulses_table.to_stimulus_series("stimulus_on", 1000.0, 0.0, 12.0, value=None))
+
+    path = tmp_path / "test_to_stimulus_series.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_nwbfile = io.read()
+        read_series = read_nwbfile.stimulus["stimulus_power"]
+        assert read_series.rate == 1000.0 and read_series.starting_time == 0.0
+        np.testing.assert_array_equal(read_series.data[:], pulses_table.to_stimulus_trace(1000.0, 0.0, 12.0))
+        assert read_nwbfile.stimulus["stimulus_on"].data[:].sum() == 120
+
+
+def test_to_columnar_dataframe(tmp_path):
+    nwbfile, sites_table = _make_nwbfile()
+    epochs_table = _make_epochs_table(sites_table)
+    nwbfile.add_time_intervals(epochs_table)
+    nwbfile.add_time_intervals(epochs_table.to_pulses_table())
+
+    path = tmp_path / "test_to_columnar_dataframe.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_nwbfile = io.read()
+        df = read_nwbfile.intervals["optogenetic_pulses"].to_columnar_dataframe()
+        assert len(df) == 18  # 6 pulses at one site and 6 pulses at two sites
+        assert not any(dtype == np.dtype("O") for dtype in df.dtypes)
+        assert df["id"].tolist()[-4:] == [10, 10, 11, 11]
+        assert df["optogenetic_sites"].tolist()[-4:] == [0, 1, 0, 1]
+        assert df["effector"].tolist()[-4:] == ["effector0", "effector1", "effector0", "effector1"]
+        assert set(df["excitation_source"]) == {"laser"}
+        assert "optical_fiber" not in df.columns
+        expected = read_nwbfile.intervals["optogenetic_pulses"].to_dataframe()
+        np.testing.assert_array_equal(df.groupby("id")["start_time"].first(), expected["start_time"])
+
+        df = read_nwbfile.intervals["optogenetic_epochs"].to_columnar_dataframe(site_columns=["effector"])
+        assert df.columns.tolist() == [
+            "id",
+            "start_time",
+            "stop_time",
+            "stimulation_on",
+            "pulse_length_in_ms",
+            "period_in_ms",
+            "number_pulses_per_pulse_train",
+            "number_trains",
+            "intertrain_interval_in_ms",
+            "power_in_mW",
+            "wavelength_in_nm",
+            "optogenetic_sites",
+            "effector",
+        ]
+
+
+def test_to_columnar_dataframe_arrow():
+    pa = pytest.importorskip("pyarrow")
+    _, sites_table = _make_nwbfile()
+    table = _make_epochs_table(sites_table).to_pulses_table().to_columnar_dataframe(output="arrow")
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == 18
+    assert pa.types.is_dictionary(table.schema.field("effector").type)
+
+
+def test_resolve_column(tmp_path):
+    nwbfile, sites_table = _make_nwbfile(num_sites=3)
+    epochs_table = _make_epochs_table(sites_table)
+    nwbfile.add_time_intervals(epochs_table.to_pulses_table())
+
+    path = tmp_path / "test_resolve_column.nwb"
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    with NWBHDF5IO(path, mode="r") as io:
+        read_nwbfile = io.read()
+        read_sites_table = read_nwbfile.lab_meta_data["optogenetic_experiment_metadata"].optogenetic_sites_table
+        assert type(read_sites_table) is OptogeneticSitesTable
+        objects, codes = read_sites_table.resolve_column("excitation_source")
+        assert objects.tolist() == [read_nwbfile.devices["laser"]]
+        assert codes.tolist() == [0, 0, 0]
+        assert read_sites_table.resolve_column("excitation_source")[0] is objects  # cached
+
+        pulses_table = read_nwbfile.intervals["optogenetic_pulses"]
+        objects, codes, offsets = pulses_table.resolve_site_column("effector", rows=[0, 11])
+        assert [obj.name for obj in objects] == ["effector0", "effector1", "effector2"]
+        assert codes.tolist() == [0, 0, 1]
+        assert offsets.tolist() == [1, 3]
+
+
+def test_resolve_column_invalidated_on_add_row():
+    nwbfile, sites_table = _make_nwbfile(num_sites=1)
+    objects, codes = sites_table.resolve_column("effector")
+    assert len(objects) == 1
+    sites_table.add_row(
+        excitation_source=sites_table[0, "excitation_source"],
+        effector=Effector(name="new_effector", label="hChR2-EYFP"),
+    )
+    objects, codes = sites_table.resolve_column("effector")
+    assert [obj.name for obj in objects] == ["effector0", "new_effector"]
+    assert sites_table.resolve_column("excitation_source")[1].tolist() == [0, 0]
+    with pytest.raises(KeyError):
+        sites_table.resolve_column("optical_fiber")
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from ndx_optogenetics import OptogeneticPulsesTable
+from ndx_optogenetics.ttl import detect_pulses
+
+from .test_optogenetics import _make_nwbfile
+
+RATE = 30000.0
+
+
+def _write_ttl(path, pulses, duration, dtype=np.uint8, value=1):
+    """Write a TTL signal that is high during the given (start, duration) pulses to a binary file and map it."""
+    signal = np.memmap(path, dtype=dtype, mode="w+", shape=(int(duration * RATE),))
+    for start, length in pulses:
+        first = int(round(start * RATE))
+        signal[first : first + int(round(length * RATE))] = value
+    signal.flush()
+    return signal
+
+
+def _schedule():
+    # 3 trains of 5 10-ms pulses at 20 Hz every second, then 20 5-ms pulses at 10 Hz
+    trains = [(1.0 + train + pulse * 0.05, 0.01) for train in range(3) for pulse in range(5)]
+    return trains + [(10.0 + pulse * 0.1, 0.005) for pulse in range(20)]
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_detect_pulses(tmp_path, num_threads):
+    signal = _write_ttl(tmp_path / "ttl.bin", _schedule(), 15.0)
+    # pulses at the start and end of the signal
+    signal[:10] = 1
+    signal[-5:] = 1
+    signal = np.memmap(tmp_path / "ttl.bin", dtype=np.uint8, mode="r")
+    # chunks of 1000 samples split many pulses
+    start_time, stop_time = detect_pulses(signal, RATE, t_start=2.0, chunk_length=1000, num_threads=num_threads)
+    assert len(start_time) == 37
+    expected = np.array([start for start, _ in _schedule()])
+    np.testing.assert_allclose(start_time[1:-1], expected + 2.0, atol=0.5 / RATE)
+    np.testing.assert_allclose(stop_time - start_time, [10 / RATE] + [0.01] * 15 + [0.005] * 20 + [5 / RATE])
+    assert start_time[0] == 2.0 and stop_time[-1] == 17.0
+
+
+def test_detect_pulses_bit_and_threshold(tmp_path):
+    signal = _write_ttl(tmp_path / "ttl.bin", _schedule()[:5], 2.0, dtype=np.uint16, value=0b100)
+    signal[::7] |= 0b1
+    start_time, _ = detect_pulses(signal, RATE, bit=2, chunk_length=4096)
+    np.testing.assert_allclose(start_time, [1.0, 1.05, 1.1, 1.15, 1.2])
+    start_time, _ = detect_pulses(np.asarray(signal, dtype=np.float32), RATE, threshold=2.5)
+    assert len(start_time) == 5
+    with pytest.raises(ValueError, match="integer signal"):
+        detect_pulses(np.zeros(10), RATE, bit=0)
+    assert [len(times) for times in detect_pulses(np.zeros(0, dtype=bool), RATE)] == [0, 0]
+
+
+def test_from_ttl(tmp_path):
+    _, sites_table = _make_nwbfile()
+    signal = _write_ttl(tmp_path / "ttl.bin", _schedule(), 15.0)
+    pulses_table = OptogeneticPulsesTable.from_ttl(
+        signal, RATE, sites_table, sites=1, power_in_mW=5.0, wavelength_in_nm=473.0, chunk_length=4096
+    )
+    assert len(pulses_table) == 35
+    assert pulses_table[0, "optogenetic_sites"].index.tolist() == [1]
+
+    pulses_table, epochs_table = OptogeneticPulsesTable.from_ttl(
+        signal, RATE, sites_table, sites=[0, 1], power_in_mW=5.0, wavelength_in_nm=473.0, fit_epochs=True
+    )
+    assert epochs_table.validate().valid
+    df = epochs_table.to_dataframe()
+    np.testing.assert_allclose(df["start_time"], [1.0, 10.0])
+    np.testing.assert_allclose(df["pulse_length_in_ms"], [10.0, 5.0])
+    np.testing.assert_allclose(df["period_in_ms"], [50.0, 100.0])
+    np.testing.assert_array_equal(df["number_pulses_per_pulse_train"], [5, 20])
+    np.testing.assert_array_equal(df["number_trains"], [3, 1])
+    np.testing.assert_allclose(df["intertrain_interval_in_ms"], [1000.0, 0.0])
+    assert df["optogenetic_sites"][1].index.tolist() == [0, 1]
+    # the fitted epochs reproduce the pulses
+    expanded = epochs_table.to_pulses_table()
+    np.testing.assert_allclose(expanded.start_time.data, pulses_table.start_time.data, atol=2 / RATE)
+    np.testing.assert_allclose(expanded.stop_time.data, pulses_table.stop_time.data, atol=2 / RATE)
+
+
+def test_from_ttl_integer_arguments(tmp_path):
+    _, sites_table = _make_nwbfile()
+    signal = _write_ttl(tmp_path / "ttl.bin", _schedule(), 15.0)
+    start_time, _ = detect_pulses(signal, 30000, t_start=2, threshold=0)
+    np.testing.assert_allclose(start_time[:2], [3.0, 3.05])
+    pulses_table, epochs_table = OptogeneticPulsesTable.from_ttl(
+        signal, 30000, sites_table, sites=0, power_in_mW=5, wavelength_in_nm=473, fit_epochs=True, max_gap=1
+    )
+    assert len(pulses_table) == 35
+    assert pulses_table.power_in_mW.data.dtype == np.float64
+    np.testing.assert_array_equal(pulses_table.wavelength_in_nm.data, 473.0)
+    assert len(epochs_table) == 2
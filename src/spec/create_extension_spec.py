@@ -15,7 +15,7 @@ def main():
     # these arguments were auto-generated from your cookiecutter inputs
     ns_builder = NWBNamespaceBuilder(
         name="""ndx-optogenetics""",
-        version="""0.4.0""",
+        version="""0.5.0""",
         doc="""NWB extension to improve support for optogenetics data and metadata""",
         author=[
             "Ryan Ly",
@@ -167,6 +167,40 @@ def main():
         ],
     )
 
+    def dictionary_column_specs():
+        """Return the specs of the optional datasets of the dictionary encoding of the power and wavelength columns."""
+        return [
+            NWBDatasetSpec(
+                name="dictionary_values",
+                doc=(
+                    "Optional dictionary encoding of columns with few distinct values, e.g., the power and "
+                    "wavelength. Each row is one distinct value of an encoded column, given as (column, value), "
+                    "where column is the code of the column (0: power_in_mW, 1: wavelength_in_nm). The code of a "
+                    "value is its position among the rows of its column. Readers that support this dataset look up "
+                    "the values of the encoded columns from dictionary_codes. The datasets of the encoded columns "
+                    "have their full length but may be written only with their fill value to save space, in which "
+                    "case readers that do not support this dataset cannot read them."
+                ),
+                dtype="float64",
+                shape=[None, 2],
+                dims=["num_values", "column|value"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="dictionary_codes",
+                doc=(
+                    "Codes of the values of the dictionary-encoded columns, with one row per row of the table and "
+                    "one column per encoded column, in the order of the column codes in dictionary_values. The codes "
+                    "are written with the smallest unsigned integer type that holds them, e.g., uint16 for more than "
+                    "256 values of a column, so readers must accept any unsigned integer type."
+                ),
+                dtype="uint8",
+                shape=[None, None],
+                dims=["num_rows", "num_encoded_columns"],
+                quantity="?",
+            ),
+        ]
+
     optogenetic_epochs_table = NWBGroupSpec(
         neurodata_type_def="OptogeneticEpochsTable",
         neurodata_type_inc="TimeIntervals",
@@ -250,6 +284,7 @@ def main():
                 doc="References row(s) of OptogeneticSitesTable.",
                 neurodata_type_inc="DynamicTableRegion",
             ),
+            *dictionary_column_specs(),
         ],
     )
 
@@ -280,6 +315,86 @@ def main():
                 doc="References row(s) of OptogeneticSitesTable.",
                 neurodata_type_inc="DynamicTableRegion",
             ),
+            NWBDatasetSpec(
+                name="compact_columns",
+                doc=(
+                    "Optional compact encoding of columns whose values are runs of constant values or of evenly "
+                    "spaced values, e.g., the power or the start times of regular pulse trains. Each row is one run "
+                    "of values first + k * step for k = 0, 1, ..., given as (column, first, step, end), where column "
+                    "is the code of the column (0: id, 1: start_time, 2: stop_time, 3: power_in_mW, "
+                    "4: wavelength_in_nm, 5: optogenetic_sites, 6: optogenetic_sites_index) and end is the end "
+                    "offset of the run within the column. The runs of a column are sorted by end offset. The runs of "
+                    "stop_time encode the duration of each row, i.e., stop_time = start_time + duration. Readers "
+                    "that support this dataset reconstruct the values of the encoded columns from the runs. The "
+                    "datasets of the encoded columns have their full length but may be written only with their fill "
+                    "value to save space, in which case readers that do not support this dataset cannot read them."
+                ),
+                dtype="float64",
+                shape=[None, 4],
+                dims=["num_runs", "column|first|step|end"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="tick_encoding",
+                doc=(
+                    "Optional encoding of the start and stop times as integer ticks, given as (timebase, "
+                    "block_length), where timebase is the duration of one tick, in seconds. The start time of each "
+                    "row is start_time_ticks * timebase, where the start_time_ticks of the rows of each block of "
+                    "block_length rows are start_time_tick_anchors of the block plus the cumulative sum of "
+                    "start_time_tick_deltas within the block. The stop time of each row is (start_time_ticks + "
+                    "duration) * timebase, where duration is the value of duration_tick_values with the code "
+                    "duration_tick_codes of the row. Readers that support this dataset compute the start and stop "
+                    "times from the ticks. The start_time and stop_time datasets have their full length but may be "
+                    "written only with their fill value to save space, in which case readers that do not support "
+                    "this dataset cannot read them."
+                ),
+                dtype="float64",
+                shape=[2],
+                dims=["timebase|block_length"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="start_time_tick_deltas",
+                doc=(
+                    "Difference of the start time of each row to the start time of the previous row, in ticks, or 0 "
+                    "for the first row of each block. The differences are written with the smallest unsigned integer "
+                    "type that holds them, e.g., uint16 or uint32 for pulses that are more than 255 ticks apart, so "
+                    "readers must accept any unsigned integer type. See tick_encoding."
+                ),
+                dtype="uint8",
+                shape=[None],
+                dims=["num_rows"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="start_time_tick_anchors",
+                doc="Start time of the first row of each block, in ticks. See tick_encoding.",
+                dtype="int64",
+                shape=[None],
+                dims=["num_blocks"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="duration_tick_codes",
+                doc=(
+                    "Code of the duration of each row into duration_tick_values. The codes are written with the "
+                    "smallest unsigned integer type that holds them, e.g., uint16 for more than 256 durations, so "
+                    "readers must accept any unsigned integer type. See tick_encoding."
+                ),
+                dtype="uint8",
+                shape=[None],
+                dims=["num_rows"],
+                quantity="?",
+            ),
+            NWBDatasetSpec(
+                name="duration_tick_values",
+                doc="Distinct durations of the rows, in ticks. See tick_encoding.",
+                dtype="int64",
+                shape=[None],
+                dims=["num_durations"],
+                quantity="?",
+            ),
+            *dictionary_column_specs(),
         ],
     )
 